@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""ASGI server mode: the Flask routes behind an asyncio front end.
+
+The slow, network-bound endpoints (image generation, prompt generation and
+pushes to the TV) are served natively on the event loop, with httpx for
+Ideogram and image downloads and TV I/O running in worker threads. Every
+other route is handed to the existing Flask app through a WSGI bridge, so
+gallery, list and status requests keep being answered while generations
+and pushes are in flight.
+
+Requires: starlette, uvicorn, httpx, a2wsgi
+
+    python asgi_server.py --port 5000
+"""
+import argparse
+import contextlib
+import json
+import os
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+from config import Config
+from http_client import close_async_http_client
+from image_buffer import get_image_buffer
+from image_candidates import candidate_count
+from image_fetcher import fetch_image_data_async
+from generation_cache import generate_image_cached_async
+from job_queue import archive_folder_for_pushes, local_image_path
+from prompt_pool import get_prompt_pool
+from rate_limiter import RateLimitError
+from server import TRACE_HEADER, app as flask_app, logger, retry_after_header
+from telemetry import begin_span, end_span
+from tv_discovery import get_tv_discovery
+from tv_pusher import push_image_data_to_tv, push_image_to_tv
+
+DEFAULT_HOST = '0.0.0.0'
+DEFAULT_PORT = 5000
+DEFAULT_WORKERS = 1
+DEFAULT_WSGI_THREADS = 16
+
+wsgi_app = WSGIMiddleware(flask_app, workers=int(Config.get_env('ASGI_WSGI_THREADS', DEFAULT_WSGI_THREADS)))
+
+
+class ForwardToFlask:
+    """ASGI response that replays an already-read request body into the Flask app."""
+
+    def __init__(self, body):
+        self.body = body
+
+    async def __call__(self, scope, receive, send):
+        async def replay():
+            return {'type': 'http.request', 'body': self.body, 'more_body': False}
+        await wsgi_app(scope, replay, send)
+
+
+class TraceMiddleware:
+    """Opens the root span for each HTTP request and returns its trace id in a header."""
+
+    header = TRACE_HEADER.lower().encode('latin-1')
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope['headers']).get(self.header, b'').decode('latin-1') or None
+        current, token = begin_span('request', trace_id=incoming, method=scope['method'], route=scope['path'])
+        trace_header = (self.header, current.trace_id.encode('latin-1'))
+        # Routes forwarded to Flask continue the same trace
+        scope = dict(scope, headers=[h for h in scope['headers'] if h[0] != self.header] + [trace_header])
+
+        async def send_with_trace(message):
+            if message['type'] == 'http.response.start':
+                headers = [h for h in message.get('headers', []) if h[0].lower() != self.header]
+                message = dict(message, headers=headers + [trace_header])
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            end_span(current, token, error)
+
+
+async def read_json(request):
+    """Returns (parsed JSON or None, raw body)."""
+    body = await request.body()
+    try:
+        data = json.loads(body or b'null')
+    except ValueError:
+        data = None
+    return (data if isinstance(data, dict) else None), body
+
+
+def rate_limited(error):
+    logger.warning(f"Rate limited: {str(error)}")
+    return JSONResponse({'success': False, 'error': str(error), 'retryAfter': error.retry_after},
+                        status_code=429, headers={'Retry-After': retry_after_header(error)})
+
+
+async def generate_prompt(request):
+    try:
+        # The pool answers from memory; only an empty pool waits on its refill thread
+        new_prompt = await run_in_threadpool(get_prompt_pool().get)
+        if new_prompt:
+            return JSONResponse({'success': True, 'prompt': new_prompt})
+        return JSONResponse({'success': False, 'error': 'Failed to generate prompt'}, status_code=400)
+    except RateLimitError as e:
+        return rate_limited(e)
+    except Exception as e:
+        logger.error(f"Error generating prompt: {str(e)}")
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+
+def wants_candidates(data):
+    try:
+        return candidate_count(data.get('candidates')) > 1
+    except (TypeError, ValueError):
+        # Flask reports the invalid value
+        return True
+
+
+async def generate_image(request):
+    data, body = await read_json(request)
+    # Queued jobs, malformed bodies and best-of-N renders (blocking downloads and scoring) keep Flask's handling
+    if data is None or data.get('async') or wants_candidates(data):
+        return ForwardToFlask(body)
+
+    try:
+        Config.validate_env()
+        prompt = data.get('prompt')
+        if not prompt:
+            return JSONResponse({'success': False, 'error': 'No prompt provided'}, status_code=400)
+
+        result = await generate_image_cached_async(prompt, bool(data.get('force')))
+        if not result['imageUrl']:
+            return JSONResponse({'success': False, 'error': 'Failed to generate image'}, status_code=400)
+        return JSONResponse({'success': True, **result})
+
+    except RateLimitError as e:
+        return rate_limited(e)
+    except Exception as e:
+        logger.error(f"Error: {str(e)}")
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+
+async def push_to_tv(request):
+    data, body = await read_json(request)
+    if data is None or data.get('async'):
+        return ForwardToFlask(body)
+
+    try:
+        image_url = data.get('imageUrl')
+        tv_ip = data.get('tvIp')
+        if not image_url:
+            return JSONResponse({'success': False, 'error': 'Invalid image URL'}, status_code=400)
+        if not tv_ip:
+            return JSONResponse({'success': False, 'error': 'TV IP address is required'}, status_code=400)
+
+        # The TV client is blocking, so pushes run in worker threads
+        if image_url.startswith('/images/'):
+            result = await run_in_threadpool(push_image_to_tv, local_image_path(image_url), tv_ip)
+        else:
+            image_data, _ = await fetch_image_data_async(image_url, archive_folder_for_pushes())
+            result = await run_in_threadpool(push_image_data_to_tv, image_data, tv_ip, image_url)
+
+        return JSONResponse({'success': True, **result})
+
+    except Exception as e:
+        logger.error(f"Error: {str(e)}")
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+
+async def discover_tvs(request):
+    try:
+        # Probes run on the event loop; only the per-TV device queries use worker threads
+        refresh = request.query_params.get('refresh', 'false').lower() in ('1', 'true')
+        return JSONResponse({'success': True, **await get_tv_discovery().discover_async(refresh)})
+    except ValueError as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=400)
+    except Exception as e:
+        logger.error(f"Error discovering TVs: {str(e)}")
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    os.makedirs(Config.get_env('IMAGES_FOLDER'), exist_ok=True)
+    get_prompt_pool().warm()
+    buffer_enabled = Config.snapshot().flag('IMAGE_BUFFER_ENABLED')
+    if buffer_enabled:
+        get_image_buffer().start()
+    try:
+        yield
+    finally:
+        await close_async_http_client()
+        if buffer_enabled:
+            get_image_buffer().stop()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/generate-prompt', generate_prompt, methods=['POST']),
+        Route('/api/generate-image', generate_image, methods=['POST']),
+        Route('/api/push-to-tv', push_to_tv, methods=['POST']),
+        Route('/api/discover-tvs', discover_tvs),
+        Mount('/', app=wsgi_app),
+    ],
+    middleware=[Middleware(TraceMiddleware)],
+    lifespan=lifespan,
+)
+
+
+def worker_count(requested):
+    """Checks the requested worker processes; only 1 works, as jobs, the image buffer and state files are per process."""
+    if requested != 1:
+        raise ValueError(f"{requested} workers requested, but only 1 is supported: async jobs, the image "
+                         f"buffer and state files are per process, so job polls would miss on other workers")
+    return requested
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the Dynamic TV API as an ASGI server")
+    parser.add_argument('--host', default=Config.get_env('SERVER_HOST', DEFAULT_HOST))
+    parser.add_argument('--port', type=int, default=int(Config.get_env('SERVER_PORT', DEFAULT_PORT)))
+    parser.add_argument('--workers', type=int, default=int(Config.get_env('SERVER_WORKERS', DEFAULT_WORKERS)),
+                        help="Worker processes; only 1 is supported")
+    args = parser.parse_args()
+    try:
+        workers = worker_count(args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    uvicorn.run('asgi_server:app', host=args.host, port=args.port, workers=workers,
+                proxy_headers=True, log_level='info')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""End-to-end benchmarks of the API against local stand-ins.
+
+Starts fake Ideogram, OpenRouter and Frame TV services (fake_services.py),
+points the server at them through the environment, serves the Flask app on
+a free local port and drives it over HTTP at each concurrency level and
+library size. Everything runs in a throwaway folder, so the real library
+and caches are never touched, and fixed seeds and injected latencies make
+runs comparable across machines and commits.
+
+    python benchmark.py --concurrency 1,4,16 --library-sizes 100,1000
+    python benchmark.py --compare .cache/benchmarks/<earlier run>.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import requests
+from config import Config
+from fake_services import FakeFrameTV, FakeIdeogram, FakeOpenRouter, make_image_payload
+
+SCENARIOS = ('list', 'push', 'generate', 'generate-cached', 'prompt')
+# Scenarios whose cost depends on how many images the library holds
+LIBRARY_SCENARIOS = ('list', 'push')
+DEFAULT_CONCURRENCY = '1,4,16'
+DEFAULT_LIBRARY_SIZES = '100,1000'
+DEFAULT_REQUESTS = 40
+DEFAULT_TOLERANCE = 0.2
+RESULTS_VERSION = 1
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values (fraction in 0..1)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * fraction // 1))
+    return ordered[int(rank) - 1]
+
+
+def summarize(latencies, errors, wall_seconds):
+    """Throughput and latency figures for one run; latencies in seconds."""
+    completed = len(latencies)
+    return {
+        'requests': completed + errors,
+        'errors': errors,
+        'throughput': round(completed / wall_seconds, 2) if wall_seconds > 0 else None,
+        'p50Ms': round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+        'p99Ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        'meanMs': round(sum(latencies) / completed * 1000, 1) if latencies else None,
+    }
+
+
+def run_load(send, total, concurrency):
+    """Calls send(i) for i in range(total) from concurrency threads and summarizes the timings.
+
+    send returns True on success; a False return or an exception counts as an error.
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = send(i)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def result_key(result):
+    return (result['scenario'], result['concurrency'], result['librarySize'])
+
+
+def compare_results(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    """Matches runs by scenario, concurrency and library size and lists the regressions.
+
+    A run regresses when its p50 or p99 latency grew, or its throughput fell,
+    by more than tolerance (a fraction of the baseline value).
+    """
+    previous = {result_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        before = previous.get(result_key(result))
+        if not before:
+            continue
+        for field, higher_is_worse in (('p50Ms', True), ('p99Ms', True), ('throughput', False)):
+            old, new = before.get(field), result.get(field)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change if higher_is_worse else -change) > tolerance:
+                regressions.append({
+                    'scenario': result['scenario'],
+                    'concurrency': result['concurrency'],
+                    'librarySize': result['librarySize'],
+                    'metric': field,
+                    'baseline': old,
+                    'current': new,
+                    'change': round(change, 3),
+                })
+    return regressions
+
+
+class BenchmarkEnvironment:
+    """The fakes, a scratch library and the Flask app served on a local port.
+
+    The environment variables the app reads are set on entry and restored
+    on exit; the server modules are imported only after that, so their
+    lazily created singletons pick up the benchmark configuration.
+    """
+
+    def __init__(self, ideogram_latency=0.5, download_latency=0.05, openrouter_latency=0.3,
+                 tv_command_latency=0.02, tv_upload_latency=0.2, tv_upload_bandwidth=5_000_000,
+                 image_resolution=(1920, 1080), image_bytes=None, library_resolution=(640, 360),
+                 tv_resolution='3840x2160', log_level='WARNING', trace_push_memory=False, seed=0):
+        self.ideogram = FakeIdeogram(ideogram_latency, download_latency, image_resolution, image_bytes)
+        self.openrouter = FakeOpenRouter(openrouter_latency)
+        self.tv = FakeFrameTV(tv_command_latency, tv_upload_latency, tv_upload_bandwidth, tv_resolution)
+        self.library_image = make_image_payload(library_resolution, seed=seed)
+        self.log_level = log_level
+        self.trace_push_memory = trace_push_memory
+        # Peak heap of each measured push, from the push responses
+        self.memory_peaks = []
+        self.work_dir = None
+        self.images_folder = None
+        self.library = []
+        self._saved_env = None
+        self._server = None
+        self._local = threading.local()
+
+    def __enter__(self):
+        self.work_dir = tempfile.mkdtemp(prefix='dynamictv-bench-')
+        self.images_folder = os.path.join(self.work_dir, 'library')
+        os.makedirs(self.images_folder)
+        for fake in (self.ideogram, self.openrouter, self.tv):
+            fake.start()
+
+        self._saved_env = dict(os.environ)
+        os.environ.pop('CATALOG_PATH', None)
+        os.environ.update({
+            'IMAGES_FOLDER': self.images_folder,
+            'CACHE_FOLDER': os.path.join(self.work_dir, 'cache'),
+            'IDEOGRAM_API_URL': self.ideogram.generate_url,
+            'IDEOGRAM_API_KEY': 'benchmark',
+            'IDEOGRAM_STYLE_TYPE': 'AUTO',
+            'IDEOGRAM_ASPECT_RATIO': '16x9',
+            'NEGATIVE_PROMPT': 'blurry',
+            'OPENROUTER_ENDPOINT': self.openrouter.endpoint,
+            'OPENROUTER_API_KEY': 'benchmark',
+            'OPENROUTER_MODEL': 'benchmark/model',
+            'TV_PORT': str(self.tv.port),
+            'GENERATION_CACHE_VARIANTS': '1',
+            # Measure the app, not the upstream rate limits
+            'IDEOGRAM_RATE_LIMIT': '0',
+            'OPENROUTER_RATE_LIMIT': '0',
+            'LOG_FILE': '',
+            'LOG_LEVEL': self.log_level,
+            'TRACE_PUSH_MEMORY': 'true' if self.trace_push_memory else 'false',
+        })
+        Config.reload()
+
+        from werkzeug.serving import make_server
+        from server import app
+        # One access log line per request would swamp the results table
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self._server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._server:
+            self._server.shutdown()
+        for fake in (self.ideogram, self.openrouter, self.tv):
+            fake.stop()
+        os.environ.clear()
+        os.environ.update(self._saved_env)
+        Config.reload()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def call(self, method, path, **kwargs):
+        """One API request on this thread's keep-alive session; True if it succeeded."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.request(method, self.base_url + path, timeout=300, **kwargs)
+        body = response.json()
+        if body.get('peakMemoryBytes') is not None:
+            self.memory_peaks.append(body['peakMemoryBytes'])
+        return response.ok and body.get('success', False)
+
+    def fill_library(self, size):
+        """Adds distinct images until the library holds size of them."""
+        from image_catalog import get_catalog
+        from image_store import get_image_store
+        store, catalog = get_image_store(self.images_folder), get_catalog(self.images_folder)
+        while len(self.library) < size:
+            stored = store.put_bytes(self.library_image + len(self.library).to_bytes(8, 'big'))
+            catalog.add(stored.path, sha256=stored.sha256)
+            self.library.append(stored.name)
+
+
+def run_benchmarks(env, scenarios, concurrency_levels, library_sizes, requests_per_run, report=print):
+    """Runs every scenario at every concurrency level; library scenarios at every library size too."""
+    results = []
+    push_cursor = 0
+    prompt_counter = 0
+
+    def record(scenario, concurrency, library_size, summary):
+        result = {'scenario': scenario, 'concurrency': concurrency, 'librarySize': library_size, **summary}
+        results.append(result)
+        report(format_result(result))
+
+    for library_size in library_sizes if set(scenarios) & set(LIBRARY_SCENARIOS) else []:
+        env.fill_library(library_size)
+        for concurrency in concurrency_levels:
+            if 'list' in scenarios:
+                record('list', concurrency, library_size, run_load(
+                    lambda i: env.call('GET', '/api/list-local-images'), requests_per_run, concurrency))
+            if 'push' in scenarios:
+                # Fresh images each run, so every push uploads instead of reselecting
+                start = push_cursor
+                push_cursor += requests_per_run
+                env.memory_peaks.clear()
+                summary = run_load(
+                    lambda i: env.call('POST', '/api/push-to-tv', json={
+                        'imageUrl': f"/images/{env.library[(start + i) % len(env.library)]}",
+                        'tvIp': '127.0.0.1',
+                    }), requests_per_run, concurrency)
+                if env.memory_peaks:
+                    summary['peakMemoryBytes'] = max(env.memory_peaks)
+                record('push', concurrency, library_size, summary)
+
+    for concurrency in concurrency_levels:
+        if 'generate' in scenarios:
+            start = prompt_counter
+            prompt_counter += requests_per_run
+            record('generate', concurrency, None, run_load(
+                lambda i: env.call('POST', '/api/generate-image',
+                                   json={'prompt': f"Benchmark landscape number {start + i}"}),
+                requests_per_run, concurrency))
+        if 'generate-cached' in scenarios:
+            cached = {'prompt': 'Benchmark landscape, cached'}
+            env.call('POST', '/api/generate-image', json=cached)
+            record('generate-cached', concurrency, None, run_load(
+                lambda i: env.call('POST', '/api/generate-image', json=cached), requests_per_run, concurrency))
+        if 'prompt' in scenarios:
+            record('prompt', concurrency, None, run_load(
+                lambda i: env.call('POST', '/api/generate-prompt'), requests_per_run, concurrency))
+    return results
+
+
+def format_result(result):
+    library = result['librarySize'] if result['librarySize'] is not None else '-'
+    def ms(value):
+        return f"{value:9.1f}" if value is not None else f"{'-':>9}"
+    return (f"{result['scenario']:<16}{library:>8}{result['concurrency']:>6}"
+            f"{result['throughput'] or 0:>10.2f}{ms(result['p50Ms'])}{ms(result['p99Ms'])}{result['errors']:>7}")
+
+
+def parse_list(value, cast=int):
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+
+def parse_resolution(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Dynamic TV API against local stand-ins")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"Any of {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', default=DEFAULT_CONCURRENCY, help="Concurrent clients per run")
+    parser.add_argument('--library-sizes', default=DEFAULT_LIBRARY_SIZES,
+                        help="Library sizes for the list and push scenarios")
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help="Requests per run")
+    parser.add_argument('--ideogram-latency', type=float, default=0.5, help="Seconds per generate call")
+    parser.add_argument('--download-latency', type=float, default=0.05, help="Seconds per image download")
+    parser.add_argument('--openrouter-latency', type=float, default=0.3, help="Seconds per chat completion")
+    parser.add_argument('--tv-latency', type=float, default=0.02, help="Seconds per TV websocket command")
+    parser.add_argument('--tv-upload-latency', type=float, default=0.2, help="Seconds the TV takes per upload")
+    parser.add_argument('--tv-bandwidth', type=float, default=5_000_000, help="TV upload bytes per second")
+    parser.add_argument('--image-resolution', default='1920x1080', help="Size of generated images")
+    parser.add_argument('--image-bytes', type=int, help="Pad generated images to this many bytes")
+    parser.add_argument('--library-resolution', default='640x360', help="Size of the library images")
+    parser.add_argument('--tv-resolution', default='3840x2160', help="Panel resolution the fake TV reports")
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--trace-push-memory', action='store_true',
+                        help="Record the peak heap of pushes with tracemalloc (slows pushes down)")
+    parser.add_argument('--output', help="Results file (default: a timestamped file in the benchmarks cache)")
+    parser.add_argument('--compare', help="Earlier results file to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown before a run counts as a regression, e.g. 0.2 for 20%%")
+    args = parser.parse_args()
+
+    scenarios = parse_list(args.scenarios, str.strip)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    settings = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    output = args.output or os.path.join(Config.get_cache_folder('benchmarks'),
+                                         f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+
+    print(f"{'scenario':<16}{'library':>8}{'conc':>6}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>7}")
+    with BenchmarkEnvironment(
+            ideogram_latency=args.ideogram_latency, download_latency=args.download_latency,
+            openrouter_latency=args.openrouter_latency, tv_command_latency=args.tv_latency,
+            tv_upload_latency=args.tv_upload_latency, tv_upload_bandwidth=args.tv_bandwidth,
+            image_resolution=parse_resolution(args.image_resolution), image_bytes=args.image_bytes,
+            library_resolution=parse_resolution(args.library_resolution), tv_resolution=args.tv_resolution,
+            log_level=args.log_level, trace_push_memory=args.trace_push_memory) as env:
+        results = run_benchmarks(env, scenarios, parse_list(args.concurrency),
+                                 sorted(parse_list(args.library_sizes)), args.requests)
+
+    report = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'cpus': os.cpu_count()},
+        'settings': settings,
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, report, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['scenario']} concurrency={regression['concurrency']} "
+                  f"library={regression['librarySize']}: {regression['metric']} "
+                  f"{regression['baseline']} -> {regression['current']} ({regression['change']:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
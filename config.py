@@ -1,45 +1,249 @@
+import atexit
+import logging
 import os
-from dotenv import load_dotenv
+import threading
+import time
+from types import MappingProxyType
+from dotenv import dotenv_values, load_dotenv
 
 load_dotenv()
 
-class Config:
-    REQUIRED_VARS = ['IDEOGRAM_API_KEY', 'IDEOGRAM_STYLE_TYPE', 'IDEOGRAM_ASPECT_RATIO', 'NEGATIVE_PROMPT', 'IMAGES_FOLDER']
-    
-    @staticmethod
-    def validate_env():
-        missing_vars = [var for var in Config.REQUIRED_VARS if not os.getenv(var)]
-        if missing_vars:
-            raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
-    
-    @staticmethod
-    def get_env(key):
-        return os.getenv(key)
-    
-    @staticmethod
-    def set_env(key, value):
-        os.environ[key] = value
-        # Update the .env file to persist the change
-        env_path = os.path.join(os.path.dirname(__file__), '.env')
+logger = logging.getLogger('DynamicTV')
+
+ENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+# Seconds between checks of .env for edits, and that set_env waits for further changes before writing
+RELOAD_INTERVAL = 2.0
+WRITE_DELAY = 0.5
+
+NUMERIC_VARS = (
+    'ASGI_WSGI_THREADS', 'DISCOVERY_CACHE_TTL', 'DISCOVERY_PROBE_TIMEOUT', 'DISCOVERY_SSDP_WAIT',
+    'DUPLICATE_MAX_DISTANCE', 'GENERATION_CACHE_TTL', 'GENERATION_CACHE_VARIANTS',
+    'GENERATION_CANDIDATES', 'HTTP_CONNECT_TIMEOUT', 'HTTP_MAX_RETRIES', 'HTTP_POOL_SIZE', 'HTTP_READ_TIMEOUT',
+    'IDEOGRAM_COST_PER_IMAGE', 'IDEOGRAM_RATE_BURST', 'IDEOGRAM_RATE_LIMIT', 'IDEOGRAM_TIMEOUT',
+    'IMAGE_BUFFER_LOW_WATERMARK', 'IMAGE_BUFFER_MAX_BYTES', 'IMAGE_BUFFER_SIZE', 'JOB_MAX_PENDING',
+    'JOB_WORKERS', 'LOG_BACKUP_COUNT', 'LOG_MAX_BYTES', 'LOG_QUEUE_SIZE', 'OPENROUTER_RATE_BURST',
+    'OPENROUTER_RATE_LIMIT', 'PROMPT_BATCH_SIZE', 'PROMPT_POOL_LOW_WATERMARK', 'RATE_LIMIT_MAX_WAIT',
+    'SCHEDULER_WORKERS', 'SERVER_PORT', 'SERVER_WORKERS',
+    'THUMBNAIL_CACHE_MAX_BYTES', 'THUMBNAIL_QUALITY', 'TRANSCODE_CACHE_MAX_BYTES', 'TV_JPEG_QUALITY',
+    'TV_PORT', 'TV_STORAGE_CLEANUP_DELAY', 'TV_STORAGE_MAX_BYTES', 'TV_STORAGE_MAX_ITEMS', 'TV_TIMEOUT',
+    'TV_UPLOAD_TIMEOUT',
+)
+BOOLEAN_VARS = ('ARCHIVE_PUSHED_IMAGES', 'CANDIDATES_KEEP_ALL', 'GENERATION_CACHE_ENABLED', 'IMAGE_BUFFER_ENABLED',
+                'TRACE_PUSH_MEMORY', 'TV_STORAGE_CLEANUP_ENABLED')
+
+
+def _parse_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+class ConfigSnapshot:
+    """An immutable, validated copy of the configuration at one point in time.
+
+    Numeric and boolean variables are parsed once, when the snapshot is
+    built, so hot paths can call Config.snapshot() per request and get
+    typed values from plain dict reads. errors lists values that failed
+    validation; number() and flag() return the default for those.
+    """
+
+    def __init__(self, values, required=()):
+        self.values = MappingProxyType(dict(values))
+        self.missing_required = self.missing(required)
+        self.errors = []
+        numbers = {}
+        for key in NUMERIC_VARS:
+            if self.values.get(key):
+                try:
+                    numbers[key] = _parse_number(self.values[key])
+                except ValueError:
+                    self.errors.append(f"{key} must be a number, got {self.values[key]!r}")
+        flags = {}
+        for key in BOOLEAN_VARS:
+            if self.values.get(key):
+                if self.values[key].lower() in ('true', 'false'):
+                    flags[key] = self.values[key].lower() == 'true'
+                else:
+                    self.errors.append(f"{key} must be true or false, got {self.values[key]!r}")
+        self.numbers = MappingProxyType(numbers)
+        self.flags = MappingProxyType(flags)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def number(self, key, default=None):
+        """The parsed value of a NUMERIC_VARS variable (int when it has no fraction), or default."""
+        return self.numbers.get(key, default)
+
+    def flag(self, key, default=False):
+        """The parsed value of a BOOLEAN_VARS variable, or default."""
+        return self.flags.get(key, default)
+
+    def missing(self, keys):
+        """The keys among keys that are unset or empty."""
+        return [key for key in keys if not self.values.get(key)]
+
+
+_snapshot = None
+_env_file_values = {}
+_env_file_signature = None
+_checked_at = 0.0
+_reload_lock = threading.Lock()
+_pending = {}
+_write_timer = None
+_write_lock = threading.Lock()
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+def _apply_env_file():
+    """Copies edits of .env into os.environ. Values set by the process environment itself win."""
+    global _env_file_values, _env_file_signature
+    signature = _signature(ENV_PATH)
+    values = {key: value for key, value in dotenv_values(ENV_PATH).items() if value is not None} if signature else {}
+    # On first load, load_dotenv() has already copied the file's values into the environment
+    from_file = _env_file_values if _snapshot is not None else {
+        key: value for key, value in values.items() if os.environ.get(key) == value}
+    updates = {}
+    for key, value in values.items():
+        current = os.environ.get(key)
+        if current is None or (key in from_file and current == from_file[key]):
+            updates[key] = value
+    removed = [key for key, value in from_file.items()
+               if key not in values and os.environ.get(key) == value]
+
+    candidate = ConfigSnapshot({**{k: v for k, v in os.environ.items() if k not in removed}, **updates},
+                               Config.REQUIRED_VARS)
+    _env_file_signature = signature
+    if candidate.errors and _snapshot is not None:
+        # Keep running on the last good configuration until the file is fixed
+        logger.error(f"Ignoring .env changes: {'; '.join(candidate.errors)}")
+        return _snapshot
+    os.environ.update(updates)
+    for key in removed:
+        os.environ.pop(key, None)
+    _env_file_values = values
+    if candidate.errors:
+        logger.warning(f"Invalid configuration: {'; '.join(candidate.errors)}")
+    return candidate
+
+
+def _write_pending():
+    global _write_timer, _env_file_signature
+    with _write_lock:
+        changes = dict(_pending)
+        _pending.clear()
+        _write_timer = None
+    if not changes:
+        return
+    with _reload_lock:
         try:
             # Read existing .env file
-            if os.path.exists(env_path):
-                with open(env_path, 'r') as f:
+            if os.path.exists(ENV_PATH):
+                with open(ENV_PATH, 'r') as f:
                     lines = f.readlines()
-                # Update or add the new value
-                found = False
+            else:
+                lines = []
+            # Update or add the new values
+            for key, value in changes.items():
                 for i, line in enumerate(lines):
                     if line.startswith(f"{key}="):
                         lines[i] = f"{key}={value}\n"
-                        found = True
                         break
-                if not found:
+                else:
                     lines.append(f"{key}={value}\n")
-            else:
-                lines = [f"{key}={value}\n"]
-            
-            # Write back to .env file
-            with open(env_path, 'w') as f:
+
+            # Write a temporary file and rename it over .env, so readers never see half a file
+            tmp_path = f"{ENV_PATH}.tmp"
+            with open(tmp_path, 'w') as f:
                 f.writelines(lines)
+            os.replace(tmp_path, ENV_PATH)
+            _env_file_values.update(changes)
+            _env_file_signature = _signature(ENV_PATH)
         except Exception as e:
-            print(f"Warning: Could not persist environment variable to .env file: {str(e)}")
\ No newline at end of file
+            logger.warning(f"Could not persist environment variables to .env file: {str(e)}")
+
+
+class Config:
+    REQUIRED_VARS = ['IDEOGRAM_API_KEY', 'IDEOGRAM_STYLE_TYPE', 'IDEOGRAM_ASPECT_RATIO', 'NEGATIVE_PROMPT', 'IMAGES_FOLDER']
+
+    @staticmethod
+    def validate_env():
+        missing_vars = Config.snapshot().missing_required
+        if missing_vars:
+            raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
+
+    @staticmethod
+    def get_env(key, default=None):
+        """Returns a variable from the current snapshot as a string.
+
+        Code that changes os.environ directly must call Config.reload()
+        for the change to show here.
+        """
+        value = Config.snapshot().values.get(key)
+        return default if value is None else value
+
+    @staticmethod
+    def snapshot():
+        """Returns the current ConfigSnapshot, picking up edits to .env every RELOAD_INTERVAL seconds."""
+        global _checked_at, _snapshot
+        if _snapshot is not None and time.monotonic() - _checked_at < RELOAD_INTERVAL:
+            return _snapshot
+        with _reload_lock:
+            if _snapshot is None or _signature(ENV_PATH) != _env_file_signature:
+                _snapshot = _apply_env_file()
+            _checked_at = time.monotonic()
+            return _snapshot
+
+    @staticmethod
+    def reload():
+        """Rebuilds the snapshot now, from .env and the process environment."""
+        global _checked_at, _snapshot
+        with _reload_lock:
+            _snapshot = _apply_env_file()
+            _checked_at = time.monotonic()
+            return _snapshot
+
+    @staticmethod
+    def get_cache_folder(name):
+        """Returns the folder used for the named on-disk cache (e.g. 'thumbnails')."""
+        base = Config.get_env('CACHE_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+        return os.path.join(base, name)
+
+    @staticmethod
+    def set_env(key, value):
+        """Sets a variable for this process now and persists it to .env shortly after.
+
+        Writes are batched: changes made within WRITE_DELAY seconds of each
+        other go to disk in one atomic replace of .env. Call flush() to write
+        them immediately.
+        """
+        global _snapshot, _write_timer
+        with _reload_lock:
+            os.environ[key] = value
+            _snapshot = ConfigSnapshot(os.environ, Config.REQUIRED_VARS)
+        with _write_lock:
+            _pending[key] = value
+            if _write_timer is not None:
+                _write_timer.cancel()
+            _write_timer = threading.Timer(WRITE_DELAY, _write_pending)
+            _write_timer.daemon = True
+            _write_timer.start()
+
+    @staticmethod
+    def flush():
+        """Writes pending set_env changes to .env without waiting."""
+        with _write_lock:
+            if _write_timer is not None:
+                _write_timer.cancel()
+        _write_pending()
+
+
+atexit.register(Config.flush)
@@ -0,0 +1,92 @@
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger('DynamicTV')
+
+
+class DiskCache:
+    """Flat directory of cache files with least-recently-used eviction under a byte budget.
+
+    Recency survives restarts through file access times, which are bumped on
+    every hit.
+    """
+
+    def __init__(self, folder, max_bytes, suffix):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._entries = OrderedDict()  # filename -> size in bytes, oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        entries = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(self.suffix):
+                    st = entry.stat()
+                    entries.append((st.st_atime, entry.name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def path_for(self, key):
+        return os.path.join(self.folder, f"{key}{self.suffix}")
+
+    def lookup(self, key):
+        """Returns the cached path for key and marks it recently used, or None on a miss."""
+        filename = f"{key}{self.suffix}"
+        path = os.path.join(self.folder, filename)
+        with self._lock:
+            if filename not in self._entries:
+                return None
+            if not os.path.exists(path):
+                self._total_bytes -= self._entries.pop(filename)
+                return None
+            self._entries.move_to_end(filename)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def store(self, key, write):
+        """Creates the entry for key by calling write(tmp_path), then publishes it atomically."""
+        filename = f"{key}{self.suffix}"
+        path = os.path.join(self.folder, filename)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(self.folder, exist_ok=True)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            if filename in self._entries:
+                self._total_bytes -= self._entries.pop(filename)
+            self._entries[filename] = size
+            self._total_bytes += size
+            self._evict()
+        return path
+
+    def _evict(self):
+        # Caller holds the lock. The newest entry is never evicted.
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            filename, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(os.path.join(self.folder, filename))
+            except OSError as e:
+                logger.warning(f"Could not evict cache file {filename}: {str(e)}")
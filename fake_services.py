@@ -0,0 +1,413 @@
+"""Local stand-ins for Ideogram, OpenRouter, a Samsung Frame TV and its SSDP answers.
+
+Each fake listens on 127.0.0.1 and injects configurable latency, so the
+real server code paths (HTTP client, downloads, samsungtvws) can be
+exercised and timed without API keys or a TV on the network. Used by
+benchmark.py and the tests.
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import socket
+import socketserver
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from PIL import Image
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def make_image_payload(resolution=(1920, 1080), size_bytes=None, quality=90, seed=0):
+    """A noise JPEG of the given resolution, padded with trailing bytes up to size_bytes."""
+    width, height = resolution
+    pixels = np.random.RandomState(seed).randint(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels).resize((width, height), Image.BILINEAR)
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality)
+    data = output.getvalue()
+    if size_bytes and len(data) < size_bytes:
+        # Decoders stop at the end-of-image marker, so the padding only adds transfer size
+        data += os.urandom(size_bytes - len(data))
+    return data
+
+
+class _HTTPFake:
+    """Runs a ThreadingHTTPServer for a handler class on a free local port."""
+
+    handler_class = None
+
+    def __init__(self):
+        self.requests = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler_class)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _send(self, status, body, content_type='application/json'):
+        if not isinstance(body, (bytes, bytearray)):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _IdeogramHandler(_QuietHandler):
+    def do_POST(self):
+        body = self._read_body()
+        fake = self.fake
+        with fake.lock:
+            fake.requests += 1
+        match = re.search(rb'name="num_images"\r\n\r\n(\d+)', body)
+        count = int(match.group(1)) if match else 1
+        time.sleep(fake.latency)
+        self._send(200, {'data': [{'url': f"{fake.base_url}/files/{uuid.uuid4().hex}.jpg"} for _ in range(count)]})
+
+    def do_GET(self):
+        fake = self.fake
+        time.sleep(fake.download_latency)
+        # A unique tail per file keeps the content-addressed library from deduplicating them
+        self._send(200, fake.image + uuid.uuid4().bytes, content_type='image/jpeg')
+
+
+class FakeIdeogram(_HTTPFake):
+    """Ideogram generate endpoint plus the CDN its image URLs point at."""
+
+    handler_class = _IdeogramHandler
+
+    def __init__(self, latency=0.0, download_latency=0.0, resolution=(1920, 1080), image_bytes=None):
+        super().__init__()
+        self.latency = latency
+        self.download_latency = download_latency
+        self.image = make_image_payload(resolution, image_bytes)
+        self.lock = threading.Lock()
+
+    @property
+    def generate_url(self):
+        return f"{self.base_url}/v1/ideogram-v3/generate"
+
+
+class _OpenRouterHandler(_QuietHandler):
+    def do_POST(self):
+        request = json.loads(self._read_body() or b'{}')
+        fake = self.fake
+        with fake.lock:
+            fake.requests += 1
+            first = fake.issued
+            user_message = request.get('messages', [{}])[-1].get('content', '')
+            match = re.match(r'Write (\d+) different prompts', user_message)
+            count = int(match.group(1)) if match else 1
+            fake.issued += count
+        time.sleep(fake.latency)
+        prompts = [f"A quiet harbour at dawn, study number {first + i}" for i in range(count)]
+        content = json.dumps(prompts) if match else prompts[0]
+        self._send(200, {'choices': [{'message': {'content': content}}]})
+
+
+class FakeOpenRouter(_HTTPFake):
+    """OpenRouter chat completions, answering with numbered, distinct prompts."""
+
+    handler_class = _OpenRouterHandler
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.issued = 0
+        self.lock = threading.Lock()
+
+    @property
+    def endpoint(self):
+        return f"{self.base_url}/api/v1/chat/completions"
+
+
+class _WebSocket:
+    """Server side of one RFC 6455 connection: text frames in, text frames out."""
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        self._send_lock = threading.Lock()
+
+    def _read_exact(self, size):
+        data = self.rfile.read(size)
+        if len(data) < size:
+            raise ConnectionError("WebSocket closed")
+        return data
+
+    def recv(self):
+        """Returns the next text or binary message, or None once the client closes."""
+        while True:
+            first, second = self._read_exact(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack('>H', self._read_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack('>Q', self._read_exact(8))[0]
+            mask = self._read_exact(4) if second & 0x80 else None
+            payload = bytearray(self._read_exact(length))
+            if mask:
+                for i in range(length):
+                    payload[i] ^= mask[i % 4]
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                self._send_frame(0xA, bytes(payload))
+                continue
+            if opcode in (0x1, 0x2):
+                return bytes(payload)
+
+    def _send_frame(self, opcode, payload):
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 1 << 16:
+            header += bytes([126]) + struct.pack('>H', len(payload))
+        else:
+            header += bytes([127]) + struct.pack('>Q', len(payload))
+        with self._send_lock:
+            self.wfile.write(header + payload)
+            self.wfile.flush()
+
+    def send_json(self, message):
+        self._send_frame(0x1, json.dumps(message).encode('utf-8'))
+
+
+class _TVHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request_line = self.rfile.readline().decode('latin-1')
+        headers = {}
+        while True:
+            line = self.rfile.readline().decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        tv = self.server.tv
+        if headers.get('upgrade', '').lower() != 'websocket':
+            # REST device info shares the port with the websocket API
+            body = json.dumps({'device': tv.device_info()}).encode('utf-8')
+            self.wfile.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+            return
+
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + WEBSOCKET_GUID).encode()).digest())
+        self.wfile.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                         b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        ws = _WebSocket(self.rfile, self.wfile)
+        with tv.lock:
+            tv.connections += 1
+        ws.send_json({'event': 'ms.channel.connect', 'data': {}})
+        ws.send_json({'event': 'ms.channel.ready', 'data': {}})
+        try:
+            while True:
+                message = ws.recv()
+                if message is None:
+                    return
+                tv.handle_command(ws, json.loads(message))
+        except (ConnectionError, OSError):
+            return
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeFrameTV:
+    """Samsung Frame TV art-mode API: websocket commands plus the D2D upload socket.
+
+    Speaks enough of the protocol for samsungtvws to connect, list content,
+    upload over a plain (unsecured) D2D socket, select and delete art. Every
+    command waits command_latency; uploads additionally wait upload_latency
+    plus the payload size over upload_bytes_per_second.
+    """
+
+    def __init__(self, command_latency=0.0, upload_latency=0.0, upload_bytes_per_second=None,
+                 resolution='3840x2160', model='QE55LS03B'):
+        self.command_latency = command_latency
+        self.upload_latency = upload_latency
+        self.upload_bytes_per_second = upload_bytes_per_second
+        self.resolution = resolution
+        self.model = model
+        self.lock = threading.Lock()
+        self.content = {}
+        self.uploads = []
+        self.selected = []
+        self.connections = 0
+        self._pending = {}
+        self._server = _ThreadingTCPServer(('127.0.0.1', 0), _TVHandler)
+        self._server.tv = self
+        self._d2d = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._d2d.bind(('127.0.0.1', 0))
+        self._d2d.listen(16)
+        self._stopped = False
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._accept_uploads, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._server.shutdown()
+        self._server.server_close()
+        self._d2d.close()
+
+    def device_info(self):
+        return {'modelName': self.model, 'resolution': self.resolution, 'FrameTVSupport': 'true'}
+
+    def _reply(self, ws, request_id, event, **fields):
+        data = {'event': event, 'request_id': request_id, 'id': request_id, **fields}
+        ws.send_json({'event': 'd2d_service_message', 'data': json.dumps(data)})
+
+    def handle_command(self, ws, message):
+        data = json.loads(message.get('params', {}).get('data', '{}'))
+        request, request_id = data.get('request'), data.get('id')
+        time.sleep(self.command_latency)
+
+        if request in ('api_version', 'get_api_version'):
+            self._reply(ws, request_id, request, version='4.3.4.0')
+        elif request == 'get_content_list':
+            with self.lock:
+                content_list = list(self.content.values())
+            self._reply(ws, request_id, request, content_list=json.dumps(content_list))
+        elif request == 'send_image':
+            key = uuid.uuid4().hex
+            with self.lock:
+                self._pending[key] = (ws, request_id)
+            conn_info = {'ip': '127.0.0.1', 'port': self._d2d.getsockname()[1], 'key': key, 'secured': False}
+            self._reply(ws, request_id, 'ready_to_use', conn_info=json.dumps(conn_info))
+        elif request == 'select_image':
+            with self.lock:
+                self.selected.append(data.get('content_id'))
+            self._reply(ws, request_id, request, content_id=data.get('content_id'))
+        elif request == 'delete_image_list':
+            deleted = data.get('content_id_list', [])
+            with self.lock:
+                for item in deleted:
+                    self.content.pop(item.get('content_id'), None)
+            self._reply(ws, request_id, 'image_deleted', content_id_list=json.dumps(deleted))
+        elif request == 'get_device_info':
+            self._reply(ws, request_id, request, **self.device_info())
+        else:
+            self._reply(ws, request_id, 'error', error_code='-1', request_data=json.dumps(data))
+
+    def _accept_uploads(self):
+        while not self._stopped:
+            try:
+                sock, _ = self._d2d.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._receive_upload, args=(sock,), daemon=True).start()
+
+    def _receive_upload(self, sock):
+        with sock, sock.makefile('rb') as stream:
+            header = json.loads(stream.read(int.from_bytes(stream.read(4), 'big')))
+            data = stream.read(int(header['fileLength']))
+        with self.lock:
+            ws, request_id = self._pending.pop(header['secKey'])
+        delay = self.upload_latency
+        if self.upload_bytes_per_second:
+            delay += len(data) / self.upload_bytes_per_second
+        time.sleep(delay)
+
+        with self.lock:
+            self.uploads.append(len(data))
+            content_id = f"MY_F{len(self.uploads):04d}"
+            self.content[content_id] = {'content_id': content_id, 'category_id': 'MY-C0002'}
+        self._reply(ws, request_id, 'image_added', content_id=content_id)
+
+
+class _SSDPHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data, sock = self.request
+        if not data.startswith(b'M-SEARCH'):
+            return
+        fake = self.server.fake
+        with fake.lock:
+            fake.searches += 1
+        search_target = re.search(rb'^ST:\s*(.+?)\r?$', data, re.MULTILINE | re.IGNORECASE)
+        response = (
+            'HTTP/1.1 200 OK\r\n'
+            'CACHE-CONTROL: max-age=1800\r\n'
+            f'LOCATION: {fake.location}\r\n'
+            'SERVER: SHP, UPnP/1.0, Samsung UPnP SDK/1.0\r\n'
+            f"ST: {search_target.group(1).decode('latin-1') if search_target else 'upnp:rootdevice'}\r\n"
+            f'USN: uuid:{fake.uuid}\r\n'
+            '\r\n'
+        ).encode('latin-1')
+        sock.sendto(response, self.client_address)
+
+
+class FakeSSDPResponder:
+    """Answers SSDP M-SEARCH requests on a local UDP port the way a Samsung TV does.
+
+    Point discovery's SSDP address at (127.0.0.1, port) instead of the
+    multicast group; replies come from 127.0.0.1, where a FakeFrameTV can listen.
+    """
+
+    def __init__(self, location='http://127.0.0.1:9197/dmr'):
+        self.location = location
+        self.uuid = uuid.uuid4()
+        self.searches = 0
+        self.lock = threading.Lock()
+        self._server = socketserver.ThreadingUDPServer(('127.0.0.1', 0), _SSDPHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+from image_catalog import get_catalog
+from image_generator import generate_params, ideogram_generate_url
+from rate_limiter import SingleFlight, flight_key
+
+logger = logging.getLogger('DynamicTV')
+
+# Cached renders older than this are not reused; 0 keeps them forever
+DEFAULT_TTL = 7 * 24 * 3600
+# Distinct renders kept per request before repeats are served from the cache
+DEFAULT_VARIANTS = 1
+
+# Identical requests that miss the cache at the same time share one render
+_inflight = SingleFlight()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    params TEXT NOT NULL,
+    created REAL NOT NULL,
+    served REAL NOT NULL,
+    latency REAL NOT NULL,
+    PRIMARY KEY (key, name)
+);
+"""
+
+
+def normalize_params(params):
+    """Case- and whitespace-insensitive form of the request parameters."""
+    return {key: ' '.join(str(value).split()).casefold() for key, value in params.items()}
+
+
+def cache_key(params):
+    canonical = json.dumps(normalize_params(params), sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def request_params(prompt):
+    # Renders from another model version are not interchangeable
+    return {**generate_params(prompt), 'model': ideogram_generate_url()}
+
+
+class GenerationCache:
+    """Maps normalized generation requests to images already in the library.
+
+    Each request keeps up to `variants` renders. Until that many exist a
+    lookup misses so a fresh variant is rendered; after that, hits cycle
+    through them, least recently served first. Renders older than `ttl`
+    seconds and renders whose file has been deleted are never served.
+    """
+
+    def __init__(self, db_path, images_folder, ttl=DEFAULT_TTL, variants=DEFAULT_VARIANTS, clock=time.time):
+        self.images_folder = images_folder
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._forced = 0
+        self._saved_seconds = 0.0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def lookup(self, params):
+        """Returns the library name of a cached render for params, or None on a miss."""
+        key = cache_key(params)
+        now = self.clock()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, created, latency FROM generations WHERE key = ? ORDER BY served", (key,)
+            ).fetchall()
+            live = []
+            gone = []
+            for row in rows:
+                expired = self.ttl and now - row['created'] > self.ttl
+                missing = not os.path.exists(os.path.join(self.images_folder, *row['name'].split('/')))
+                (gone if expired or missing else live).append(row)
+            with self._conn:
+                self._conn.executemany("DELETE FROM generations WHERE key = ? AND name = ?",
+                                       [(key, row['name']) for row in gone])
+                if len(live) < self.variants:
+                    self._misses += 1
+                    return None
+                row = live[0]
+                self._conn.execute("UPDATE generations SET served = ? WHERE key = ? AND name = ?",
+                                   (now, key, row['name']))
+            self._hits += 1
+            self._saved_seconds += row['latency']
+        logger.info(f"Generation cache hit: {row['name']}")
+        return row['name']
+
+    def record_forced(self):
+        with self._lock:
+            self._forced += 1
+
+    def store(self, params, name, latency):
+        """Records a fresh render of params, stored in the library as name."""
+        now = self.clock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO generations (key, name, params, created, served, latency) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key, name) DO UPDATE SET created = excluded.created, served = excluded.served",
+                (cache_key(params), name, json.dumps(params, sort_keys=True), now, now, latency)
+            )
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            entries = self._conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'forced': self._forced,
+                'hitRate': round(self._hits / lookups, 3) if lookups else None,
+                'savedSeconds': round(self._saved_seconds, 1),
+                'entries': entries,
+                'ttlSeconds': self.ttl,
+                'variants': self.variants,
+            }
+
+
+def cache_enabled():
+    return Config.snapshot().flag('GENERATION_CACHE_ENABLED', True)
+
+
+def _record_render(cache, params, prompt, image_path, started):
+    latency = time.perf_counter() - started
+    catalog = get_catalog(cache.images_folder)
+    catalog.add(image_path, prompt=prompt)
+    name = catalog.name_for(image_path)
+    cache.store(params, name, latency)
+    return f"/images/{name}"
+
+
+def _render_candidates(prompt, candidates, images_folder, keep_all):
+    """Renders several candidates and stores the best, or with keep_all every one, in the library.
+
+    Returns (path of the best candidate or None, all candidates best first).
+    """
+    from image_candidates import best_candidates, keep_candidates
+
+    ranked = best_candidates(prompt, candidates)
+    if not ranked:
+        return None, []
+    paths = keep_candidates(ranked if keep_all else ranked[:1], images_folder, prompt)
+    return paths[0], ranked
+
+
+def generate_image_cached(prompt, force=False, candidates=1, keep_all=None):
+    """Generates an image for prompt unless an equivalent request was rendered before.
+
+    Fresh renders are downloaded into the library, so hits and misses both
+    return a local /images/ URL. force=True always renders a new variant.
+    With candidates > 1 a miss renders that many images, scores them and
+    keeps the best; keep_all (default CANDIDATES_KEEP_ALL) keeps the rest too.
+    Best-of-N renders are cached per N and keep_all, apart from plain renders.
+    A request identical to one already rendering waits for and shares its
+    result; forced requests always render their own.
+
+    Returns:
+        dict: {'imageUrl', 'cached'}, plus the scored 'candidates' when several
+        were rendered; imageUrl is None if generation failed.
+    """
+    from image_candidates import keep_all_candidates
+    from image_fetcher import fetch_image_data
+    from image_generator import generate_image_api
+
+    if candidates > 1 and keep_all is None:
+        keep_all = keep_all_candidates()
+    if not cache_enabled():
+        if candidates > 1:
+            images_folder = Config.get_env('IMAGES_FOLDER')
+            image_path, ranked = _render_candidates(prompt, candidates, images_folder, keep_all)
+            image_url = f"/images/{get_catalog(images_folder).name_for(image_path)}" if image_path else None
+            return {'imageUrl': image_url, 'cached': False, 'candidates': [c.to_dict() for c in ranked]}
+        return {'imageUrl': generate_image_api(prompt), 'cached': False}
+
+    cache = get_generation_cache()
+    params = request_params(prompt)
+    if candidates > 1:
+        # A plain render must never answer a request that asked for the best of several
+        params = {**params, 'candidates': candidates, 'keepAll': keep_all}
+    if force:
+        cache.record_forced()
+    else:
+        name = cache.lookup(params)
+        if name:
+            return {'imageUrl': f"/images/{name}", 'cached': True}
+
+    def render():
+        started = time.perf_counter()
+        if candidates > 1:
+            image_path, ranked = _render_candidates(prompt, candidates, cache.images_folder, keep_all)
+            if not image_path:
+                return {'imageUrl': None, 'cached': False, 'candidates': []}
+            return {'imageUrl': _record_render(cache, params, prompt, image_path, started), 'cached': False,
+                    'candidates': [c.to_dict() for c in ranked]}
+
+        # A forced render must not share an identical plain request's Ideogram call either
+        image_url = generate_image_api(prompt, coalesce=not force)
+        if not image_url:
+            return {'imageUrl': None, 'cached': False}
+        _, image_path = fetch_image_data(image_url, cache.images_folder)
+        return {'imageUrl': _record_render(cache, params, prompt, image_path, started), 'cached': False}
+
+    if force:
+        return render()
+    result, _ = _inflight.do(flight_key(cache_key(params)), render)
+    return dict(result)
+
+
+async def generate_image_cached_async(prompt, force=False):
+    """generate_image_cached for the ASGI server; needs httpx."""
+    from image_fetcher import fetch_image_data_async
+    from image_generator import generate_image_api_async
+
+    if not cache_enabled():
+        return {'imageUrl': await generate_image_api_async(prompt), 'cached': False}
+
+    cache = get_generation_cache()
+    params = request_params(prompt)
+    if force:
+        cache.record_forced()
+    else:
+        # A primary-key lookup in a local SQLite file; cheap enough for the event loop
+        name = cache.lookup(params)
+        if name:
+            return {'imageUrl': f"/images/{name}", 'cached': True}
+
+    async def render():
+        started = time.perf_counter()
+        image_url = await generate_image_api_async(prompt, coalesce=not force)
+        if not image_url:
+            return {'imageUrl': None, 'cached': False}
+        _, image_path = await fetch_image_data_async(image_url, cache.images_folder)
+        return {'imageUrl': _record_render(cache, params, prompt, image_path, started), 'cached': False}
+
+    if force:
+        return await render()
+    result, _ = await _inflight.do_async(flight_key(cache_key(params)), render)
+    return dict(result)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_generation_cache():
+    """Returns the process-wide generation cache configured from the environment."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            folder = Config.get_cache_folder('generations')
+            os.makedirs(folder, exist_ok=True)
+            _cache = GenerationCache(
+                os.path.join(folder, 'generations.sqlite3'),
+                Config.get_env('IMAGES_FOLDER'),
+                ttl=float(Config.get_env('GENERATION_CACHE_TTL', DEFAULT_TTL)),
+                variants=int(Config.get_env('GENERATION_CACHE_VARIANTS', DEFAULT_VARIANTS)),
+            )
+        return _cache
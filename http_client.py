@@ -0,0 +1,327 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from config import Config
+
+logger = logging.getLogger('DynamicTV')
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 60.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_POOL_SIZE = 10
+RETRY_BASE = 0.5
+RETRY_MAX = 10.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+# Latency samples kept per endpoint for percentiles
+LATENCY_SAMPLES = 256
+
+
+def _never_sent(error):
+    """True if a requests error means the request never reached the server, so a POST may be resent."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    # Connect failures arrive as MaxRetryError(reason=NewConnectionError); an aborted
+    # connection after the request was written is a ProtocolError and must not be resent
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+
+def _retry_status(method, response):
+    """True if the response status is worth another attempt with the same method.
+
+    A 5xx answer to a POST may come after the server acted on it, so non-idempotent
+    requests are only resent when the server asked for that: a 429, or a 503 with Retry-After.
+    """
+    if response.status_code not in RETRY_STATUSES:
+        return False
+    if method in IDEMPOTENT_METHODS or response.status_code == 429:
+        return True
+    return response.status_code == 503 and 'Retry-After' in response.headers
+
+
+class EndpointStats:
+    """Call counts and latency samples for one named endpoint."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def to_dict(self):
+        ordered = sorted(self.samples)
+
+        def percentile(fraction):
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 1)
+
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'retries': self.retries,
+            'avgMs': round(self.total_seconds / self.calls * 1000, 1) if self.calls else None,
+            'p50Ms': percentile(0.5),
+            'p95Ms': percentile(0.95),
+            'maxMs': round(self.max_seconds * 1000, 1),
+        }
+
+
+class EndpointMetrics:
+    """Thread-safe registry of EndpointStats, shared by the sync and async clients."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, error=False, retried=False):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, EndpointStats())
+            if retried:
+                stats.retries += 1
+                return
+            stats.calls += 1
+            stats.errors += int(error)
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.samples.append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: stats.to_dict() for endpoint, stats in self._stats.items()}
+
+
+def retry_delay(attempt, retry_after=None):
+    """Backoff before retry number attempt + 1, honouring a numeric Retry-After header."""
+    if retry_after and retry_after.isdigit():
+        return min(RETRY_MAX, float(retry_after))
+    # Full jitter spreads out clients that failed together
+    return random.uniform(0, min(RETRY_MAX, RETRY_BASE * 2 ** attempt))
+
+
+def _resolve(method, url, endpoint, timeout, default_timeouts):
+    parts = urlsplit(url)
+    endpoint = endpoint or f"{method} {parts.netloc}{parts.path}"
+    if timeout is None:
+        timeout = default_timeouts
+    elif not isinstance(timeout, tuple):
+        timeout = (default_timeouts[0], timeout)
+    return endpoint, timeout
+
+
+class HTTPClient:
+    """Shared HTTP client for the upstream APIs (Ideogram, OpenRouter, image CDNs).
+
+    Keeps one keep-alive session per host, applies connect/read timeouts to
+    every call, retries connection failures and 429/5xx responses with
+    jittered exponential backoff, and records latency per endpoint name.
+    Read timeouts are only retried for idempotent methods, so a slow
+    generation request is never submitted twice.
+    """
+
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, pool_size=DEFAULT_POOL_SIZE, sleep=time.sleep, stats=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.sleep = sleep
+        self.stats = stats or EndpointMetrics()
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session_for(self, url):
+        """Returns the pooled session for the URL's scheme and host."""
+        parts = urlsplit(url)
+        key = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount(f"{key}/", adapter)
+                self._sessions[key] = session
+            return session
+
+    def request(self, method, url, endpoint=None, timeout=None, retries=None, limiter=None, **kwargs):
+        """Sends a request, retrying transient failures.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Absolute URL.
+            endpoint (str): Name the latency is recorded under; defaults to host and path.
+            timeout (float or tuple): Read timeout, or a (connect, read) pair.
+            retries (int): Retries after the first attempt; defaults to the client's max_retries.
+            limiter (ProviderLimiter): Told about 429s, so calls queued behind this one back off too.
+            **kwargs: Passed on to requests, e.g. json, files, headers, stream.
+
+        Returns:
+            requests.Response: The final response, which may still carry a 429/5xx status.
+        """
+        method = method.upper()
+        endpoint, timeout = _resolve(method, url, endpoint, timeout, (self.connect_timeout, self.read_timeout))
+        retries = self.max_retries if retries is None else retries
+        session = self.session_for(url)
+
+        attempt = 0
+        started = time.monotonic()
+        while True:
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                # Same policy as AsyncHTTPClient: a POST is only resent if it never went out
+                retryable = _never_sent(e) or (
+                    method in IDEMPOTENT_METHODS
+                    and isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)))
+                if not retryable or attempt >= retries:
+                    self.stats.record(endpoint, time.monotonic() - started, error=True)
+                    raise
+                delay = retry_delay(attempt)
+                logger.warning(f"{endpoint} failed ({str(e)}), retrying in {delay:.1f}s")
+            else:
+                if not _retry_status(method, response) or attempt >= retries:
+                    self.stats.record(endpoint, time.monotonic() - started, error=response.status_code >= 400)
+                    return response
+                delay = retry_delay(attempt, response.headers.get('Retry-After'))
+                logger.warning(f"{endpoint} returned {response.status_code}, retrying in {delay:.1f}s")
+                if limiter is not None and response.status_code == 429:
+                    limiter.throttled(delay)
+                response.close()
+
+            self.stats.record(endpoint, 0, retried=True)
+            attempt += 1
+            self.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def metrics(self):
+        """Returns per-endpoint call counts and latencies."""
+        return self.stats.snapshot()
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+class AsyncHTTPClient:
+    """asyncio counterpart of HTTPClient for the ASGI server, built on httpx.
+
+    Same timeouts, retry policy and endpoint metrics; httpx keeps its own
+    keep-alive pool per host. Only create it inside a running event loop.
+    """
+
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, pool_size=DEFAULT_POOL_SIZE, stats=None, transport=None):
+        import httpx
+
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.stats = stats or EndpointMetrics()
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=pool_size),
+            transport=transport,
+        )
+
+    async def request(self, method, url, endpoint=None, timeout=None, retries=None, limiter=None, **kwargs):
+        """Async version of HTTPClient.request; returns an httpx.Response with the body read."""
+        import asyncio
+        import httpx
+
+        method = method.upper()
+        endpoint, (connect, read) = _resolve(method, url, endpoint, timeout, (self.connect_timeout, self.read_timeout))
+        timeout = httpx.Timeout(read, connect=connect)
+        retries = self.max_retries if retries is None else retries
+
+        attempt = 0
+        started = time.monotonic()
+        while True:
+            try:
+                response = await self._client.request(method, url, timeout=timeout, **kwargs)
+            except httpx.TransportError as e:
+                retryable = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)) or method in IDEMPOTENT_METHODS
+                if not retryable or attempt >= retries:
+                    self.stats.record(endpoint, time.monotonic() - started, error=True)
+                    raise
+                delay = retry_delay(attempt)
+                logger.warning(f"{endpoint} failed ({str(e) or type(e).__name__}), retrying in {delay:.1f}s")
+            else:
+                if not _retry_status(method, response) or attempt >= retries:
+                    self.stats.record(endpoint, time.monotonic() - started, error=response.status_code >= 400)
+                    return response
+                delay = retry_delay(attempt, response.headers.get('Retry-After'))
+                logger.warning(f"{endpoint} returned {response.status_code}, retrying in {delay:.1f}s")
+                if limiter is not None and response.status_code == 429:
+                    limiter.throttled(delay)
+
+            self.stats.record(endpoint, 0, retried=True)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    def metrics(self):
+        return self.stats.snapshot()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_client = None
+_client_lock = threading.Lock()
+_async_client = None
+
+
+def get_http_client():
+    """Returns the process-wide HTTP client configured from the environment."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient(
+                connect_timeout=float(Config.get_env('HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+                read_timeout=float(Config.get_env('HTTP_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)),
+                max_retries=int(Config.get_env('HTTP_MAX_RETRIES', DEFAULT_MAX_RETRIES)),
+                pool_size=int(Config.get_env('HTTP_POOL_SIZE', DEFAULT_POOL_SIZE)),
+            )
+        return _client
+
+
+def get_async_http_client():
+    """Returns the event loop's async HTTP client; it records into the same metrics as get_http_client()."""
+    global _async_client
+    if _async_client is None:
+        client = get_http_client()
+        _async_client = AsyncHTTPClient(
+            connect_timeout=client.connect_timeout,
+            read_timeout=client.read_timeout,
+            max_retries=client.max_retries,
+            pool_size=client.pool_size,
+            stats=client.stats,
+        )
+    return _async_client
+
+
+async def close_async_http_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
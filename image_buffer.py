@@ -0,0 +1,254 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from config import Config
+from image_store import get_image_store, sniff_format
+
+logger = logging.getLogger('DynamicTV')
+
+DEFAULT_TARGET = 3
+DEFAULT_LOW_WATERMARK = 1
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+RETRY_BASE = 5.0
+RETRY_MAX = 300.0
+
+
+def target_resolutions(tv_ips=None):
+    """Panel resolutions of the TVs a rendered image may be pushed to (default: the scheduled TVs)."""
+    from scheduler import load_schedules
+    from transcoder import panel_resolution
+    from tv_connection import get_connection_manager
+
+    if tv_ips is None:
+        try:
+            tv_ips = list(load_schedules())
+        except ValueError as e:
+            logger.warning(f"Could not read TV schedules: {str(e)}")
+            tv_ips = []
+    manager = get_connection_manager()
+    # Same lookup as the push, so the transcode cache key matches
+    resolutions = {panel_resolution(manager.device_info(tv_ip)) for tv_ip in tv_ips}
+    return sorted(resolutions) or [panel_resolution(None)]
+
+
+def render_next_image(folder, tv_ips=None):
+    """Runs the full prompt -> Ideogram -> download -> transcode pipeline once.
+
+    Returns (image_path, prompt). A JPEG for each target TV's panel lands in
+    the transcode cache, so pushing the image later skips the encode as well.
+    """
+    from image_candidates import best_candidates, candidate_count, keep_all_candidates, keep_candidates
+    from image_fetcher import fetch_image_data
+    from image_generator import generate_image_api
+    from prompt_pool import get_prompt_pool
+    from transcoder import get_transcode_cache
+
+    prompt = get_prompt_pool().get()
+    if not prompt:
+        raise RuntimeError("Failed to generate prompt")
+    candidates = candidate_count()
+    if candidates > 1:
+        # Best of several renders; only the winner goes on to the TV
+        ranked = best_candidates(prompt, candidates)
+        if not ranked:
+            raise RuntimeError("Failed to generate image")
+        image_data = ranked[0].data
+        if keep_all_candidates():
+            keep_candidates(ranked[1:], Config.get_env('IMAGES_FOLDER'), prompt)
+    else:
+        image_url = generate_image_api(prompt)
+        if not image_url:
+            raise RuntimeError("Failed to generate image")
+        image_data, _ = fetch_image_data(image_url)
+    for resolution in target_resolutions(tv_ips):
+        get_transcode_cache().transcode(image_data, resolution)
+
+    # Staged under its content hash; take() moves it into the content-addressed library
+    extension = sniff_format(image_data)
+    image_path = os.path.join(folder, f"{hashlib.sha256(image_data).hexdigest()}.{extension}")
+    tmp_path = os.path.join(folder, f".{os.path.basename(image_path)}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(image_data)
+    os.replace(tmp_path, image_path)
+    return image_path, prompt
+
+
+def archive_image(image_path, prompt=None, archive_folder=None):
+    """Moves a rendered image into the content-addressed library and indexes it.
+
+    Returns:
+        dict: {'path', 'prompt'} for the image in the library.
+    """
+    archive_folder = archive_folder or Config.get_env('IMAGES_FOLDER')
+    stored = get_image_store(archive_folder).put_file(image_path)
+    try:
+        from image_catalog import get_catalog
+        get_catalog(archive_folder).add(stored.path, prompt=prompt, sha256=stored.sha256)
+    except Exception as e:
+        logger.warning(f"Could not add image to catalog: {str(e)}")
+    return {'path': stored.path, 'prompt': prompt}
+
+
+class ImageBuffer:
+    """Look-ahead buffer of fully rendered images waiting to be shown.
+
+    A background thread tops the buffer up to target images whenever it drops
+    to low_watermark, as long as the buffered files fit in max_bytes. Each
+    image is stored next to a JSON sidecar holding its prompt, so the buffer
+    survives restarts.
+    """
+
+    def __init__(self, folder, producer=render_next_image, target=DEFAULT_TARGET,
+                 low_watermark=DEFAULT_LOW_WATERMARK, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.producer = producer
+        self.target = target
+        self.low_watermark = low_watermark
+        self.max_bytes = max_bytes
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._filling = False
+        self._thread = None
+        self._stopped = False
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        for name in sorted(os.listdir(self.folder)):
+            path = os.path.join(self.folder, name)
+            if name.endswith('.json') or name.startswith('.') or not os.path.isfile(path):
+                continue
+            prompt = None
+            try:
+                with open(f"{path}.json", 'r') as f:
+                    prompt = json.load(f).get('prompt')
+            except (OSError, ValueError):
+                pass
+            self._items.append({'path': path, 'prompt': prompt, 'size': os.path.getsize(path)})
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    @property
+    def total_bytes(self):
+        with self._cond:
+            return sum(item['size'] for item in self._items)
+
+    def status(self):
+        with self._cond:
+            return {
+                'ready': len(self._items),
+                'target': self.target,
+                'lowWatermark': self.low_watermark,
+                'bytes': sum(item['size'] for item in self._items),
+                'maxBytes': self.max_bytes,
+                'filling': self._filling,
+            }
+
+    def start(self):
+        """Starts the background filler thread."""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._fill_loop, name='image-buffer', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def take(self, archive_folder=None, timeout=0):
+        """Removes the oldest ready image from the buffer.
+
+        Args:
+            archive_folder (str): Where to move the image; defaults to IMAGES_FOLDER.
+            timeout (float): Seconds to wait for an image if the buffer is empty.
+
+        Returns:
+            dict: {'path', 'prompt'} for the archived image, or None if none was ready.
+        """
+        with self._cond:
+            if not self._items and timeout:
+                self._cond.wait_for(lambda: self._items or self._stopped, timeout=timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            # Wake the filler so it can top up behind this take
+            self._cond.notify_all()
+
+        if os.path.exists(f"{item['path']}.json"):
+            os.remove(f"{item['path']}.json")
+        return archive_image(item['path'], item['prompt'], archive_folder)
+
+    def _needs_fill(self):
+        # Caller holds the lock. Fill from the low watermark up to the target (hysteresis).
+        size = sum(item['size'] for item in self._items)
+        if size >= self.max_bytes or len(self._items) >= self.target:
+            self._filling = False
+        elif len(self._items) <= self.low_watermark:
+            self._filling = True
+        return self._filling
+
+    def fill_once(self):
+        """Produces a single image into the buffer. Returns the new item."""
+        image_path, prompt = self.producer(self.folder)
+        with open(f"{image_path}.json", 'w') as f:
+            json.dump({'prompt': prompt, 'created': time.time()}, f)
+        item = {'path': image_path, 'prompt': prompt, 'size': os.path.getsize(image_path)}
+        with self._cond:
+            self._items.append(item)
+            self._cond.notify_all()
+        logger.info(f"Image buffer: {len(self)} of {self.target} images ready")
+        return item
+
+    def top_up(self):
+        """Fills the buffer to its target in the calling thread, e.g. before a one-shot run exits."""
+        while True:
+            with self._cond:
+                size = sum(item['size'] for item in self._items)
+                if len(self._items) >= self.target or size >= self.max_bytes:
+                    return
+            self.fill_once()
+
+    def _fill_loop(self):
+        failures = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or self._needs_fill())
+                if self._stopped:
+                    return
+            try:
+                self.fill_once()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                delay = min(RETRY_MAX, RETRY_BASE * 2 ** (failures - 1))
+                logger.error(f"Image buffer refill failed, retrying in {delay:.0f}s: {str(e)}")
+                with self._cond:
+                    self._cond.wait_for(lambda: self._stopped, timeout=delay)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_image_buffer():
+    """Returns the process-wide image buffer configured from the environment."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = ImageBuffer(
+                Config.get_env('IMAGE_BUFFER_FOLDER') or Config.get_cache_folder('buffer'),
+                target=int(Config.get_env('IMAGE_BUFFER_SIZE', DEFAULT_TARGET)),
+                low_watermark=int(Config.get_env('IMAGE_BUFFER_LOW_WATERMARK', DEFAULT_LOW_WATERMARK)),
+                max_bytes=int(Config.get_env('IMAGE_BUFFER_MAX_BYTES', DEFAULT_MAX_BYTES)),
+            )
+        return _buffer
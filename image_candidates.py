@@ -0,0 +1,182 @@
+import contextvars
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from config import Config
+from image_store import get_image_store
+
+logger = logging.getLogger('DynamicTV')
+
+# Ideogram renders at most this many images per request
+MAX_PER_REQUEST = 8
+MAX_CANDIDATES = 16
+# Candidates are scored on a thumbnail with this long edge
+SCORE_SIZE = 384
+# Laplacian variance (pixel values 0-1) and Hasler-Suesstrunk colorfulness that score 0.5
+SHARPNESS_MIDPOINT = 0.002
+COLORFULNESS_MIDPOINT = 40.0
+# Pixels this close to black or white count as clipped
+CLIP_MARGIN = 0.02
+WEIGHTS = {'sharpness': 0.35, 'exposure': 0.25, 'colorfulness': 0.2, 'aspectFit': 0.2}
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+class Candidate:
+    def __init__(self, url, data, scores):
+        self.url = url
+        self.data = data
+        self.scores = scores
+        # Library name, once the candidate is stored
+        self.name = None
+
+    @property
+    def score(self):
+        return self.scores['score']
+
+    def to_dict(self):
+        return {'url': self.url, 'name': self.name, 'score': self.score,
+                'scores': {key: value for key, value in self.scores.items() if key != 'score'}}
+
+
+def load_pixels(data, size=SCORE_SIZE):
+    """Decodes image data into a float32 RGB array (0-1) at most size pixels on the long edge.
+
+    Returns (pixels, aspect ratio of the full-size image).
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        aspect = img.width / img.height
+        # JPEG draft mode decodes at a reduced scale, which is much cheaper than a full decode
+        img.draft('RGB', (size, size))
+        img = img.convert('RGB')
+        img.thumbnail((size, size))
+        return np.asarray(img, dtype=np.float32) / 255.0, aspect
+
+
+def score_pixels(pixels, aspect, target_aspect):
+    """Scores an RGB array on sharpness, exposure, colorfulness and fit to the target aspect ratio.
+
+    Each component is in 0..1 and 'score' is their weighted sum.
+    """
+    gray = pixels @ LUMA
+    laplacian = (4 * gray[1:-1, 1:-1] - gray[:-2, 1:-1] - gray[2:, 1:-1]
+                 - gray[1:-1, :-2] - gray[1:-1, 2:])
+    variance = float(laplacian.var())
+    sharpness = variance / (variance + SHARPNESS_MIDPOINT)
+
+    clipped = float(np.mean((gray < CLIP_MARGIN) | (gray > 1 - CLIP_MARGIN)))
+    exposure = (1 - 2 * abs(float(gray.mean()) - 0.5)) * (1 - clipped)
+
+    red, green, blue = pixels[..., 0] * 255, pixels[..., 1] * 255, pixels[..., 2] * 255
+    rg = red - green
+    yb = 0.5 * (red + green) - blue
+    colorfulness = float(np.hypot(rg.std(), yb.std()) + 0.3 * np.hypot(rg.mean(), yb.mean()))
+    colorfulness = colorfulness / (colorfulness + COLORFULNESS_MIDPOINT)
+
+    aspect_fit = min(aspect, target_aspect) / max(aspect, target_aspect)
+
+    scores = {'sharpness': sharpness, 'exposure': exposure, 'colorfulness': colorfulness, 'aspectFit': aspect_fit}
+    scores['score'] = sum(WEIGHTS[key] * value for key, value in scores.items())
+    return {key: round(value, 4) for key, value in scores.items()}
+
+
+def score_image(data, target_aspect):
+    pixels, aspect = load_pixels(data)
+    return score_pixels(pixels, aspect, target_aspect)
+
+
+def panel_aspect():
+    from transcoder import panel_resolution
+    width, height = panel_resolution(None)
+    return width / height
+
+
+def _in_context(func):
+    """Wraps func to run in a copy of the caller's context, so worker threads join the current trace."""
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(func, *args)
+
+
+def request_candidates(prompt, count):
+    """Asks Ideogram for count renders of prompt, in as few concurrent requests as it allows.
+
+    If a response holds fewer images than were asked for, the shortfall is
+    made up with concurrent single-image requests, which must not be
+    coalesced with each other. Returns the image URLs.
+    """
+    from image_generator import generate_image_urls
+
+    def render(size):
+        try:
+            return generate_image_urls(prompt, size, coalesce=False)
+        except Exception as e:
+            logger.warning(f"Candidate request failed: {str(e)}")
+            return []
+
+    batches = [min(MAX_PER_REQUEST, count - start) for start in range(0, count, MAX_PER_REQUEST)]
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        urls = [url for batch in pool.map(_in_context(render), batches) for url in batch]
+        shortfall = count - len(urls)
+        if urls and shortfall > 0:
+            logger.info(f"Ideogram returned {len(urls)} of {count} candidates, requesting {shortfall} more")
+            urls += [url for batch in pool.map(_in_context(render), [1] * shortfall) for url in batch]
+    return urls[:count]
+
+
+def rank_candidates(urls, target_aspect=None):
+    """Downloads and scores the candidates in parallel. Returns them best first; failed downloads are skipped."""
+    from image_fetcher import fetch_image_data
+    target_aspect = target_aspect or panel_aspect()
+
+    def fetch_and_score(url):
+        try:
+            data, _ = fetch_image_data(url)
+            return Candidate(url, data, score_image(data, target_aspect))
+        except Exception as e:
+            logger.warning(f"Skipping candidate {url}: {str(e)}")
+            return None
+
+    if not urls:
+        return []
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        candidates = [c for c in pool.map(_in_context(fetch_and_score), urls) if c is not None]
+    candidates.sort(key=lambda candidate: candidate.score, reverse=True)
+    for rank, candidate in enumerate(candidates):
+        logger.info(f"Candidate {rank + 1}: score {candidate.score:.3f} {candidate.scores}")
+    return candidates
+
+
+def best_candidates(prompt, count, target_aspect=None):
+    """Renders count candidates of prompt and returns them scored, best first."""
+    count = max(1, min(int(count), MAX_CANDIDATES))
+    return rank_candidates(request_candidates(prompt, count), target_aspect)
+
+
+def keep_candidates(candidates, images_folder, prompt=None):
+    """Stores candidates in the library and indexes them with their prompt. Returns their paths."""
+    from image_catalog import get_catalog
+    store, catalog = get_image_store(images_folder), get_catalog(images_folder)
+    paths = []
+    for candidate in candidates:
+        stored = store.put_bytes(candidate.data)
+        catalog.add(stored.path, prompt=prompt, sha256=stored.sha256)
+        candidate.name = stored.name
+        paths.append(stored.path)
+    return paths
+
+
+def candidate_count(value=None):
+    """Validates a requested number of candidates; None means GENERATION_CANDIDATES (default 1)."""
+    if value is None:
+        value = Config.snapshot().number('GENERATION_CANDIDATES', 1)
+    if isinstance(value, bool):
+        raise ValueError("candidates must be a number")
+    count = int(value)
+    if not 1 <= count <= MAX_CANDIDATES:
+        raise ValueError(f"candidates must be between 1 and {MAX_CANDIDATES}")
+    return count
+
+
+def keep_all_candidates():
+    return Config.snapshot().flag('CANDIDATES_KEEP_ALL')
@@ -0,0 +1,320 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from PIL import Image
+from config import Config
+from image_store import hash_from_name, is_shard_folder
+
+logger = logging.getLogger('DynamicTV')
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+SORT_COLUMNS = ('created', 'name', 'size')
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# Directory mtime only changes when entries are added, removed or renamed, so
+# in-place rewrites are picked up by an occasional full rescan instead.
+FULL_SCAN_INTERVAL = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    created REAL NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    prompt TEXT,
+    sha256 TEXT,
+    phash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_images_created ON images (created, name);
+CREATE INDEX IF NOT EXISTS idx_images_size ON images (size, name);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def encode_cursor(value, name):
+    raw = json.dumps([value, name]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        value, name = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return value, name
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def hash_file(path):
+    """Returns the hex SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_image_info(path):
+    """Reads dimensions and format from the image header without decoding pixels."""
+    try:
+        with Image.open(path) as im:
+            return im.width, im.height, im.format
+    except Exception as e:
+        logger.warning(f"Could not read image header for {path}: {str(e)}")
+        return None, None, None
+
+
+class ImageCatalog:
+    """SQLite index of the images folder, kept current by incremental mtime scans."""
+
+    def __init__(self, images_folder, db_path, full_scan_interval=FULL_SCAN_INTERVAL):
+        self.images_folder = images_folder
+        self.db_path = db_path
+        self.full_scan_interval = full_scan_interval
+        self._lock = threading.Lock()
+        self._last_full_scan = 0.0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+            columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(images)")}
+            if 'sha256' not in columns:
+                self._conn.execute("ALTER TABLE images ADD COLUMN sha256 TEXT")
+            if 'phash' not in columns:
+                self._conn.execute("ALTER TABLE images ADD COLUMN phash TEXT")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value))
+        )
+
+    def _folders(self):
+        """The library root plus its content-store shard folders."""
+        folders = [('', self.images_folder)]
+        with os.scandir(self.images_folder) as it:
+            for entry in it:
+                if is_shard_folder(entry.name) and entry.is_dir():
+                    folders.append((f"{entry.name}/", entry.path))
+        return folders
+
+    def _signature(self, folders):
+        # Adding a file only touches the mtime of the folder it lands in
+        return ','.join(f"{prefix}{os.stat(path).st_mtime_ns}" for prefix, path in folders)
+
+    def refresh(self, force=False):
+        """Brings the index up to date. Costs one stat per folder when nothing changed."""
+        with self._lock:
+            folders = self._folders()
+            signature = self._signature(folders)
+            stale = time.monotonic() - self._last_full_scan > self.full_scan_interval
+            if not force and not stale and self._get_meta('dir_signature') == signature:
+                return
+            self._scan(folders)
+            with self._conn:
+                self._set_meta('dir_signature', signature)
+            self._last_full_scan = time.monotonic()
+
+    def _scan(self, folders):
+        known = {
+            row['name']: (row['mtime_ns'], row['size'])
+            for row in self._conn.execute("SELECT name, mtime_ns, size FROM images")
+        }
+        seen = set()
+        upserts = []
+        for prefix, folder in folders:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if not entry.name.lower().endswith(IMAGE_EXTENSIONS) or not entry.is_file():
+                        continue
+                    name = f"{prefix}{entry.name}"
+                    seen.add(name)
+                    st = entry.stat()
+                    if known.get(name) == (st.st_mtime_ns, st.st_size):
+                        continue
+                    width, height, fmt = read_image_info(entry.path)
+                    upserts.append((name, st.st_size, width, height, fmt,
+                                    getattr(st, 'st_birthtime', st.st_mtime), st.st_mtime_ns,
+                                    hash_from_name(name)))
+
+        removed = [(name,) for name in known.keys() - seen]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO images (name, size, width, height, format, created, mtime_ns, sha256) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET size = excluded.size, width = excluded.width, "
+                "height = excluded.height, format = excluded.format, mtime_ns = excluded.mtime_ns, "
+                "sha256 = excluded.sha256, phash = NULL",
+                upserts
+            )
+            self._conn.executemany("DELETE FROM images WHERE name = ?", removed)
+        if upserts or removed:
+            logger.info(f"Image catalog updated: {len(upserts)} added/changed, {len(removed)} removed")
+
+    def name_for(self, path):
+        """Catalog name of a file in the library, e.g. 'art.png' or 'ab/ab12...ef.png'."""
+        return os.path.relpath(path, self.images_folder).replace(os.sep, '/')
+
+    def path_for(self, name):
+        return os.path.join(self.images_folder, *name.split('/'))
+
+    def add(self, path, prompt=None, sha256=None):
+        """Indexes a newly written image immediately, optionally recording its prompt."""
+        name = self.name_for(path)
+        st = os.stat(path)
+        width, height, fmt = read_image_info(path)
+        sha256 = sha256 or hash_from_name(name) or hash_file(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO images (name, size, width, height, format, created, mtime_ns, prompt, sha256) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET size = excluded.size, width = excluded.width, "
+                "height = excluded.height, format = excluded.format, mtime_ns = excluded.mtime_ns, "
+                "prompt = COALESCE(excluded.prompt, images.prompt), sha256 = excluded.sha256, phash = NULL",
+                (name, st.st_size, width, height, fmt,
+                 getattr(st, 'st_birthtime', st.st_mtime), st.st_mtime_ns, prompt, sha256)
+            )
+
+    def content_hash(self, name):
+        """Returns the SHA-256 of an indexed image, hashing it on first request.
+
+        The hash is stored with the row and reused while the file's mtime and
+        size are unchanged. Returns None for names the catalog does not hold.
+        """
+        path = os.path.join(self.images_folder, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        # Content-addressed files carry their hash in the name
+        sha256 = hash_from_name(name)
+        if sha256:
+            return sha256
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime_ns, size, sha256 FROM images WHERE name = ?", (name,)
+            ).fetchone()
+        if row is None:
+            return None
+        if row['sha256'] and (row['mtime_ns'], row['size']) == (st.st_mtime_ns, st.st_size):
+            return row['sha256']
+
+        sha256 = hash_file(path)
+        if (row['mtime_ns'], row['size']) != (st.st_mtime_ns, st.st_size):
+            # Rewritten in place: reindex the whole row, or _scan would take it as up to date
+            self.add(path, sha256=sha256)
+            return sha256
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE images SET sha256 = ? WHERE name = ?", (sha256, name))
+        return sha256
+
+    def missing_phashes(self, limit=None):
+        """Names of indexed images whose perceptual hash has not been computed yet."""
+        query = "SELECT name FROM images WHERE phash IS NULL ORDER BY name"
+        params = ()
+        if limit:
+            query += " LIMIT ?"
+            params = (int(limit),)
+        with self._lock:
+            return [row['name'] for row in self._conn.execute(query, params)]
+
+    def set_phashes(self, phashes):
+        """Stores perceptual hashes from a {name: hex} mapping; '' marks an unreadable image."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE images SET phash = ? WHERE name = ?",
+                [(value, name) for name, value in phashes.items()]
+            )
+
+    def phash_rows(self):
+        """Every image with a perceptual hash, with the fields duplicate handling ranks by."""
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                "SELECT name, phash, width, height, size, created, prompt FROM images WHERE phash != ''"
+            )]
+
+    def get(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM images WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def page(self, limit=DEFAULT_PAGE_SIZE, cursor=None, sort='created', order='desc'):
+        """Returns one page of images and the cursor for the next page (None at the end).
+
+        Uses keyset pagination on (sort column, name), so every page is an index
+        range scan regardless of how deep into the library it is.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Invalid sort field: {sort}")
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"Invalid sort order: {order}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        comparison = '<' if order == 'desc' else '>'
+        direction = order.upper()
+        if sort == 'name':
+            order_by = f"name {direction}"
+        else:
+            order_by = f"{sort} {direction}, name {direction}"
+
+        params = []
+        where = ''
+        if cursor:
+            value, name = decode_cursor(cursor)
+            if sort == 'name':
+                where = f"WHERE name {comparison} ?"
+                params.append(name)
+            else:
+                where = f"WHERE ({sort}, name) {comparison} (?, ?)"
+                params.extend([value, name])
+
+        query = f"SELECT * FROM images {where} ORDER BY {order_by} LIMIT ?"
+        params.append(limit + 1)
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute(query, params)]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last[sort], last['name'])
+        return rows, next_cursor
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(images_folder=None):
+    """Returns the shared catalog for the images folder, creating it on first use."""
+    images_folder = os.path.abspath(images_folder or Config.get_env('IMAGES_FOLDER'))
+    with _catalogs_lock:
+        catalog = _catalogs.get(images_folder)
+        if catalog is None:
+            db_path = Config.get_env('CATALOG_PATH') or os.path.join(images_folder, '.catalog.sqlite3')
+            catalog = ImageCatalog(images_folder, db_path)
+            _catalogs[images_folder] = catalog
+        return catalog
@@ -1,30 +1,118 @@
-import os
+import logging
 import requests
-from datetime import datetime
+from http_client import get_http_client
+from image_store import get_image_store
+from telemetry import traced
 
+logger = logging.getLogger('DynamicTV')
+
+CHUNK_SIZE = 64 * 1024
+
+
+@traced('download')
 def fetch_image(image_url, save_folder):
     """
-    Downloads an image from a URL and saves it to the specified folder.
-    Returns the destination path.
+    Downloads an image from a URL into the content-addressed store at save_folder.
+    Returns the stored path; downloading an image already in the store returns the existing copy.
+    """
+    try:
+        response = get_http_client().get(image_url, endpoint="image.download", stream=True)
+        response.raise_for_status()
+
+        with get_image_store(save_folder).writer() as writer:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if chunk:
+                    writer.write(chunk)
+
+        logger.info(f"Image downloaded and saved locally at: {writer.result.path}")
+        return writer.result.path
+
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"Failed to download image from URL: {str(e)}")
+
+
+@traced('download')
+def fetch_image_data(image_url, archive_folder=None):
     """
-    if not os.path.exists(save_folder):
-        os.makedirs(save_folder)
+    Streams an image from a URL into a single in-memory buffer.
+
+    The body is read once, straight into a buffer sized from Content-Length
+    when the server sends one. If archive_folder is given, each chunk is also
+    written to disk as it arrives, so the archive copy costs no second pass.
 
+    Returns:
+        tuple: (memoryview over the image bytes, archive path or None)
+    """
     try:
-        response = requests.get(image_url, stream=True)
+        response = get_http_client().get(image_url, endpoint="image.download", stream=True)
         response.raise_for_status()
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"generated_image_{timestamp}.jpg"
-        destination_path = os.path.join(save_folder, filename)
+        try:
+            expected = int(response.headers.get('Content-Length') or 0)
+        except ValueError:
+            expected = 0
+        # Compressed bodies decode to more than Content-Length, so only trust it for identity encoding
+        if response.headers.get('Content-Encoding', 'identity') != 'identity':
+            expected = 0
+        buffer = bytearray(expected)
+        received = 0
 
-        with open(destination_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        writer = get_image_store(archive_folder).writer() if archive_folder else None
+        try:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if not chunk:
+                    continue
+                end = received + len(chunk)
+                if end <= len(buffer):
+                    buffer[received:end] = chunk
+                else:
+                    # No or short Content-Length: grow in place
+                    del buffer[received:]
+                    buffer += chunk
+                received = end
+                if writer:
+                    writer.write(chunk)
+        except BaseException:
+            if writer:
+                writer.abort()
+            raise
 
-        print("Image downloaded and saved locally at:", destination_path)
-        return destination_path
+        destination_path = None
+        if writer:
+            destination_path = writer.commit().path
+            logger.info(f"Image downloaded and saved locally at: {destination_path}")
+
+        return memoryview(buffer)[:received], destination_path
 
     except requests.exceptions.RequestException as e:
-        raise Exception(f"Failed to download image from URL: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Failed to download image from URL: {str(e)}")
+
+
+@traced('download')
+async def fetch_image_data_async(image_url, archive_folder=None):
+    """
+    Non-blocking fetch_image_data for the ASGI server; needs httpx.
+
+    The body arrives as a single bytes object, which the transcoder shares
+    without copying. The optional archive copy is written off the event loop.
+
+    Returns:
+        tuple: (image bytes, archive path or None)
+    """
+    import asyncio
+    import httpx
+    from http_client import get_async_http_client
+
+    try:
+        response = await get_async_http_client().get(image_url, endpoint="image.download")
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        raise Exception(f"Failed to download image from URL: {str(e)}")
+
+    data = response.content
+    destination_path = None
+    if archive_folder:
+        stored = await asyncio.to_thread(get_image_store(archive_folder).put_bytes, data)
+        destination_path = stored.path
+        logger.info(f"Image downloaded and saved locally at: {destination_path}")
+    return data, destination_path
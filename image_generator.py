@@ -1,74 +1,183 @@
 #!/usr/bin/env python3
-import os
 import requests
-from prompt_generator import PromptGenerator
+from config import Config
+from http_client import get_http_client
+from prompt_pool import get_prompt_pool
+from rate_limiter import RateLimitError, UpstreamRateLimited, flight_key, get_rate_limiter, parse_retry_after
 from logger import setup_logger
+from telemetry import traced
 
 # Set up logger
 logger = setup_logger()
 
 # Constants
 NEGATIVE_PROMPT = "ugly, blurry, low quality, distorted, deformed"
+# Generation routinely takes tens of seconds, so allow longer than the default read timeout
+GENERATE_TIMEOUT = 120
 
 def get_random_prompt():
-    generator = PromptGenerator()
-    prompt = generator.generate_prompt()
+    prompt = get_prompt_pool().get()
     if not prompt:
         logger.error("Failed to generate prompt")
         return None
     return prompt
 
-def generate_image_api(prompt):
+IDEOGRAM_GENERATE_URL = "https://api.ideogram.ai/v1/ideogram-v3/generate"
+
+
+def ideogram_generate_url():
+    """The generate endpoint; IDEOGRAM_API_URL points it elsewhere, e.g. at a local stand-in."""
+    return Config.snapshot().get('IDEOGRAM_API_URL') or IDEOGRAM_GENERATE_URL
+
+
+def generate_params(prompt):
+    """The form fields that determine what Ideogram renders for a prompt."""
+    settings = Config.snapshot()
+    return {
+        'prompt': prompt,
+        'magic_prompt': "AUTO",
+        'negative_prompt': settings.get('NEGATIVE_PROMPT', NEGATIVE_PROMPT),
+        'style_type': settings.get('IDEOGRAM_STYLE_TYPE', 'AUTO'),
+        'aspect_ratio': settings.get('IDEOGRAM_ASPECT_RATIO', '16x9')
+    }
+
+
+def build_generate_request(prompt, num_images=1):
+    """Returns the keyword arguments for an Ideogram generate call, shared by the sync and async clients."""
+    # Check if API key is set
+    settings = Config.snapshot()
+    api_key = settings.get('IDEOGRAM_API_KEY')
+    if not api_key:
+        logger.error("IDEOGRAM_API_KEY is not set in environment variables")
+        raise ValueError("IDEOGRAM_API_KEY is not configured")
+
+    # Prepare request payload as files
+    files_payload = {name: (None, value) for name, value in generate_params(prompt).items()}
+    if num_images > 1:
+        files_payload['num_images'] = (None, str(num_images))
+    return {
+        'endpoint': "ideogram.generate",
+        'timeout': settings.number('IDEOGRAM_TIMEOUT', GENERATE_TIMEOUT),
+        'headers': {
+            "Api-Key": api_key
+            # Content-Type is automatically set to multipart/form-data when using 'files'
+        },
+        'files': files_payload
+    }
+
+
+def image_urls_from_response(response):
+    """Extracts the image URLs from an Ideogram response (requests or httpx)."""
+    # Log the response status
+    logger.info(f"Ideogram API response status: {response.status_code}")
+
+    if response.status_code == 404:
+        logger.error("Ideogram API endpoint not found (404)")
+        raise Exception("Ideogram API endpoint not found. Please check the API URL.")
+
+    if response.status_code == 429:
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        get_rate_limiter('ideogram').throttled(retry_after)
+        raise UpstreamRateLimited("Ideogram rate limit reached, try again later", 'ideogram', retry_after)
+
+    response.raise_for_status()
+
+    result = response.json()
+    image_urls = [item.get("url") for item in result.get("data") or [] if item.get("url")]
+    if not image_urls:
+        logger.error("No image URL in response")
+        return []
+
+    logger.info(f"Successfully generated image URLs: {', '.join(image_urls)}")
+    return image_urls
+
+
+def image_url_from_response(response):
+    """The first image URL in an Ideogram response, or None."""
+    image_urls = image_urls_from_response(response)
+    return image_urls[0] if image_urls else None
+
+
+def generate_image_api(prompt, coalesce=True):
+    image_urls = generate_image_urls(prompt, coalesce=coalesce)
+    return image_urls[0] if image_urls else None
+
+
+def record_render_usage(limiter, image_urls):
+    price = Config.snapshot().number('IDEOGRAM_COST_PER_IMAGE', 0)
+    limiter.record_usage(len(image_urls), len(image_urls) * price)
+
+
+@traced('generate')
+def generate_image_urls(prompt, count=1, coalesce=True):
+    """Renders count images of prompt in a single Ideogram request.
+
+    The request waits its turn under the Ideogram rate limit. With coalesce,
+    a call identical to one already in flight shares that call's result.
+
+    Returns their URLs, which may be fewer than count.
+    """
     try:
-        # Check if API key is set
-        api_key = os.getenv('IDEOGRAM_API_KEY')
-        if not api_key:
-            logger.error("IDEOGRAM_API_KEY is not set in environment variables")
-            raise ValueError("IDEOGRAM_API_KEY is not configured")
+        request_kwargs = build_generate_request(prompt, count)
+        if not prompt:
+            return []
 
+        url = ideogram_generate_url()
+        limiter = get_rate_limiter('ideogram')
+
+        def render():
+            logger.info(f"Using prompt: {prompt}")
+            logger.info("Making request to Ideogram API")
+            response = get_http_client().post(url, limiter=limiter, **request_kwargs)
+            image_urls = image_urls_from_response(response)
+            record_render_usage(limiter, image_urls)
+            return image_urls
+
+        key = flight_key(url, request_kwargs['files']) if coalesce else None
+        return list(limiter.call(key, render))
+
+    except RateLimitError:
+        raise
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Request to Ideogram API failed: {str(e)}")
+        raise Exception(f"Failed to connect to Ideogram API: {str(e)}")
+    except ValueError as e:
+        logger.error(f"Configuration error: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error in image generation: {str(e)}")
+        raise Exception(f"Image generation failed: {str(e)}")
+
+
+@traced('generate')
+async def generate_image_api_async(prompt, coalesce=True):
+    """Non-blocking generate_image_api for the ASGI server; needs httpx."""
+    import httpx
+    from http_client import get_async_http_client
+
+    try:
+        request_kwargs = build_generate_request(prompt)
         if not prompt:
             return None
-            
-        logger.info(f"Using prompt: {prompt}")
-        
-        # Prepare request payload as files
-        files_payload = {
-            'prompt': (None, prompt),
-            'magic_prompt': (None, "AUTO"),
-            'negative_prompt': (None, os.getenv('NEGATIVE_PROMPT', NEGATIVE_PROMPT)),
-            'style_type': (None, os.getenv('IDEOGRAM_STYLE_TYPE', 'AUTO')),
-            'aspect_ratio': (None, os.getenv('IDEOGRAM_ASPECT_RATIO', '16x9'))
-        }
-
-        logger.info("Making request to Ideogram API")
-        response = requests.post(
-            "https://api.ideogram.ai/v1/ideogram-v3/generate",
-            headers={
-                "Api-Key": api_key
-                # Content-Type is automatically set to multipart/form-data by requests when using 'files'
-            },
-            files=files_payload
-        )
-
-        # Log the response status
-        logger.info(f"Ideogram API response status: {response.status_code}")
-        
-        if response.status_code == 404:
-            logger.error("Ideogram API endpoint not found (404)")
-            raise Exception("Ideogram API endpoint not found. Please check the API URL.")
-        
-        response.raise_for_status()
-        
-        result = response.json()
-        image_url = result.get("data", [{}])[0].get("url")
-        if not image_url:
-            logger.error("No image URL in response")
-            return None
-            
-        logger.info(f"Successfully generated image URL: {image_url}")
-        return image_url
-        
-    except requests.exceptions.RequestException as e:
+
+        url = ideogram_generate_url()
+        limiter = get_rate_limiter('ideogram')
+
+        async def render():
+            logger.info(f"Using prompt: {prompt}")
+            logger.info("Making request to Ideogram API")
+            response = await get_async_http_client().post(url, limiter=limiter, **request_kwargs)
+            image_urls = image_urls_from_response(response)
+            record_render_usage(limiter, image_urls)
+            return image_urls
+
+        key = flight_key(url, request_kwargs['files']) if coalesce else None
+        image_urls = await limiter.call_async(key, render)
+        return image_urls[0] if image_urls else None
+
+    except RateLimitError:
+        raise
+    except httpx.HTTPError as e:
         logger.error(f"Request to Ideogram API failed: {str(e)}")
         raise Exception(f"Failed to connect to Ideogram API: {str(e)}")
     except ValueError as e:
@@ -0,0 +1,275 @@
+import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from config import Config
+from image_catalog import get_catalog
+
+logger = logging.getLogger('DynamicTV')
+
+# pHash: 32x32 grayscale -> 2D DCT -> sign of the 8x8 lowest frequencies against their median
+HASH_INPUT = 32
+HASH_BLOCK = 8
+# Hamming distance (of 64 bits) at or below which two images count as near-duplicates
+DEFAULT_MAX_DISTANCE = 8
+BATCH_SIZE = 256
+DEFAULT_WORKERS = 4
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis, so a 2D DCT of X is D @ X @ D.T."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+DCT = _dct_matrix(HASH_INPUT)
+
+
+def load_pixels(path):
+    """Decodes an image straight to the 32x32 grayscale input of the hash. Returns None if unreadable."""
+    try:
+        with Image.open(path) as im:
+            # JPEG decodes at a reduced scale, which skips most of the work for large images
+            im.draft('L', (HASH_INPUT * 4, HASH_INPUT * 4))
+            im = im.convert('L').resize((HASH_INPUT, HASH_INPUT), Image.BILINEAR)
+            return np.asarray(im, dtype=np.float32)
+    except Exception as e:
+        logger.warning(f"Could not read {path} for perceptual hashing: {str(e)}")
+        return None
+
+
+def phash_pixels(pixels):
+    """Perceptual hashes for a stack of 32x32 grayscale images.
+
+    Args:
+        pixels (ndarray): Shape (N, 32, 32).
+
+    Returns:
+        list: N 64-bit hashes as ints.
+    """
+    coefficients = DCT @ pixels @ DCT.T
+    low = coefficients[:, :HASH_BLOCK, :HASH_BLOCK].reshape(len(pixels), -1)
+    # The DC term only tracks overall brightness, so it is left out of the median
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    packed = np.packbits(low > median, axis=1)
+    return [int(value) for value in packed.view('>u8').ravel()]
+
+
+def phash_files(paths, workers=DEFAULT_WORKERS):
+    """Returns {path: 16-hex-digit pHash}, with '' for files that could not be decoded."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pixels = list(executor.map(load_pixels, paths))
+    readable = [(path, array) for path, array in zip(paths, pixels) if array is not None]
+    result = {path: '' for path in paths}
+    if readable:
+        hashes = phash_pixels(np.stack([array for _, array in readable]))
+        for (path, _), value in zip(readable, hashes):
+            result[path] = f"{value:016x}"
+    return result
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes under Hamming distance.
+
+    A radius query only descends into children whose edge distance lies within
+    the radius of the query's distance to the node (triangle inequality), so
+    small-radius lookups touch a small fraction of the tree. Images sharing a
+    hash share a node.
+    """
+
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self._root is None:
+            self._root = (value, [item], {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Returns [(distance, item)] for every item within max_distance, nearest first."""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                found.extend((distance, item) for item in items)
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+def keeper_rank(row):
+    # Keep the copy with a known prompt, then the most pixels, then the biggest file, then the oldest
+    return (row['prompt'] is not None, (row['width'] or 0) * (row['height'] or 0), row['size'], -row['created'])
+
+
+class SimilarityIndex:
+    """Near-duplicate lookups over the image library.
+
+    Perceptual hashes are computed in batches for images the catalog has not
+    hashed yet and stored with their catalog rows, so each image is decoded
+    once. Lookups go through an in-memory BK-tree that is extended as images
+    are added and rebuilt when images are removed.
+    """
+
+    def __init__(self, catalog, max_distance=DEFAULT_MAX_DISTANCE, batch_size=BATCH_SIZE, workers=DEFAULT_WORKERS):
+        self.catalog = catalog
+        self.max_distance = max_distance
+        self.batch_size = batch_size
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._tree = BKTree()
+        self._hashes = {}
+        self._rows = {}
+
+    def refresh(self):
+        """Hashes new images and brings the tree up to date with the catalog."""
+        with self._lock:
+            self.catalog.refresh()
+            while True:
+                names = self.catalog.missing_phashes(limit=self.batch_size)
+                if not names:
+                    break
+                paths = {self.catalog.path_for(name): name for name in names}
+                hashed = phash_files(list(paths), self.workers)
+                self.catalog.set_phashes({paths[path]: value for path, value in hashed.items()})
+                logger.info(f"Perceptual hashes computed for {len(names)} images")
+
+            rows = {row['name']: row for row in self.catalog.phash_rows()}
+            hashes = {name: int(row['phash'], 16) for name, row in rows.items()}
+            # The tree can only grow, so removed or rehashed images mean a rebuild
+            if any(hashes.get(name) != value for name, value in self._hashes.items()):
+                self._tree = BKTree()
+                self._hashes = {}
+            for name in hashes.keys() - self._hashes.keys():
+                self._tree.add(hashes[name], name)
+            self._hashes = hashes
+            self._rows = rows
+
+    def phash(self, name):
+        return self._hashes.get(name)
+
+    def similar(self, name, max_distance=None):
+        """Returns [(distance, name)] of other images within max_distance of an indexed image."""
+        value = self._hashes.get(name)
+        if value is None:
+            raise KeyError(name)
+        return [(d, other) for d, other in self.find(value, max_distance) if other != name]
+
+    def find(self, value, max_distance=None):
+        """Returns [(distance, name)] of indexed images within max_distance of a 64-bit pHash."""
+        max_distance = self.max_distance if max_distance is None else max_distance
+        with self._lock:
+            return self._tree.search(value, max_distance)
+
+    def duplicate_groups(self, max_distance=None):
+        """Groups near-duplicates around the image of each group that is kept.
+
+        Keepers are picked best-first by keeper_rank and each claims the unclaimed
+        images within max_distance of itself, so every duplicate is close to its
+        keeper; a chain of small steps never pulls in an image far from it.
+
+        Returns:
+            list: [{'keep': name, 'duplicates': [names]}], largest groups first.
+        """
+        max_distance = self.max_distance if max_distance is None else max_distance
+        with self._lock:
+            rows = dict(self._rows)
+            hashes = dict(self._hashes)
+            ranked = sorted(hashes, key=lambda name: (keeper_rank(rows[name]), name), reverse=True)
+            claimed = set()
+            groups = []
+            for name in ranked:
+                if name in claimed:
+                    continue
+                claimed.add(name)
+                duplicates = [other for _, other in self._tree.search(hashes[name], max_distance)
+                              if other not in claimed]
+                claimed.update(duplicates)
+                if duplicates:
+                    groups.append({'keep': name, 'duplicates': sorted(duplicates)})
+        groups.sort(key=lambda group: (-len(group['duplicates']), group['keep']))
+        return groups
+
+    def remove_duplicates(self, max_distance=None, dry_run=True):
+        """Deletes the duplicates of each near-duplicate group, leaving its keeper.
+
+        Returns:
+            list: Names removed (or that would be removed on a dry run).
+        """
+        removed = [name for group in self.duplicate_groups(max_distance) for name in group['duplicates']]
+        if dry_run or not removed:
+            return removed
+        for name in removed:
+            try:
+                os.remove(self.catalog.path_for(name))
+            except FileNotFoundError:
+                pass
+        logger.info(f"Removed {len(removed)} near-duplicate images")
+        self.catalog.refresh(force=True)
+        self.refresh()
+        return removed
+
+    def choose_distinct(self, recent, max_distance=None, rng=random):
+        """Picks a random library image that is not a near-duplicate of any recently shown one.
+
+        Args:
+            recent (list): Names shown recently; unknown names are ignored.
+
+        Returns:
+            str: Name of the chosen image, or None when every image is too similar.
+        """
+        excluded = set(recent)
+        for name in recent:
+            value = self._hashes.get(name)
+            if value is not None:
+                excluded.update(other for _, other in self.find(value, max_distance))
+        with self._lock:
+            candidates = [name for name in self._hashes if name not in excluded]
+        return rng.choice(candidates) if candidates else None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_similarity_index(images_folder=None):
+    """Returns the shared near-duplicate index for the images folder."""
+    images_folder = os.path.abspath(images_folder or Config.get_env('IMAGES_FOLDER'))
+    with _indexes_lock:
+        index = _indexes.get(images_folder)
+        if index is None:
+            index = SimilarityIndex(
+                get_catalog(images_folder),
+                max_distance=int(Config.get_env('DUPLICATE_MAX_DISTANCE', DEFAULT_MAX_DISTANCE)),
+            )
+            _indexes[images_folder] = index
+        return index
@@ -0,0 +1,188 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import uuid
+from config import Config
+
+logger = logging.getLogger('DynamicTV')
+
+# Leading bytes of each supported format, mapped to the extension it is stored under
+FORMAT_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+SNIFF_BYTES = 16
+SHARD_PATTERN = re.compile(r'^[0-9a-f]{2}$')
+CONTENT_NAME_PATTERN = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{64})\.(png|jpg|gif|webp)$')
+TMP_FOLDER = '.tmp'
+COPY_CHUNK = 1024 * 1024
+
+
+def sniff_format(header):
+    """Returns the file extension for image data from its first bytes.
+
+    Raises:
+        ValueError: If the bytes are not a PNG, JPEG, GIF or WebP image.
+    """
+    header = bytes(header[:SNIFF_BYTES])
+    for signature, extension in FORMAT_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    raise ValueError("Unsupported image format")
+
+
+def content_name(sha256, extension):
+    """Library-relative name of a stored image, e.g. 'ab/ab12...ef.png'."""
+    return f"{sha256[:2]}/{sha256}.{extension}"
+
+
+def hash_from_name(name):
+    """Returns the SHA-256 encoded in a content-addressed name, or None for other names."""
+    match = CONTENT_NAME_PATTERN.match(name)
+    return match.group(2) if match else None
+
+
+def is_shard_folder(name):
+    return bool(SHARD_PATTERN.match(name))
+
+
+class StoredImage:
+    def __init__(self, name, path, sha256, extension, created):
+        self.name = name
+        self.path = path
+        self.sha256 = sha256
+        self.extension = extension
+        # False when identical content was already in the store
+        self.created = created
+
+
+class ImageWriter:
+    """Streams one image into the store, hashing it as the chunks arrive.
+
+    Call commit() to publish the image or abort() to discard it; as a
+    context manager it does one or the other depending on how the block exits.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.result = None
+        self._digest = hashlib.sha256()
+        self._header = b''
+        self._tmp_path = store._tmp_path()
+        self._file = open(self._tmp_path, 'wb')
+
+    def write(self, chunk):
+        if len(self._header) < SNIFF_BYTES:
+            self._header += bytes(chunk[:SNIFF_BYTES - len(self._header)])
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self):
+        """Publishes the written image and returns its StoredImage."""
+        self._file.close()
+        try:
+            self.result = self.store._publish(self._tmp_path, self._digest.hexdigest(), sniff_format(self._header))
+        finally:
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+        return self.result
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+class ImageStore:
+    """Content-addressed image library.
+
+    Every image is stored once, under its SHA-256 in a two-character shard
+    folder with the extension of its sniffed format, e.g.
+    'ab/ab12...ef.png'. Writes go to a temporary file on the same filesystem
+    and are renamed into place, so readers never see a partial image and two
+    writers of the same content simply converge on one file. Metadata lives
+    in the image catalog, which is keyed by the same relative names.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(root, TMP_FOLDER), exist_ok=True)
+
+    def path_for(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    def _tmp_path(self):
+        return os.path.join(self.root, TMP_FOLDER, f"{uuid.uuid4().hex}.tmp")
+
+    def _publish(self, tmp_path, sha256, extension):
+        name = content_name(sha256, extension)
+        path = self.path_for(name)
+        if os.path.exists(path):
+            return StoredImage(name, path, sha256, extension, created=False)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        logger.info(f"Stored image {name}")
+        return StoredImage(name, path, sha256, extension, created=True)
+
+    def writer(self):
+        """Returns an ImageWriter for streaming an image into the store."""
+        return ImageWriter(self)
+
+    def put_bytes(self, data):
+        """Stores in-memory image data (bytes or any buffer). Returns a StoredImage."""
+        with self.writer() as writer:
+            writer.write(data)
+        return writer.result
+
+    def put_file(self, source_path, move=True):
+        """Stores an existing file, moving it into place when possible. Returns a StoredImage."""
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            extension = sniff_format(f.read(SNIFF_BYTES))
+            f.seek(0)
+            for chunk in iter(lambda: f.read(COPY_CHUNK), b''):
+                digest.update(chunk)
+
+        tmp_path = self._tmp_path()
+        try:
+            if move:
+                # shutil.move falls back to copy + delete across filesystems
+                shutil.move(source_path, tmp_path)
+            else:
+                shutil.copyfile(source_path, tmp_path)
+            return self._publish(tmp_path, digest.hexdigest(), extension)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_image_store(images_folder=None):
+    """Returns the content-addressed store rooted at the images folder."""
+    images_folder = os.path.abspath(images_folder or Config.get_env('IMAGES_FOLDER'))
+    with _stores_lock:
+        store = _stores.get(images_folder)
+        if store is None:
+            store = ImageStore(images_folder)
+            _stores[images_folder] = store
+        return store
@@ -0,0 +1,280 @@
+import contextvars
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from werkzeug.security import safe_join
+from config import Config
+from telemetry import current_trace_id, span
+
+logger = logging.getLogger('DynamicTV')
+
+JOB_TYPES = ('generate', 'push', 'generate-push')
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PENDING = 32
+DEFAULT_MAX_RETAINED = 200
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue already holds its maximum number of pending jobs."""
+
+
+def archive_folder_for_pushes():
+    """Returns IMAGES_FOLDER if remote images pushed to the TV should also be kept, else None."""
+    if Config.snapshot().flag('ARCHIVE_PUSHED_IMAGES'):
+        return Config.get_env('IMAGES_FOLDER')
+    return None
+
+
+def local_image_path(image_url):
+    """Maps a gallery URL such as /images/name.png?v=abc to its file in IMAGES_FOLDER."""
+    filename = image_url[len('/images/'):].split('?', 1)[0]
+    image_path = safe_join(Config.get_env('IMAGES_FOLDER'), filename)
+    if not image_path:
+        raise ValueError("Invalid image URL")
+    return image_path
+
+
+class LiveBackend:
+    """Runs pipeline stages against Ideogram and the real TV."""
+
+    def generate_image(self, prompt, force=False, candidates=1, keep_all=None):
+        from generation_cache import generate_image_cached
+        return generate_image_cached(prompt, force, candidates, keep_all)
+
+    def download(self, image_url, archive_folder=None):
+        from image_fetcher import fetch_image_data
+        return fetch_image_data(image_url, archive_folder)
+
+    def push(self, image_path, tv_ip):
+        from tv_pusher import push_image_to_tv
+        return push_image_to_tv(image_path, tv_ip)
+
+    def push_data(self, image_data, tv_ip, label):
+        from tv_pusher import push_image_data_to_tv
+        return push_image_data_to_tv(image_data, tv_ip, label)
+
+
+class LocalBackend:
+    """Network-free stand-in that fakes each stage with a configurable delay.
+
+    Select it with JOB_BACKEND=local to exercise the job subsystem without
+    Ideogram credentials or a TV on the network.
+    """
+
+    def __init__(self, generate_delay=0.0, download_delay=0.0, push_delay=0.0):
+        self.generate_delay = generate_delay
+        self.download_delay = download_delay
+        self.push_delay = push_delay
+        self.pushed = []
+
+    def generate_image(self, prompt, force=False, candidates=1, keep_all=None):
+        if not prompt:
+            return {'imageUrl': None, 'cached': False}
+        time.sleep(self.generate_delay)
+        return {'imageUrl': f"local://{uuid.uuid4().hex}.png", 'cached': False}
+
+    def download(self, image_url, archive_folder=None):
+        from PIL import Image
+        time.sleep(self.download_delay)
+        output = io.BytesIO()
+        Image.new('RGB', (160, 90), (40, 80, 120)).save(output, 'PNG')
+        destination_path = None
+        if archive_folder:
+            os.makedirs(archive_folder, exist_ok=True)
+            destination_path = os.path.join(archive_folder, image_url.rsplit('/', 1)[-1])
+            with open(destination_path, 'wb') as f:
+                f.write(output.getbuffer())
+        return output.getbuffer(), destination_path
+
+    def push(self, image_path, tv_ip):
+        if not os.path.exists(image_path):
+            raise ValueError(f"Image file not found: {image_path}")
+        return self._record_push(image_path, tv_ip)
+
+    def push_data(self, image_data, tv_ip, label):
+        if len(image_data) == 0:
+            raise ValueError("Image file is empty")
+        return self._record_push(label, tv_ip)
+
+    def _record_push(self, label, tv_ip):
+        time.sleep(self.push_delay)
+        self.pushed.append((label, tv_ip))
+        return {'contentId': f"MY_F{len(self.pushed):04d}", 'uploaded': True}
+
+
+def create_backend(name=None):
+    name = (name or Config.get_env('JOB_BACKEND', 'live')).lower()
+    if name == 'local':
+        return LocalBackend()
+    if name == 'live':
+        return LiveBackend()
+    raise ValueError(f"Unknown job backend: {name}")
+
+
+class Job:
+    def __init__(self, job_type, params):
+        self.id = uuid.uuid4().hex
+        self.type = job_type
+        self.params = params
+        self.status = 'queued'
+        self.stage = None
+        self.stages = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # Trace of the request that submitted the job
+        self.trace_id = current_trace_id()
+
+    @contextmanager
+    def track_stage(self, name):
+        """Records wall-clock timing for one pipeline stage."""
+        entry = {'name': name, 'status': 'running', 'durationMs': None}
+        self.stage = name
+        self.stages.append(entry)
+        start = time.perf_counter()
+        try:
+            yield
+            entry['status'] = 'succeeded'
+        except Exception:
+            entry['status'] = 'failed'
+            raise
+        finally:
+            entry['durationMs'] = round((time.perf_counter() - start) * 1000, 1)
+
+    @property
+    def done(self):
+        return self.status in ('succeeded', 'failed')
+
+    def to_dict(self):
+        return {
+            'jobId': self.id,
+            'type': self.type,
+            'status': self.status,
+            'stage': self.stage,
+            'stages': [dict(stage) for stage in self.stages],
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'traceId': self.trace_id,
+        }
+
+
+class JobQueue:
+    """Runs generate/download/push pipelines on a bounded worker pool."""
+
+    def __init__(self, backend, max_workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING,
+                 max_retained=DEFAULT_MAX_RETAINED):
+        self.backend = backend
+        self.max_pending = max_pending
+        self.max_retained = max_retained
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job_type, params):
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {job_type}")
+        self._validate(job_type, params)
+
+        job = Job(job_type, params)
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if not j.done)
+            if pending >= self.max_pending:
+                raise QueueFullError("Too many jobs in progress, try again later")
+            self._jobs[job.id] = job
+            self._prune()
+        # Run in a copy of the caller's context so the job's spans join the request's trace
+        self._executor.submit(contextvars.copy_context().run, self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _validate(self, job_type, params):
+        if job_type in ('generate', 'generate-push') and not params.get('prompt'):
+            raise ValueError("No prompt provided")
+        if job_type == 'push' and not params.get('imageUrl'):
+            raise ValueError("Invalid image URL")
+        if job_type in ('push', 'generate-push') and not params.get('tvIp'):
+            raise ValueError("TV IP address is required")
+
+    def _prune(self):
+        # Caller holds the lock. Forget the oldest finished jobs first.
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_retained)]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        with span('job', jobId=job.id, type=job.type):
+            self._run_job(job)
+
+    def _run_job(self, job):
+        job.status = 'running'
+        job.started = time.time()
+        try:
+            if job.type == 'generate':
+                job.result = self._generate(job, job.params)
+            elif job.type == 'push':
+                push_result = self._push(job, job.params['imageUrl'], job.params['tvIp'])
+                job.result = {'imageUrl': job.params['imageUrl'], **push_result}
+            else:
+                generated = self._generate(job, job.params)
+                push_result = self._push(job, generated['imageUrl'], job.params['tvIp'])
+                job.result = {**generated, **push_result}
+            job.status = 'succeeded'
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.type}) failed in stage {job.stage}: {str(e)}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished = time.time()
+
+    def _generate(self, job, params):
+        with job.track_stage('generate'):
+            result = self.backend.generate_image(params['prompt'], bool(params.get('force')),
+                                                 params.get('candidates') or 1, params.get('keepAll'))
+            if not result.get('imageUrl'):
+                raise ValueError("Failed to generate image")
+        return result
+
+    def _push(self, job, image_url, tv_ip):
+        if image_url.startswith('/images/'):
+            image_path = local_image_path(image_url)
+            with job.track_stage('push'):
+                return self.backend.push(image_path, tv_ip) or {}
+
+        # Remote images are streamed into memory and handed straight to the TV
+        with job.track_stage('download'):
+            image_data, _ = self.backend.download(image_url, archive_folder_for_pushes())
+        with job.track_stage('push'):
+            return self.backend.push_data(image_data, tv_ip, image_url) or {}
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Returns the process-wide job queue configured from the environment."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(
+                create_backend(),
+                max_workers=int(Config.get_env('JOB_WORKERS', DEFAULT_WORKERS)),
+                max_pending=int(Config.get_env('JOB_MAX_PENDING', DEFAULT_MAX_PENDING)),
+            )
+        return _queue
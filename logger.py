@@ -1,20 +1,129 @@
+import atexit
+import json
 import logging
+import queue
 import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import Config
+from telemetry import current_trace_id
+
+LOGGER_NAME = 'DynamicTV'
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_LOG_FILE = 'dynamic_tv.log'
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_QUEUE_SIZE = 10000
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        if getattr(record, 'trace_id', None):
+            entry['traceId'] = record.trace_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener thread and never waits on a full queue.
+
+    The message is rendered on the calling thread, since the arguments and the
+    current trace may change before the listener gets to it. When the queue is
+    full, the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.trace_id = current_trace_id()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def create_handlers(log_file=DEFAULT_LOG_FILE, log_format='text', max_bytes=DEFAULT_MAX_BYTES,
+                    backup_count=DEFAULT_BACKUP_COUNT, stream=None):
+    """Console handler plus, if log_file is set, a size-capped rotating file handler."""
+    formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(stream or sys.stdout)]
+    if log_file:
+        handlers.append(RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                            encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def attach_queue_logging(logger, handlers, queue_size=DEFAULT_QUEUE_SIZE):
+    """Routes logger through a bounded queue to handlers on a background thread. Returns the listener."""
+    log_queue = queue.Queue(maxsize=queue_size)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    logger.addHandler(NonBlockingQueueHandler(log_queue))
+    return listener
+
+
+def shutdown_logger():
+    """Flushes queued records and closes the handlers."""
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        logger = logging.getLogger(LOGGER_NAME)
+        for handler in [h for h in logger.handlers if isinstance(h, NonBlockingQueueHandler)]:
+            logger.removeHandler(handler)
+        _listener = None
+
 
 def setup_logger():
-    logger = logging.getLogger('DynamicTV')
-    logger.setLevel(logging.INFO)
-    
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    
-    # Console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    # File handler
-    file_handler = logging.FileHandler('dynamic_tv.log')
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    
-    return logger
\ No newline at end of file
+    """Configures the DynamicTV logger on first call and returns it; later calls change nothing.
+
+    Environment: LOG_LEVEL, LOG_FORMAT (text or json), LOG_FILE ('' for console
+    only), LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE_SIZE.
+    """
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    with _setup_lock:
+        if _listener is None:
+            logger.setLevel(Config.get_env('LOG_LEVEL', 'INFO').upper())
+            handlers = create_handlers(
+                log_file=Config.get_env('LOG_FILE', DEFAULT_LOG_FILE),
+                log_format=Config.get_env('LOG_FORMAT', 'text').lower(),
+                max_bytes=int(Config.get_env('LOG_MAX_BYTES', DEFAULT_MAX_BYTES)),
+                backup_count=int(Config.get_env('LOG_BACKUP_COUNT', DEFAULT_BACKUP_COUNT)),
+            )
+            _listener = attach_queue_logging(
+                logger, handlers, queue_size=int(Config.get_env('LOG_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)))
+            atexit.register(shutdown_logger)
+    return logger
@@ -1,45 +1,49 @@
 #!/usr/bin/env python3
-import os
-from pathlib import Path
+import argparse
 from config import Config
 from logger import setup_logger
-from image_generator import generate_image_api
-from image_fetcher import fetch_image
-from tv_pusher import push_image_to_tv
+from image_buffer import get_image_buffer
+from scheduler import create_scheduler
 
 logger = setup_logger()
 
 def main():
+    parser = argparse.ArgumentParser(description="Rotate AI-generated art on Samsung Frame TVs")
+    parser.add_argument('--once', action='store_true',
+                        help="Rotate every configured TV once and exit instead of running the scheduler")
+    args = parser.parse_args()
+
     try:
         # Validate environment
         Config.validate_env()
-        
-        # Generate and process image
-        temp_image_path = generate_image_api()
-        if not temp_image_path or not os.path.exists(temp_image_path):
-            logger.error("Failed to generate image")
+        scheduler = create_scheduler()
+        if not scheduler.schedules:
+            logger.error("No TVs configured: set TV_IP or TV_SCHEDULES in environment variables")
             return
-            
-        logger.info(f"Image generated successfully at: {temp_image_path}")
-        logger.info(f"Saving to folder: {Config.get_env('IMAGES_FOLDER')}")
-        
-        try:
-            saved_image_path = fetch_image(temp_image_path, Config.get_env('IMAGES_FOLDER'))
-            push_image_to_tv(saved_image_path)
-            
-            # Cleanup temporary file
-            os.remove(temp_image_path)
-            logger.info("Temporary file cleaned up")
-            
+
+        buffer = get_image_buffer()
+        if args.once:
+            scheduler.run_all_now()
+            scheduler.stop()
             logger.info("Process completed successfully!")
-            
+
+            # Render ahead for the next run now that the TVs are updated
+            buffer.top_up()
+            logger.info(f"Image buffer holds {len(buffer)} images for upcoming rotations")
+            return
+
+        # Keep images rendered ahead in the background while the daemon runs
+        buffer.start()
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            logger.info("Stopping rotation scheduler")
         finally:
-            # Ensure temp file cleanup even if TV push fails
-            if os.path.exists(temp_image_path):
-                os.remove(temp_image_path)
-                
+            scheduler.stop(wait=False)
+            buffer.stop()
+
     except Exception as e:
         logger.error(f"Error: {str(e)}", exc_info=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,75 +1,156 @@
-import os
-import requests
-from dotenv import load_dotenv
+import json
+import logging
+import re
+from config import Config
+from http_client import get_http_client
+from rate_limiter import RateLimitError, UpstreamRateLimited, flight_key, get_rate_limiter, parse_retry_after
+from telemetry import traced
+
+logger = logging.getLogger('DynamicTV')
+
+OPENROUTER_VARS = ('OPENROUTER_API_KEY', 'OPENROUTER_MODEL', 'OPENROUTER_ENDPOINT')
+
+SYSTEM_PROMPT = "You are an expert wallpaper creator specializing in realistic and artistic photography. Your task is to generate a single prompt for image generation that describes a beautiful scene, landscape, or cityscape. Use a mix of evocative descriptions (lighting, mood, artistic vision) and occasional technical or compositional details to create visually stunning and varied outputs. Ensure each prompt reflects a professional fine art photography style.Provide only the prompt itself without any intro or explanations."
+
+BATCH_SYSTEM_PROMPT = "You are an expert wallpaper creator specializing in realistic and artistic photography. Your task is to generate prompts for image generation that each describe a beautiful scene, landscape, or cityscape. Use a mix of evocative descriptions (lighting, mood, artistic vision) and occasional technical or compositional details to create visually stunning and varied outputs. Ensure each prompt reflects a professional fine art photography style. Make every prompt clearly different from the others in subject, light and palette. Respond with only a JSON array of strings, one prompt per element, without any intro or explanations."
+
+TEMPLATE_PROMPT = "[Choose from: Create / Design / Imagine] a [choose from: serene / vibrant / dramatic / peaceful / moody] [choose from: photograph / image / scene] of a [choose from: bustling city street / tranquil forest glade / sunlit coastal village / moonlit desert dune / foggy mountain pass / rainy urban alleyway / futuristic skyline / secluded beach cove]. The light is [choose from: soft and diffused / harsh and dramatic / warm and golden / cool and misty], evoking a sense of [choose from: mystery / wonder / calm / energy]. Composition follows [choose from: the rule of thirds / leading lines / symmetry / negative space], emphasizing [choose from: the horizon / a central subject / depth / balance]. The color palette is [choose from: muted earth tones / vibrant and saturated / cool and calming / warm and inviting]. [Optional: Add a detail like ‘A lone figure stands in the distance’ or ‘Reflections glow on wet pavement’]. Professional fine art photography."
+
+def normalize_prompt(prompt):
+    """Normalizes a prompt for duplicate detection."""
+    return re.sub(r'\s+', ' ', prompt).strip().lower()
+
+
+def parse_prompt_list(content):
+    """Extracts prompts from a model reply: a JSON array, or one prompt per line as a fallback."""
+    content = content.strip()
+    # Models sometimes wrap the array in a markdown code fence
+    fenced = re.match(r'^```(?:json)?\s*(.*?)\s*```$', content, re.DOTALL)
+    if fenced:
+        content = fenced.group(1)
+
+    try:
+        items = json.loads(content)
+        if isinstance(items, list):
+            candidates = [item for item in items if isinstance(item, str)]
+        else:
+            candidates = []
+    except ValueError:
+        # Strip list markers such as "1.", "2)", "-" or "*"
+        candidates = [re.sub(r'^\s*(?:\d+[.)]|[-*•])\s*', '', line) for line in content.splitlines()]
+
+    prompts = []
+    seen = set()
+    for candidate in candidates:
+        prompt = candidate.strip().strip('"').strip()
+        key = normalize_prompt(prompt)
+        if prompt and key not in seen:
+            seen.add(key)
+            prompts.append(prompt)
+    return prompts
 
-# Load environment variables at the start
-load_dotenv()
 
 class PromptGenerator:
 
-        
-    def generate_prompt(self):
-        try:
-            # Check for required environment variables
-            required_vars = ['OPENROUTER_API_KEY', 'OPENROUTER_MODEL', 'OPENROUTER_ENDPOINT']
-            missing_vars = [var for var in required_vars if not os.getenv(var)]
-            
-            if missing_vars:
-                print(f"Error: Missing required environment variables: {', '.join(missing_vars)}")
-                return None
+    @traced('prompt')
+    def _chat(self, messages):
+        # Check for required environment variables
+        settings = Config.snapshot()
+        missing_vars = settings.missing(OPENROUTER_VARS)
+
+        if missing_vars:
+            logger.error(f"Missing required environment variables: {', '.join(missing_vars)}")
+            return None
+
+        endpoint = settings.get('OPENROUTER_ENDPOINT')
+        api_key = settings.get('OPENROUTER_API_KEY')
+        model = settings.get('OPENROUTER_MODEL')
+
+        logger.info(f"Requesting prompts from {endpoint} using model {model}")
+
+        payload = {
+            "model": model,
+            "messages": messages
+        }
+        limiter = get_rate_limiter('openrouter')
 
-            prompts = [os.getenv(f'PROMPT_{i}') for i in range(1, 5) if os.getenv(f'PROMPT_{i}')]
-            print(f"Found {len(prompts)} prompts")
-            
-            endpoint = os.getenv('OPENROUTER_ENDPOINT')
-            api_key = os.getenv('OPENROUTER_API_KEY')
-            model = os.getenv('OPENROUTER_MODEL')
-            
-            print(f"Making request to: {endpoint}")
-            print(f"Using model: {model}")
-            
-            response = requests.post(
+        def send():
+            response = get_http_client().post(
                 endpoint,
+                endpoint="openrouter.chat",
+                limiter=limiter,
                 headers={
                     "Authorization": f"Bearer {api_key}",
                     "Content-Type": "application/json",
                     "HTTP-Referer": "https://github.com/",
                     "X-Title": "Wallpaper Generator"
                 },
-                json={
-                    "model": model,
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "You are an expert wallpaper creator specializing in realistic and artistic photography. Your task is to generate a single prompt for image generation that describes a beautiful scene, landscape, or cityscape. Use a mix of evocative descriptions (lighting, mood, artistic vision) and occasional technical or compositional details to create visually stunning and varied outputs. Ensure each prompt reflects a professional fine art photography style.Provide only the prompt itself without any intro or explanations."
-                        },
-                        {
-                             "role": "user",
-                            "content": "[Choose from: Create / Design / Imagine] a [choose from: serene / vibrant / dramatic / peaceful / moody] [choose from: photograph / image / scene] of a [choose from: bustling city street / tranquil forest glade / sunlit coastal village / moonlit desert dune / foggy mountain pass / rainy urban alleyway / futuristic skyline / secluded beach cove]. The light is [choose from: soft and diffused / harsh and dramatic / warm and golden / cool and misty], evoking a sense of [choose from: mystery / wonder / calm / energy]. Composition follows [choose from: the rule of thirds / leading lines / symmetry / negative space], emphasizing [choose from: the horizon / a central subject / depth / balance]. The color palette is [choose from: muted earth tones / vibrant and saturated / cool and calming / warm and inviting]. [Optional: Add a detail like ‘A lone figure stands in the distance’ or ‘Reflections glow on wet pavement’]. Professional fine art photography."
-                        }
-                    ]
-                }
+                json=payload
             )
-            
+
+            if response.status_code == 429:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                limiter.throttled(retry_after)
+                raise UpstreamRateLimited("OpenRouter rate limit reached, try again later", 'openrouter', retry_after)
+
             if response.status_code != 200:
-                print(f"Error response (Status {response.status_code}): {response.text}")
+                logger.error(f"Error response (Status {response.status_code}): {response.text}")
                 return None
-                
+
             data = response.json()
-            print(f"API Response: {data}")
-            
+            logger.debug(f"API Response: {data}")
+
             if not data or 'choices' not in data:
-                print("Invalid response format from API")
+                logger.error("Invalid response format from API")
                 return None
-                
-            content = data['choices'][0]['message']['content'].strip()
+
+            # OpenRouter reports token counts, and the cost when usage accounting is enabled
+            usage = data.get('usage') or {}
+            limiter.record_usage(usage.get('total_tokens') or 0, usage.get('cost'))
+            return data['choices'][0]['message']['content'].strip()
+
+        # Identical requests already in flight, e.g. from two refills, share one answer
+        return limiter.call(flight_key(endpoint, payload), send)
+
+    def generate_prompt(self):
+        try:
+            content = self._chat([
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": TEMPLATE_PROMPT}
+            ])
             if content:
-                print(f"\nGenerated prompt: {content}\n")
+                logger.info(f"Generated prompt: {content}")
                 return content
             else:
-                print("No content in API response")
+                logger.warning("No content in API response")
                 return None
-                
+
+        except Exception as e:
+            logger.error(f"Exception in generate_prompt: {str(e)}")
+            return None
+
+    def generate_prompts(self, count):
+        """Asks the model for count distinct prompts in a single request.
+
+        Returns the parsed, de-duplicated prompts, which may be fewer than
+        requested, or an empty list on failure. Raises RateLimitError if
+        OpenRouter's rate limit refused the request.
+        """
+        try:
+            content = self._chat([
+                {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Write {count} different prompts, each following this template:\n\n{TEMPLATE_PROMPT}"}
+            ])
+            if not content:
+                logger.warning("No content in API response")
+                return []
+
+            prompts = parse_prompt_list(content)
+            logger.info(f"Generated {len(prompts)} prompts in one request")
+            return prompts[:count]
+
+        except RateLimitError:
+            raise
         except Exception as e:
-            print(f"Exception in generate_prompt: {str(e)}")
-            return None 
\ No newline at end of file
+            logger.error(f"Exception in generate_prompts: {str(e)}")
+            return []
@@ -0,0 +1,111 @@
+import logging
+import threading
+from collections import deque
+from config import Config
+from prompt_generator import PromptGenerator, normalize_prompt
+from rate_limiter import RateLimitError
+
+logger = logging.getLogger('DynamicTV')
+
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_LOW_WATERMARK = 3
+# Prompts served recently are remembered so a later batch cannot repeat them
+RECENT_HISTORY = 256
+
+
+class PromptPool:
+    """In-memory buffer of ready prompts, refilled in batches in the background.
+
+    get() answers from the buffer. When the buffer drops to low_watermark a
+    single background refill asks the model for batch_size prompts in one
+    request; only when the buffer is completely empty does a caller wait.
+    """
+
+    def __init__(self, generator=None, batch_size=DEFAULT_BATCH_SIZE, low_watermark=DEFAULT_LOW_WATERMARK):
+        self.generator = generator or PromptGenerator()
+        self.batch_size = batch_size
+        self.low_watermark = low_watermark
+        self._buffer = deque()
+        self._recent = deque(maxlen=RECENT_HISTORY)
+        self._cond = threading.Condition()
+        self._refilling = False
+        # Set while the last refill was refused by the provider's rate limit
+        self._rate_limited = None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._buffer)
+
+    def get(self, timeout=60):
+        """Returns a prompt, or None if the model could not produce one.
+
+        Raises RateLimitError if the buffer is empty because the refill was rate limited.
+        """
+        with self._cond:
+            if not self._buffer:
+                self._start_refill()
+                self._cond.wait_for(lambda: self._buffer or not self._refilling, timeout=timeout)
+            if not self._buffer:
+                if self._rate_limited is not None:
+                    raise self._rate_limited
+                return None
+
+            prompt = self._buffer.popleft()
+            self._recent.append(normalize_prompt(prompt))
+            if len(self._buffer) <= self.low_watermark:
+                self._start_refill()
+            return prompt
+
+    def warm(self):
+        """Starts filling the buffer without waiting for it."""
+        with self._cond:
+            if len(self._buffer) <= self.low_watermark:
+                self._start_refill()
+
+    def _start_refill(self):
+        # Caller holds the lock. At most one refill runs at a time.
+        if self._refilling:
+            return
+        self._refilling = True
+        threading.Thread(target=self._refill, name='prompt-refill', daemon=True).start()
+
+    def _refill(self):
+        prompts = []
+        rate_limited = None
+        try:
+            prompts = self.generator.generate_prompts(self.batch_size)
+        except RateLimitError as e:
+            rate_limited = e
+            logger.warning(f"Prompt pool refill rate limited: {str(e)}")
+        except Exception as e:
+            logger.error(f"Prompt pool refill failed: {str(e)}")
+
+        with self._cond:
+            self._rate_limited = rate_limited
+            known = set(self._recent) | {normalize_prompt(p) for p in self._buffer}
+            added = 0
+            for prompt in prompts:
+                key = normalize_prompt(prompt)
+                if key not in known:
+                    known.add(key)
+                    self._buffer.append(prompt)
+                    added += 1
+            self._refilling = False
+            self._cond.notify_all()
+        logger.info(f"Prompt pool refilled with {added} prompts ({len(prompts) - added} duplicates dropped)")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_prompt_pool():
+    """Returns the process-wide prompt pool configured from the environment."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PromptPool(
+                batch_size=int(Config.get_env('PROMPT_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+                low_watermark=int(Config.get_env('PROMPT_POOL_LOW_WATERMARK', DEFAULT_LOW_WATERMARK)),
+            )
+        return _pool
@@ -0,0 +1,301 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger('DynamicTV')
+
+# Calls per minute and burst size per upstream provider; <PROVIDER>_RATE_LIMIT
+# and <PROVIDER>_RATE_BURST override them, and a rate of 0 means unlimited
+PROVIDER_LIMITS = {'ideogram': (20, 4), 'openrouter': (60, 10)}
+# Longest a call queues for its turn before it is refused
+DEFAULT_MAX_WAIT = 60.0
+
+
+class RateLimitError(Exception):
+    """An upstream call was refused because of a rate limit. retry_after is in seconds, if known."""
+
+    def __init__(self, message, provider, retry_after=None):
+        super().__init__(message)
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class RateLimitExceeded(RateLimitError):
+    """More calls are queued for the provider than can run within RATE_LIMIT_MAX_WAIT."""
+
+
+class UpstreamRateLimited(RateLimitError):
+    """The provider still answered 429 after the client's retries."""
+
+
+def parse_retry_after(value):
+    """Seconds from a numeric Retry-After header, or None."""
+    return float(value) if value and value.isdigit() else None
+
+
+def flight_key(*parts):
+    """A key identifying a request by its JSON-serialisable parts, for coalescing."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class TokenBucket:
+    """Allows rate calls per second on average, in bursts of up to capacity.
+
+    A caller reserves a token up front and then sleeps until it is due, so
+    queued callers are served in arrival order and never more than
+    capacity calls run ahead of the rate. A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        # Caller holds the lock
+        now = self.clock()
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def configure(self, rate, capacity):
+        with self._lock:
+            self._refill()
+            self.rate, self.capacity = rate, capacity
+            self._tokens = min(self._tokens, capacity)
+
+    def reserve(self, max_wait=None):
+        """Takes a token, possibly one that is not due yet, and returns the seconds until it is.
+
+        If that would be longer than max_wait nothing is taken; the caller
+        compares the returned wait against max_wait.
+        """
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            self._refill()
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if max_wait is None or wait <= max_wait:
+                self._tokens -= 1
+            return wait
+
+    def pause(self, seconds):
+        """Holds every token back for at least seconds, e.g. after the provider asked to slow down."""
+        with self._lock:
+            if self.rate <= 0:
+                return
+            self._refill()
+            self._tokens = min(self._tokens, 1 - seconds * self.rate)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers arriving meanwhile share its outcome."""
+
+    def __init__(self):
+        self._flights = {}
+        self._async_flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Returns (func's result, True if it came from a call another caller started)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = func()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    async def do_async(self, key, func):
+        """do() for coroutines on one event loop; func returns an awaitable."""
+        import asyncio
+
+        future = self._async_flights.get(key)
+        if future is not None:
+            # A waiter that gives up must not cancel the call the others are waiting on
+            return await asyncio.shield(future), True
+
+        future = self._async_flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func()
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting; don't let asyncio report the exception as unretrieved
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._async_flights[key]
+            if not future.done():
+                future.cancel()
+
+
+class ProviderLimiter:
+    """Rate limiting, request coalescing and usage accounting for one upstream provider.
+
+    call() queues for a token, so bursts are spread out at the provider's
+    rate instead of being answered with 429s, and identical calls that are
+    already in flight are joined rather than sent again. Usage counts
+    calls made, calls coalesced, 429s, refusals, time spent queueing and
+    the billable units (images or tokens) and cost the provider reported.
+    """
+
+    def __init__(self, provider, rate_per_minute, burst, max_wait=DEFAULT_MAX_WAIT,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.provider = provider
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst, clock)
+        self.max_wait = max_wait
+        self.sleep = sleep
+        self.flights = SingleFlight()
+        self.settings = (rate_per_minute, burst, max_wait)
+        self._usage = {'calls': 0, 'coalesced': 0, 'throttled': 0, 'rejected': 0,
+                       'waitSeconds': 0.0, 'units': 0, 'cost': 0.0}
+        self._lock = threading.Lock()
+
+    def configure(self, rate_per_minute, burst, max_wait):
+        if (rate_per_minute, burst, max_wait) != self.settings:
+            self.bucket.configure(rate_per_minute / 60.0, burst)
+            self.max_wait = max_wait
+            self.settings = (rate_per_minute, burst, max_wait)
+
+    def _add(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self._usage[name] += amount
+
+    def _reserve(self):
+        wait = self.bucket.reserve(self.max_wait)
+        if wait > self.max_wait:
+            self._add(rejected=1)
+            logger.warning(f"{self.provider} queue is full, refusing call (next slot in {wait:.1f}s)")
+            raise RateLimitExceeded(f"{self.provider} rate limit reached, try again in {wait:.0f}s",
+                                    self.provider, wait)
+        if wait:
+            logger.info(f"Waiting {wait:.1f}s for a {self.provider} rate limit slot")
+        self._add(calls=1, waitSeconds=wait)
+        return wait
+
+    def acquire(self):
+        """Blocks until the next call to the provider may be sent."""
+        wait = self._reserve()
+        if wait:
+            self.sleep(wait)
+
+    async def acquire_async(self):
+        import asyncio
+
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def call(self, key, func):
+        """Returns func() once a token is free; concurrent calls with the same key share one func() call.
+
+        A key of None never coalesces.
+        """
+        def run():
+            self.acquire()
+            return func()
+
+        if key is None:
+            return run()
+        result, shared = self.flights.do(key, run)
+        if shared:
+            self._add(coalesced=1)
+        return result
+
+    async def call_async(self, key, func):
+        """call() for coroutine functions."""
+        async def run():
+            await self.acquire_async()
+            return await func()
+
+        if key is None:
+            return await run()
+        result, shared = await self.flights.do_async(key, run)
+        if shared:
+            self._add(coalesced=1)
+        return result
+
+    def throttled(self, retry_after=None):
+        """Records a 429 and holds back further calls for retry_after seconds."""
+        self._add(throttled=1)
+        if retry_after:
+            self.bucket.pause(retry_after)
+
+    def record_usage(self, units=0, cost=None):
+        self._add(units=units, cost=cost or 0.0)
+
+    def usage(self):
+        with self._lock:
+            usage = dict(self._usage)
+        usage['waitSeconds'] = round(usage['waitSeconds'], 3)
+        usage['cost'] = round(usage['cost'], 6)
+        rate_per_minute, burst, max_wait = self.settings
+        usage['limit'] = {'perMinute': rate_per_minute, 'burst': burst, 'maxWait': max_wait}
+        return usage
+
+
+def limiter_settings(provider):
+    """(calls per minute, burst, max wait) for provider from the current configuration."""
+    settings = Config.snapshot()
+    rate, burst = PROVIDER_LIMITS[provider]
+    prefix = provider.upper()
+    return (float(settings.number(f'{prefix}_RATE_LIMIT', rate)),
+            max(1, int(settings.number(f'{prefix}_RATE_BURST', burst))),
+            float(settings.number('RATE_LIMIT_MAX_WAIT', DEFAULT_MAX_WAIT)))
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider):
+    """Returns the process-wide limiter for provider ('ideogram' or 'openrouter').
+
+    Its limits follow the configuration, so edits to .env apply to the next call.
+    """
+    settings = limiter_settings(provider)
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limiter = _limiters[provider] = ProviderLimiter(provider, *settings)
+    limiter.configure(*settings)
+    return limiter
+
+
+def usage_report():
+    """Usage of every provider called so far."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.provider: limiter.usage() for limiter in limiters}
@@ -0,0 +1,296 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from config import Config
+from telemetry import span
+
+logger = logging.getLogger('DynamicTV')
+
+DEFAULT_CRON = '0 * * * *'
+DEFAULT_WORKERS = 4
+# Library images recently shown per TV, which fallback picks stay visually distinct from
+RECENT_HISTORY = 20
+
+CRON_ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+}
+# (min, max) for minute, hour, day of month, month, day of week (0 = Sunday)
+CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+
+def _parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"Invalid cron step: {step_text}")
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-', 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron value out of range: {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Minimal five-field cron expression (minute hour day-of-month month day-of-week).
+
+    Supports '*', lists, ranges and steps, plus the @hourly/@daily style
+    aliases. As in cron, when both day fields are restricted a day matches if
+    either does.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        fields = CRON_ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expression}")
+        try:
+            parsed = [_parse_cron_field(f, low, high) for f, (low, high) in zip(fields, CRON_RANGES)]
+        except ValueError as e:
+            raise ValueError(f"Invalid cron expression '{expression}': {str(e)}")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def _day_matches(self, dt):
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, dt):
+        """Returns the first matching minute strictly after dt."""
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Jump field by field rather than minute by minute; a match is always within a few years
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f"Cron expression never matches: {self.expression}")
+
+
+def load_schedules():
+    """Reads per-TV schedules from TV_SCHEDULES (JSON list) or falls back to TV_IP + ROTATION_CRON.
+
+    Example: TV_SCHEDULES=[{"tvIp": "192.168.1.55", "cron": "*/30 * * * *"}]
+    """
+    raw = Config.get_env('TV_SCHEDULES')
+    if raw:
+        entries = json.loads(raw)
+    elif Config.get_env('TV_IP'):
+        entries = [{'tvIp': Config.get_env('TV_IP'), 'cron': Config.get_env('ROTATION_CRON', DEFAULT_CRON)}]
+    else:
+        entries = []
+    return {entry['tvIp']: CronSchedule(entry.get('cron', DEFAULT_CRON)) for entry in entries}
+
+
+_recently_shown = defaultdict(lambda: deque(maxlen=RECENT_HISTORY))
+_recently_shown_lock = threading.Lock()
+
+
+def pick_library_image(tv_ip):
+    """Chooses an archived image that is not a near-duplicate of what the TV showed recently.
+
+    Returns the image path, or None when the library has nothing suitable.
+    """
+    from image_similarity import get_similarity_index
+
+    index = get_similarity_index()
+    index.refresh()
+    with _recently_shown_lock:
+        recent = list(_recently_shown[tv_ip])
+    name = index.choose_distinct(recent)
+    return index.catalog.path_for(name) if name else None
+
+
+def rotate_tv(tv_ip):
+    """Shows the next image on one TV, taking it from the look-ahead buffer when possible.
+
+    If no new image can be rendered, a distinct image from the library is shown instead.
+    """
+    from image_buffer import archive_image, get_image_buffer, render_next_image
+    from image_catalog import get_catalog
+    from tv_pusher import push_image_to_tv
+
+    buffer = get_image_buffer()
+    item = buffer.take()
+    if item:
+        image_path = item['path']
+    else:
+        logger.info(f"Image buffer is empty, rendering an image for {tv_ip} now")
+        try:
+            image_path = archive_image(*render_next_image(buffer.folder, [tv_ip]))['path']
+        except Exception as e:
+            image_path = pick_library_image(tv_ip)
+            if not image_path:
+                raise
+            logger.warning(f"Rendering failed ({str(e)}), showing {os.path.basename(image_path)} from the library")
+    push_image_to_tv(image_path, tv_ip)
+
+    with _recently_shown_lock:
+        _recently_shown[tv_ip].append(get_catalog().name_for(image_path))
+    return os.path.basename(image_path)
+
+
+class RotationScheduler:
+    """Rotates each TV on its own cron schedule, pushing to TVs concurrently.
+
+    Due TVs are handed to a bounded worker pool, and a TV whose previous
+    rotation is still running is skipped rather than queued, so one slow or
+    offline TV never holds up the others. Last and next run times are
+    persisted so a restart resumes the schedule and catches up on a missed
+    rotation once.
+    """
+
+    def __init__(self, schedules, state_path, rotate=rotate_tv, max_workers=DEFAULT_WORKERS, clock=datetime.now):
+        self.schedules = schedules
+        self.state_path = state_path
+        self.rotate = rotate
+        self.clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rotation')
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._in_flight = set()
+        self._state = self._load_state()
+
+        now = self.clock()
+        for tv_ip, schedule in schedules.items():
+            entry = self._state.setdefault(tv_ip, {})
+            if not entry.get('nextRun') or entry.get('cron') != schedule.expression:
+                entry['nextRun'] = schedule.next_after(now).isoformat()
+            entry['cron'] = schedule.expression
+        self._save_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        # Caller holds the lock, or no worker is running yet
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._state, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Could not persist scheduler state: {str(e)}")
+
+    def status(self):
+        with self._lock:
+            return {tv_ip: dict(entry, running=tv_ip in self._in_flight)
+                    for tv_ip, entry in self._state.items() if tv_ip in self.schedules}
+
+    def run_pending(self):
+        """Dispatches every TV whose next run is due. Returns the TVs dispatched."""
+        now = self.clock()
+        dispatched = []
+        with self._lock:
+            for tv_ip, schedule in self.schedules.items():
+                entry = self._state[tv_ip]
+                if tv_ip in self._in_flight or datetime.fromisoformat(entry['nextRun']) > now:
+                    continue
+                entry['nextRun'] = schedule.next_after(now).isoformat()
+                self._in_flight.add(tv_ip)
+                dispatched.append(tv_ip)
+            if dispatched:
+                self._save_state()
+        for tv_ip in dispatched:
+            self._executor.submit(self._run_rotation, tv_ip)
+        return dispatched
+
+    def run_all_now(self):
+        """Rotates every TV once, concurrently, and waits for all of them."""
+        futures = []
+        with self._lock:
+            for tv_ip in self.schedules:
+                if tv_ip not in self._in_flight:
+                    self._in_flight.add(tv_ip)
+                    futures.append(self._executor.submit(self._run_rotation, tv_ip))
+        for future in futures:
+            future.result()
+
+    def _run_rotation(self, tv_ip):
+        started = time.monotonic()
+        status, error, image = 'succeeded', None, None
+        try:
+            logger.info(f"Rotating art on TV {tv_ip}")
+            with span('rotation', tvIp=tv_ip):
+                image = self.rotate(tv_ip)
+        except Exception as e:
+            status, error = 'failed', str(e)
+            logger.error(f"Rotation for TV {tv_ip} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(tv_ip)
+                entry = self._state.setdefault(tv_ip, {})
+                entry.update({
+                    'lastRun': self.clock().isoformat(),
+                    'lastStatus': status,
+                    'lastError': error,
+                    'lastImage': image,
+                    'lastDurationSeconds': round(time.monotonic() - started, 2),
+                })
+                self._save_state()
+            self._wakeup.set()
+
+    def seconds_until_next(self):
+        with self._lock:
+            pending = [datetime.fromisoformat(self._state[tv_ip]['nextRun'])
+                       for tv_ip in self.schedules if tv_ip not in self._in_flight]
+        if not pending:
+            return 60.0
+        return max(0.0, (min(pending) - self.clock()).total_seconds())
+
+    def run_forever(self):
+        logger.info(f"Rotation scheduler started for {len(self.schedules)} TV(s)")
+        while not self._stopped:
+            self.run_pending()
+            self._wakeup.clear()
+            # Re-check at least every minute in case the wall clock jumps
+            self._wakeup.wait(timeout=min(60.0, self.seconds_until_next()) + 0.05)
+
+    def stop(self, wait=True):
+        self._stopped = True
+        self._wakeup.set()
+        self._executor.shutdown(wait=wait)
+
+
+def create_scheduler():
+    """Builds a scheduler from the environment-configured TV schedules."""
+    return RotationScheduler(
+        load_schedules(),
+        os.path.join(Config.get_cache_folder('scheduler'), 'state.json'),
+        max_workers=int(Config.get_env('SCHEDULER_WORKERS', DEFAULT_WORKERS)),
+    )
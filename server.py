@@ -1,31 +1,110 @@
 #!/usr/bin/env python3
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_file
+from werkzeug.security import safe_join
 from flask_cors import CORS
+import math
 import os
 from tkinter import Tk, filedialog
 from config import Config
 from logger import setup_logger
-from image_generator import generate_image_api
-from image_fetcher import fetch_image
-from tv_pusher import push_image_to_tv
-from prompt_generator import PromptGenerator
-from samsungtvws import SamsungTVWS
+from generation_cache import generate_image_cached, get_generation_cache
+from image_fetcher import fetch_image_data
+from tv_pusher import push_image_data_to_tv, push_image_to_tv
+from prompt_pool import get_prompt_pool
+from thumbnails import THUMBNAIL_SIZES, get_thumbnail_cache
+from image_catalog import DEFAULT_PAGE_SIZE, get_catalog
+from job_queue import QueueFullError, archive_folder_for_pushes, get_job_queue, local_image_path
+from image_buffer import get_image_buffer
+from image_similarity import get_similarity_index
+from image_candidates import candidate_count
+from http_client import get_http_client
+from rate_limiter import RateLimitError, usage_report
+from tv_connection import get_connection_manager
+from tv_discovery import DEFAULT_PROBE_TIMEOUT, get_tv_discovery, port_open
+from tv_storage import get_tv_storage
+from telemetry import CONTENT_TYPE as METRICS_CONTENT_TYPE, TRACES, begin_span, end_span, render_metrics
 
 app = Flask(__name__)
 # Allow all origins for development
 CORS(app, resources={r"/*": {"origins": "*"}})
 logger = setup_logger()
 
+TRACE_HEADER = 'X-Trace-Id'
+
+# Every request is the root span of a trace; pipeline stages it triggers become child spans
+@app.before_request
+def start_request_trace():
+    trace_id = request.headers.get(TRACE_HEADER) or None
+    g.trace = begin_span('request', trace_id=trace_id, method=request.method, route=str(request.url_rule))
+
+@app.after_request
+def add_trace_header(response):
+    if 'trace' in g:
+        response.headers[TRACE_HEADER] = g.trace[0].trace_id
+    return response
+
+@app.teardown_request
+def finish_request_trace(error=None):
+    trace = g.pop('trace', None)
+    if trace:
+        end_span(*trace, error)
+
+# Versioned URLs (?v=<content hash prefix>) can be cached for a year without revalidation
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+VERSION_LENGTH = 16
+
+def versioned_url(url, sha256):
+    return f"{url}?v={sha256[:VERSION_LENGTH]}" if sha256 else url
+
+def apply_cache_policy(response, sha256):
+    """Marks responses for versioned URLs immutable; everything else revalidates via its ETag."""
+    if sha256 and request.args.get('v') == sha256[:VERSION_LENGTH]:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
 # Serve static images
 @app.route('/images/<path:filename>')
 def serve_image(filename):
     try:
         images_folder = Config.get_env('IMAGES_FOLDER')
-        return send_from_directory(images_folder, filename)
+        image_path = safe_join(images_folder, filename)
+        if not image_path or not os.path.isfile(image_path):
+            return jsonify({'success': False, 'error': 'Image not found'}), 404
+
+        # Strong ETag from the content hash; send_file answers If-None-Match with 304 and serves Range requests
+        sha256 = get_catalog(images_folder).content_hash(filename)
+        response = send_file(image_path, etag=sha256 or True, conditional=True)
+        return apply_cache_policy(response, sha256)
     except Exception as e:
         logger.error(f"Error serving image: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Serve cached, downsized derivatives for the gallery
+@app.route('/thumbnails/<size>/<path:filename>')
+def serve_thumbnail(size, filename):
+    try:
+        if size not in THUMBNAIL_SIZES:
+            return jsonify({'success': False, 'error': f'Unknown thumbnail size: {size}'}), 404
+
+        source_path = safe_join(Config.get_env('IMAGES_FOLDER'), filename)
+        if not source_path or not os.path.isfile(source_path):
+            return jsonify({'success': False, 'error': 'Image not found'}), 404
+
+        thumbnail_cache = get_thumbnail_cache()
+        thumbnail_path = thumbnail_cache.get(source_path, size)
+        # A thumbnail is determined by its source content, size and quality
+        sha256 = get_catalog(Config.get_env('IMAGES_FOLDER')).content_hash(filename)
+        etag = f"{sha256}-{size}-q{thumbnail_cache.quality}" if sha256 else True
+        response = send_file(thumbnail_path, mimetype='image/webp', etag=etag, conditional=True)
+        return apply_cache_policy(response, sha256)
+    except Exception as e:
+        logger.error(f"Error serving thumbnail: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/select-folder', methods=['POST'])
 def select_folder():
     try:
@@ -66,14 +145,24 @@ def select_folder():
 
 
 
+def retry_after_header(error):
+    """Retry-After value (whole seconds) for a RateLimitError."""
+    return str(max(1, math.ceil(error.retry_after or 1)))
+
+def rate_limited(error):
+    logger.warning(f"Rate limited: {str(error)}")
+    return (jsonify({'success': False, 'error': str(error), 'retryAfter': error.retry_after}), 429,
+            {'Retry-After': retry_after_header(error)})
+
 @app.route('/api/generate-prompt', methods=['POST'])
 def generate_prompt():
     try:
-        generator = PromptGenerator()
-        new_prompt = generator.generate_prompt()
+        new_prompt = get_prompt_pool().get()
         if new_prompt:
             return jsonify({'success': True, 'prompt': new_prompt})
         return jsonify({'success': False, 'error': 'Failed to generate prompt'}), 400
+    except RateLimitError as e:
+        return rate_limited(e)
     except Exception as e:
         logger.error(f"Error generating prompt: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -87,16 +176,25 @@ def generate_image():
         
         if not prompt:
             return jsonify({'success': False, 'error': 'No prompt provided'}), 400
-            
-        image_url = generate_image_api(prompt)
-        if not image_url:
+
+        try:
+            options = generation_options(data)
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        if data.get('async'):
+            return enqueue_job('generate', {'prompt': prompt, **options})
+
+        result = generate_image_cached(prompt, options['force'], options['candidates'], options['keepAll'])
+        if not result['imageUrl']:
             return jsonify({'success': False, 'error': 'Failed to generate image'}), 400
 
         return jsonify({
             'success': True,
-            'imageUrl': image_url
+            **result
         })
 
+    except RateLimitError as e:
+        return rate_limited(e)
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -113,15 +211,38 @@ def list_local_images():
         images_folder = Config.get_env('IMAGES_FOLDER')
         if not os.path.exists(images_folder):
             return jsonify({'success': False, 'error': 'Images folder not found'}), 404
-            
-        # List all files in the images folder
-        image_files = [f for f in os.listdir(images_folder) 
-                      if os.path.isfile(os.path.join(images_folder, f)) 
-                      and f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))]
-        
+
+        catalog = get_catalog(images_folder)
+        catalog.refresh()
+
+        try:
+            rows, next_cursor = catalog.page(
+                limit=request.args.get('limit', DEFAULT_PAGE_SIZE),
+                cursor=request.args.get('cursor'),
+                sort=request.args.get('sort', 'created'),
+                order=request.args.get('order', 'desc')
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
         return jsonify({
             'success': True,
-            'images': image_files
+            'images': [row['name'] for row in rows],
+            'items': [{
+                'name': row['name'],
+                'url': versioned_url(f"/images/{row['name']}", row['sha256']),
+                'thumbnailUrl': versioned_url(f"/thumbnails/thumb/{row['name']}", row['sha256']),
+                'previewUrl': versioned_url(f"/thumbnails/preview/{row['name']}", row['sha256']),
+                'sha256': row['sha256'],
+                'size': row['size'],
+                'width': row['width'],
+                'height': row['height'],
+                'format': row['format'],
+                'created': row['created'],
+                'prompt': row['prompt']
+            } for row in rows],
+            'nextCursor': next_cursor,
+            'total': catalog.count()
         })
 
     except Exception as e:
@@ -137,6 +258,12 @@ def check_tv_ip():
         if not tv_ip:
             return jsonify({'success': False, 'error': 'TV IP address is required'}), 400
 
+        # A wrong address fails here in well under a second instead of after the socket timeout
+        timeout = Config.snapshot().number('DISCOVERY_PROBE_TIMEOUT', DEFAULT_PROBE_TIMEOUT)
+        if not port_open(tv_ip, get_connection_manager().port, timeout):
+            logger.error(f"No TV answers at {tv_ip}")
+            return jsonify({'success': False, 'error': f'No TV answers at {tv_ip}'}), 400
+
         # Use the same approach as in tv_test.py
         logger.info(f"Attempting to connect to TV at {tv_ip}...")
         
@@ -157,6 +284,17 @@ def check_tv_ip():
         logger.error(f"Error checking TV IP: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/discover-tvs')
+def discover_tvs():
+    try:
+        refresh = request.args.get('refresh', 'false').lower() in ('1', 'true')
+        return jsonify({'success': True, **get_tv_discovery().discover(refresh)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error discovering TVs: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/test-tv-connection', methods=['POST'])
 def test_tv_connection():
     try:
@@ -191,30 +329,191 @@ def push_to_tv():
         if not tv_ip:
             return jsonify({'success': False, 'error': 'TV IP address is required'}), 400
 
+        if data.get('async'):
+            return enqueue_job('push', {'imageUrl': image_url, 'tvIp': tv_ip})
+
         # If the image URL is a local path (from gallery), use it directly
         if image_url.startswith('/images/'):
-            image_path = os.path.join(os.path.dirname(__file__), image_url.lstrip('/'))
+            result = push_image_to_tv(local_image_path(image_url), tv_ip)
         else:
-            # Download the image temporarily for TV push
-            image_path = fetch_image(image_url, Config.get_env('IMAGES_FOLDER'))
+            # Stream the download into memory and push it without a temporary file
+            image_data, _ = fetch_image_data(image_url, archive_folder_for_pushes())
+            result = push_image_data_to_tv(image_data, tv_ip, image_url)
 
-        # Push the image to TV
-        push_image_to_tv(image_path, tv_ip)
-        
-        # Cleanup temporary file only if it was downloaded
-        if not image_url.startswith('/images/') and os.path.exists(image_path):
-            os.remove(image_path)
-            
-        return jsonify({'success': True})
+        return jsonify({'success': True, **result})
 
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def generation_options(data):
+    """The force, candidates and keepAll options of a generate request, validated."""
+    keep_all = data.get('keepAll')
+    if keep_all is not None and not isinstance(keep_all, bool):
+        raise ValueError("keepAll must be true or false")
+    return {
+        # force skips the generation cache and always pays for a fresh render
+        'force': bool(data.get('force')),
+        'candidates': candidate_count(data.get('candidates')),
+        'keepAll': keep_all,
+    }
+
+def enqueue_job(job_type, params):
+    try:
+        job = get_job_queue().submit(job_type, params)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except QueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+
+    return jsonify({
+        'success': True,
+        'jobId': job.id,
+        'statusUrl': f'/api/jobs/{job.id}',
+        'resultUrl': f'/api/jobs/{job.id}/result'
+    }), 202
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    try:
+        data = request.get_json() or {}
+        job_type = data.get('type')
+        params = {key: data.get(key) for key in ('prompt', 'imageUrl', 'tvIp') if data.get(key)}
+        if job_type in ('generate', 'generate-push'):
+            try:
+                params.update(generation_options(data))
+            except (TypeError, ValueError) as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+        return enqueue_job(job_type, params)
+    except Exception as e:
+        logger.error(f"Error creating job: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    job = get_job_queue().get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/result')
+def get_job_result(job_id):
+    job = get_job_queue().get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    if not job.done:
+        return jsonify({'success': False, 'status': job.status, 'stage': job.stage}), 202
+    if job.status == 'failed':
+        return jsonify({'success': False, 'status': job.status, 'error': job.error}), 500
+    return jsonify({'success': True, 'status': job.status, **job.result})
+
+@app.route('/api/image-buffer')
+def image_buffer_status():
+    return jsonify({'success': True, **get_image_buffer().status()})
+
+@app.route('/api/tv-storage')
+def tv_storage_status():
+    tv_ip = request.args.get('tvIp')
+    if not tv_ip:
+        return jsonify({'success': False, 'error': 'TV IP address is required'}), 400
+    return jsonify({'success': True, **get_tv_storage().status(tv_ip)})
+
+@app.route('/api/tv-storage/cleanup', methods=['POST'])
+def tv_storage_cleanup():
+    tv_ip = (request.get_json(silent=True) or {}).get('tvIp')
+    if not tv_ip:
+        return jsonify({'success': False, 'error': 'TV IP address is required'}), 400
+    # Runs on the storage manager's thread; poll /api/tv-storage for the result
+    get_tv_storage().schedule(tv_ip, delay=0)
+    return jsonify({'success': True, **get_tv_storage().status(tv_ip)}), 202
+
+def max_distance_param(value):
+    return int(value) if value is not None else None
+
+@app.route('/api/duplicates')
+def list_duplicates():
+    try:
+        index = get_similarity_index(Config.get_env('IMAGES_FOLDER'))
+        index.refresh()
+        groups = index.duplicate_groups(max_distance_param(request.args.get('maxDistance')))
+        return jsonify({'success': True, 'groups': groups})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error finding duplicates: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/duplicates/cleanup', methods=['POST'])
+def cleanup_duplicates():
+    try:
+        data = request.get_json(silent=True) or {}
+        index = get_similarity_index(Config.get_env('IMAGES_FOLDER'))
+        index.refresh()
+        # Nothing is deleted unless the caller explicitly turns the dry run off
+        dry_run = data.get('dryRun', True) is not False
+        removed = index.remove_duplicates(max_distance_param(data.get('maxDistance')), dry_run=dry_run)
+        return jsonify({'success': True, 'dryRun': dry_run, 'removed': removed})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error removing duplicates: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/similar/<path:filename>')
+def similar_images(filename):
+    try:
+        index = get_similarity_index(Config.get_env('IMAGES_FOLDER'))
+        index.refresh()
+        try:
+            matches = index.similar(filename, max_distance_param(request.args.get('maxDistance')))
+        except KeyError:
+            return jsonify({'success': False, 'error': 'Image not found'}), 404
+        return jsonify({'success': True, 'similar': [{'name': name, 'distance': distance} for distance, name in matches]})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error finding similar images: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/generation-cache')
+def generation_cache_stats():
+    return jsonify({'success': True, **get_generation_cache().stats()})
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(), mimetype=METRICS_CONTENT_TYPE)
+
+@app.route('/api/traces')
+def recent_traces():
+    return jsonify({'success': True, 'traces': TRACES.recent()})
+
+@app.route('/api/traces/<trace_id>')
+def get_trace(trace_id):
+    spans = TRACES.get(trace_id)
+    if spans is None:
+        return jsonify({'success': False, 'error': 'Trace not found'}), 404
+    return jsonify({'success': True, 'traceId': trace_id, 'spans': spans})
+
+@app.route('/api/http-metrics')
+def http_metrics():
+    return jsonify({'success': True, 'endpoints': get_http_client().metrics()})
+
+@app.route('/api/usage')
+def upstream_usage():
+    return jsonify({'success': True, 'providers': usage_report()})
+
 if __name__ == '__main__':
     try:
         # Ensure the images folder exists
         os.makedirs(Config.get_env('IMAGES_FOLDER'), exist_ok=True)
+        # The debug reloader runs this block in a watcher process too; only the
+        # serving child may start fillers, or every render would be paid for twice
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            # Have prompts ready before the first request asks for one
+            get_prompt_pool().warm()
+            # Optionally keep rendered images ready ahead of scheduled rotations
+            if Config.snapshot().flag('IMAGE_BUFFER_ENABLED'):
+                get_image_buffer().start()
         # Run the server
         app.run(host='0.0.0.0', port=5000, debug=True)
     except Exception as e:
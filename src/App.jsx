@@ -31,6 +31,19 @@ const api = axios.create({
   }
 });
 
+// Generation and TV pushes run as background jobs; poll until the result is ready
+const waitForJob = async (jobId) => {
+  for (;;) {
+    await new Promise(resolve => setTimeout(resolve, 1000))
+    const response = await api.get(`/api/jobs/${jobId}/result`, {
+      validateStatus: status => status < 600
+    })
+    if (response.status !== 202) {
+      return response
+    }
+  }
+}
+
 function App() {
   const [uploadSuccess, setUploadSuccess] = useState(false);
   const [status, setStatus] = useState('Ready')
@@ -111,7 +124,8 @@ function App() {
       }
       setLoading(true)
       setStatus('Generating image...')
-      const response = await api.post('/api/generate-image', { prompt })
+      const job = await api.post('/api/generate-image', { prompt, async: true })
+      const response = await waitForJob(job.data.jobId)
       console.log('Image response:', response.data)
       if (response.data.success) {
         setImageUrl(response.data.imageUrl)
@@ -140,10 +154,12 @@ function App() {
       setLoading(true)
       setUploadSuccess(false)
       setStatus('Pushing image to TV...')
-      const response = await api.post('/api/push-to-tv', {
+      const job = await api.post('/api/push-to-tv', {
         imageUrl: imageUrl,
-        tvIp: tvIp
+        tvIp: tvIp,
+        async: true
       })
+      const response = await waitForJob(job.data.jobId)
       console.log('TV push response:', response.data)
       if (response.data.success) {
         setStatus('Image successfully pushed to TV!')
@@ -1,6 +1,7 @@
 import { useState } from 'react'
-import { Box, Container, Typography, Button, TextField, Stack, Alert, CircularProgress, IconButton, Paper } from '@mui/material'
+import { Box, Container, Typography, Button, TextField, Stack, Alert, CircularProgress, IconButton, Paper, Chip } from '@mui/material'
 import CheckIcon from '@mui/icons-material/Check'
+import SearchIcon from '@mui/icons-material/Search'
 import ArrowBackIcon from '@mui/icons-material/ArrowBack'
 import { useNavigate } from 'react-router-dom'
 import axios from 'axios'
@@ -34,6 +35,8 @@ export default function Settings() {
   const [imageFolder, setImageFolder] = useState(localStorage.getItem('imageFolder') || '')
   const [checkingTv, setCheckingTv] = useState(false)
   const [tvCheckResult, setTvCheckResult] = useState(null)
+  const [discovering, setDiscovering] = useState(false)
+  const [discoveredTvs, setDiscoveredTvs] = useState(null)
   const [status, setStatus] = useState('Ready')
   const [mode, setMode] = useState(localStorage.getItem('themeMode') || 'dark')
   const navigate = useNavigate()
@@ -59,6 +62,26 @@ export default function Settings() {
     }
   }
 
+  const handleDiscover = async () => {
+    setDiscovering(true)
+    try {
+      const response = await api.get('/api/discover-tvs', { params: { refresh: discoveredTvs !== null } })
+      setDiscoveredTvs(response.data.tvs)
+      setStatus(response.data.tvs.length ? `Found ${response.data.tvs.length} TV(s)` : 'No TVs found')
+    } catch (error) {
+      setDiscoveredTvs([])
+      setStatus('TV discovery failed')
+    } finally {
+      setDiscovering(false)
+    }
+  }
+
+  const handleSelectTv = (tv) => {
+    setTvIp(tv.ip)
+    // Discovery already reached the TV's art channel
+    setTvCheckResult(tv.artApiVersion ? true : null)
+  }
+
   const handleSave = async () => {
     localStorage.setItem('tvIp', tvIp)
     localStorage.setItem('imageFolder', imageFolder)
@@ -101,6 +124,28 @@ export default function Settings() {
           helperText="Enter your Samsung TV's local IP address"
           error={tvCheckResult === false}
         />
+        <Button
+          onClick={handleDiscover}
+          variant="outlined"
+          disabled={discovering}
+          startIcon={discovering ? <CircularProgress size={20} /> : <SearchIcon />}
+          fullWidth
+        >
+          Find TVs
+        </Button>
+        {discoveredTvs && discoveredTvs.length > 0 && (
+          <Stack direction="row" spacing={1} useFlexGap flexWrap="wrap">
+            {discoveredTvs.map((tv) => (
+              <Chip
+                key={tv.ip}
+                label={`${tv.model} (${tv.ip})`}
+                color={tv.ip === tvIp ? 'primary' : 'default'}
+                variant={tv.frameTV ? 'filled' : 'outlined'}
+                onClick={() => handleSelectTv(tv)}
+              />
+            ))}
+          </Stack>
+        )}
         <Button
           onClick={handleCheckTvIp}
           variant="outlined"
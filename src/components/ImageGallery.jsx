@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { Grid, Card, CardMedia, Typography, Box, IconButton, Snackbar, Alert } from '@mui/material';
+import { Grid, Card, CardMedia, Typography, Box, Button, IconButton, Snackbar, Alert } from '@mui/material';
 import UploadIcon from '@mui/icons-material/Upload';
 import axios from 'axios';
 import DirectoryPicker from './DirectoryPicker';
@@ -19,19 +19,29 @@ const ImageGallery = () => {
   const [uploading, setUploading] = useState(false);
   const [uploadSuccess, setUploadSuccess] = useState(false);
   const [hoveredIndex, setHoveredIndex] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
 
-  const fetchLocalImages = async () => {
+  const fetchLocalImages = async (cursor = null) => {
     const imageFolder = localStorage.getItem('imageFolder');
     if (!imageFolder) {
       // Don't fetch images if no folder is selected
       setLocalImages([]);
+      setNextCursor(null);
       return;
     }
 
     try {
-      const response = await api.get('/api/list-local-images');
+      const response = await api.get('/api/list-local-images', {
+        params: { sort: 'created', order: 'desc', ...(cursor && { cursor }) }
+      });
       if (response.data.success) {
-        setLocalImages(response.data.images.map(image => `${api.defaults.baseURL}/images/${image}`));
+        // Cards render the small thumbnail; the original is only used when pushing to the TV
+        const images = response.data.items.map(item => ({
+          url: `${api.defaults.baseURL}${item.url}`,
+          thumbnailUrl: `${api.defaults.baseURL}${item.thumbnailUrl}`
+        }));
+        setLocalImages(previous => (cursor ? [...previous, ...images] : images));
+        setNextCursor(response.data.nextCursor);
       } else {
         throw new Error(response.data.error || 'Failed to fetch local images');
       }
@@ -97,12 +107,13 @@ const ImageGallery = () => {
                 <CardMedia
                   component="img"
                   height="200"
-                  image={image}
+                  image={image.thumbnailUrl}
+                  loading="lazy"
                   alt={`Generated image ${index + 1}`}
                 />
                 {hoveredIndex === index && (
                   <IconButton
-                    onClick={() => handleUploadToTV(image)}
+                    onClick={() => handleUploadToTV(image.url)}
                     disabled={uploading}
                     sx={{
                       position: 'absolute',
@@ -123,6 +134,13 @@ const ImageGallery = () => {
           ))}
         </Grid>
       )}
+      {!error && nextCursor && (
+        <Box sx={{ display: 'flex', justifyContent: 'center', mt: 3 }}>
+          <Button variant="outlined" onClick={() => fetchLocalImages(nextCursor)}>
+            Load more
+          </Button>
+        </Box>
+      )}
       <Snackbar
         open={uploadSuccess}
         autoHideDuration={6000}
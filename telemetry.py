@@ -0,0 +1,278 @@
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger('DynamicTV')
+
+# Pipeline stages that get a duration histogram and failure counter
+STAGES = ('prompt', 'generate', 'download', 'transcode', 'connect', 'upload', 'select')
+# Seconds; generation and uploads take tens of seconds, cached transcodes a few milliseconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+MAX_TRACES = 200
+MAX_SPANS_PER_TRACE = 100
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._series.get(tuple(str(labels[name]) for name in self.labelnames))
+            return series[-1] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """Holds the process's metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram(
+    'dynamictv_stage_duration_seconds', 'Time spent in each pipeline stage.', ('stage',))
+STAGE_FAILURES = REGISTRY.counter(
+    'dynamictv_stage_failures_total', 'Pipeline stage failures by cause.', ('stage', 'cause'))
+
+
+def failure_cause(error):
+    """Short, low-cardinality label for why a stage failed."""
+    # Callers often re-raise as a bare Exception; classify by what actually went wrong
+    while type(error) is Exception and (error.__cause__ or error.__context__):
+        error = error.__cause__ or error.__context__
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status:
+        return f"http_{status}"
+    name = type(error).__name__
+    if isinstance(error, TimeoutError) or 'Timeout' in name:
+        return 'timeout'
+    if isinstance(error, ConnectionError) or 'Connect' in name:
+        return 'connection'
+    if isinstance(error, ValueError):
+        return 'invalid'
+    return name
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.status = 'ok'
+        self.error = None
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'spanId': self.span_id,
+            'parentId': self.parent_id,
+            'started': self.started,
+            'durationMs': round(self.duration * 1000, 1) if self.duration is not None else None,
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+
+class TraceBuffer:
+    """The spans of the most recent traces, for looking up one request end to end."""
+
+    def __init__(self, max_traces=MAX_TRACES):
+        self.max_traces = max_traces
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            if len(spans) < MAX_SPANS_PER_TRACE:
+                spans.append(span.to_dict())
+
+    def get(self, trace_id):
+        with self._lock:
+            spans = self._traces.get(trace_id)
+            return sorted(spans, key=lambda span: span['started']) if spans is not None else None
+
+    def recent(self, limit=20):
+        with self._lock:
+            trace_ids = list(self._traces)[-limit:]
+            return [{'traceId': trace_id, 'spans': len(self._traces[trace_id])} for trace_id in reversed(trace_ids)]
+
+
+TRACES = TraceBuffer()
+_current_span = contextvars.ContextVar('dynamictv_span', default=None)
+
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+
+def current_trace_id():
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+def begin_span(name, trace_id=None, **attributes):
+    """Starts a span under the current one (or a new trace). Returns (span, token) for end_span."""
+    parent = _current_span.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent else new_trace_id()
+    span = Span(name, trace_id, parent.span_id if parent and parent.trace_id == trace_id else None, attributes)
+    return span, _current_span.set(span)
+
+
+def end_span(span, token, error=None):
+    span.duration = time.perf_counter() - span._start
+    _current_span.reset(token)
+    if error is not None:
+        span.status = 'error'
+        span.error = str(error)
+    if span.name in STAGES:
+        STAGE_SECONDS.observe(span.duration, stage=span.name)
+        if error is not None:
+            STAGE_FAILURES.inc(stage=span.name, cause=failure_cause(error))
+    TRACES.record(span)
+    logger.debug(f"trace={span.trace_id} span={span.name} status={span.status} "
+                 f"duration_ms={span.duration * 1000:.1f}")
+
+
+@contextmanager
+def span(name, **attributes):
+    """Times a block as a span of the current trace; stage names also feed the stage metrics."""
+    current, token = begin_span(name, **attributes)
+    error = None
+    try:
+        yield current
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        end_span(current, token, error)
+
+
+def traced(name):
+    """Decorator that runs a function, sync or async, inside span(name)."""
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def render_metrics():
+    return REGISTRY.render()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+from config import Config
+
+try:
+    from starlette.testclient import TestClient
+    import asgi_server
+except ImportError:
+    asgi_server = None
+
+@unittest.skipIf(asgi_server is None, "ASGI server dependencies are not installed")
+class TestASGIServer(unittest.TestCase):
+    def setUp(self):
+        self.images_dir = tempfile.mkdtemp()
+        self.env = patch.dict(os.environ, {
+            'IMAGES_FOLDER': self.images_dir,
+            'IDEOGRAM_API_KEY': 'key',
+            'IDEOGRAM_STYLE_TYPE': 'AUTO',
+            'IDEOGRAM_ASPECT_RATIO': '16x9',
+            'NEGATIVE_PROMPT': 'blurry',
+        })
+        self.env.start()
+        Config.reload()
+        self.addCleanup(Config.reload)
+        self.pool = patch('asgi_server.get_prompt_pool')
+        self.pool.start()
+        self.client = TestClient(asgi_server.app)
+        self.client.__enter__()
+
+    def tearDown(self):
+        self.client.__exit__(None, None, None)
+        self.pool.stop()
+        self.env.stop()
+        shutil.rmtree(self.images_dir)
+
+    def test_generate_image_runs_on_event_loop(self):
+        result = {'imageUrl': '/images/ab/ab12.png', 'cached': False}
+        with patch('asgi_server.generate_image_cached_async', AsyncMock(return_value=result)) as generate:
+            response = self.client.post('/api/generate-image', json={'prompt': 'a quiet harbour'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'success': True, **result})
+        generate.assert_awaited_once_with('a quiet harbour', False)
+
+    def test_generate_image_validation_matches_flask(self):
+        response = self.client.post('/api/generate-image', json={})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'No prompt provided')
+
+    def test_remote_push_downloads_async_and_pushes_in_thread(self):
+        fetch = AsyncMock(return_value=(b'jpeg bytes', None))
+        push_threads = []
+
+        def push(data, tv_ip, label):
+            push_threads.append(threading.current_thread())
+            return {'contentId': 'MY_F0001', 'uploaded': True}
+
+        with patch('asgi_server.fetch_image_data_async', fetch), \
+                patch('asgi_server.push_image_data_to_tv', side_effect=push):
+            response = self.client.post('/api/push-to-tv', json={'imageUrl': 'https://cdn/img.png', 'tvIp': '10.0.0.2'})
+
+        self.assertEqual(response.json(), {'success': True, 'contentId': 'MY_F0001', 'uploaded': True})
+        self.assertIsNot(push_threads[0], threading.main_thread())
+
+    def test_status_routes_answer_while_push_is_in_flight(self):
+        release = threading.Event()
+
+        def slow_push(image_path, tv_ip):
+            release.wait(5)
+            return {'contentId': 'MY_F0001', 'uploaded': True}
+
+        results = {}
+        with patch('asgi_server.push_image_to_tv', side_effect=slow_push):
+            pushing = threading.Thread(target=lambda: results.setdefault('push', self.client.post(
+                '/api/push-to-tv', json={'imageUrl': '/images/art.jpg', 'tvIp': '10.0.0.2'})))
+            pushing.start()
+            time.sleep(0.1)
+
+            with patch('server.get_image_buffer') as buffer:
+                buffer.return_value.status.return_value = {'ready': 2}
+                status = self.client.get('/api/image-buffer')
+            self.assertEqual(status.json(), {'success': True, 'ready': 2})
+            self.assertNotIn('push', results)
+
+            release.set()
+            pushing.join(5)
+        self.assertEqual(results['push'].status_code, 200)
+
+    def test_async_requests_are_forwarded_to_flask(self):
+        with patch('server.enqueue_job', return_value=('{"success": true, "jobId": "abc"}', 202)) as enqueue:
+            response = self.client.post('/api/push-to-tv', json={'imageUrl': '/images/a.png', 'tvIp': '10.0.0.2', 'async': True})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['jobId'], 'abc')
+        enqueue.assert_called_once_with('push', {'imageUrl': '/images/a.png', 'tvIp': '10.0.0.2'})
+
+    def test_multiple_workers_are_refused(self):
+        # Job polls landing on another worker would 404, so asking for more fails loudly
+        with self.assertRaisesRegex(ValueError, 'only 1 is supported'):
+            asgi_server.worker_count(4)
+        self.assertEqual(asgi_server.worker_count(1), 1)
+
+if __name__ == '__main__':
+    unittest.main()
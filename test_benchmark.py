@@ -0,0 +1,30 @@
+import unittest
+from benchmark import compare_results, percentile, run_load
+
+class TestBenchmarkStatistics(unittest.TestCase):
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.99), 7)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_run_load_counts_failures(self):
+        summary = run_load(lambda i: i % 4 != 0, total=20, concurrency=4)
+        self.assertEqual(summary['requests'], 20)
+        self.assertEqual(summary['errors'], 5)
+        self.assertIsNotNone(summary['p99Ms'])
+
+    def test_compare_flags_only_changes_beyond_tolerance(self):
+        def run(p50, p99, throughput, concurrency=4):
+            return {'scenario': 'push', 'concurrency': concurrency, 'librarySize': 100,
+                    'p50Ms': p50, 'p99Ms': p99, 'throughput': throughput}
+
+        baseline = {'results': [run(100, 200, 10.0), run(100, 200, 10.0, concurrency=16)]}
+        current = {'results': [run(110, 300, 9.0), run(100, 200, 5.0, concurrency=16)]}
+        regressions = compare_results(baseline, current, tolerance=0.2)
+        self.assertEqual([(r['concurrency'], r['metric']) for r in regressions],
+                         [(4, 'p99Ms'), (16, 'throughput')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,7 @@
 import os
+import shutil
+import tempfile
+import threading
 import unittest
 from unittest.mock import patch, mock_open
 from config import Config
@@ -9,6 +12,9 @@ class TestConfig(unittest.TestCase):
         for var in Config.REQUIRED_VARS:
             if var in os.environ:
                 del os.environ[var]
+        # get_env reads the snapshot, so rebuild it around each test's environment
+        Config.reload()
+        self.addCleanup(Config.reload)
 
     def test_validate_env_missing_vars(self):
         # Test when environment variables are missing
@@ -27,6 +33,7 @@ class TestConfig(unittest.TestCase):
         }
         
         with patch.dict(os.environ, test_values):
+            Config.reload()
             try:
                 Config.validate_env()
             except ValueError:
@@ -38,6 +45,7 @@ class TestConfig(unittest.TestCase):
         test_value = 'test_value'
         
         with patch.dict(os.environ, {test_key: test_value}):
+            Config.reload()
             result = Config.get_env(test_key)
             self.assertEqual(result, test_value)
 
@@ -54,6 +62,7 @@ class TestConfig(unittest.TestCase):
         
         with patch('builtins.open', mock_open(read_data=mock_env_content)) as mock_file:
             Config.set_env(test_key, test_value)
+            Config.flush()
             
             # Verify environment variable was set
             self.assertEqual(os.environ[test_key], test_value)
@@ -70,6 +79,7 @@ class TestConfig(unittest.TestCase):
         
         with patch('builtins.open', mock_open(read_data=mock_env_content)) as mock_file:
             Config.set_env(test_key, new_value)
+            Config.flush()
             
             # Verify environment variable was updated
             self.assertEqual(os.environ[test_key], new_value)
@@ -88,11 +98,82 @@ class TestConfig(unittest.TestCase):
             # Should not raise exception but print warning
             try:
                 Config.set_env(test_key, test_value)
+                Config.flush()
             except Exception:
                 self.fail('set_env() should handle file errors gracefully')
             
             # Verify environment variable was still set
             self.assertEqual(os.environ[test_key], test_value)
 
+class TestConfigSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.env_path = os.path.join(self.tmp_dir, '.env')
+        self.mtime = 1_700_000_000
+        self.write_env('PROMPT_1=harbour\nTV_PORT=8001\n')
+        # Cleanups run last-in first-out: rebuild from the real .env once the patches are gone
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.addCleanup(Config.reload)
+        for p in (patch('config.ENV_PATH', self.env_path), patch('config.RELOAD_INTERVAL', 0), patch.dict(os.environ)):
+            p.start()
+            self.addCleanup(p.stop)
+        for key in ('PROMPT_1', 'PROMPT_2', 'TV_PORT'):
+            os.environ.pop(key, None)
+        Config.reload()
+
+    def write_env(self, content):
+        with open(self.env_path, 'w') as f:
+            f.write(content)
+        # Step the mtime explicitly; several writes can land within one timestamp tick
+        self.mtime += 1
+        os.utime(self.env_path, (self.mtime, self.mtime))
+
+    def test_edits_to_env_file_are_picked_up(self):
+        before = Config.snapshot()
+        self.assertEqual((before.get('PROMPT_1'), before.get('PROMPT_2')), ('harbour', None))
+
+        self.write_env('PROMPT_1=forest\nPROMPT_2=desert\nTV_PORT=8001\n')
+        after = Config.snapshot()
+        self.assertEqual((after.get('PROMPT_1'), after.get('PROMPT_2')), ('forest', 'desert'))
+        self.assertEqual(Config.get_env('PROMPT_1'), 'forest')
+        # Snapshots taken earlier keep their values
+        self.assertEqual((before.get('PROMPT_1'), before.get('PROMPT_2')), ('harbour', None))
+
+    def test_process_environment_wins_over_file(self):
+        os.environ['TV_PORT'] = '9000'
+        self.assertEqual(Config.reload().get('TV_PORT'), '9000')
+
+    def test_invalid_edit_keeps_last_good_snapshot(self):
+        self.write_env('PROMPT_1=harbour\nTV_PORT=eighty\n')
+        self.assertEqual(Config.snapshot().get('TV_PORT'), '8001')
+        self.assertEqual(Config.get_env('TV_PORT'), '8001')
+
+    def test_values_are_typed_once(self):
+        self.write_env('TV_PORT=8001\nHTTP_READ_TIMEOUT=2.5\nGENERATION_CACHE_ENABLED=False\n')
+        settings = Config.snapshot()
+        self.assertEqual(settings.number('TV_PORT'), 8001)
+        self.assertIsInstance(settings.number('TV_PORT'), int)
+        self.assertEqual(settings.number('HTTP_READ_TIMEOUT'), 2.5)
+        self.assertEqual(settings.number('TV_TIMEOUT', 10), 10)
+        self.assertIs(settings.flag('GENERATION_CACHE_ENABLED', True), False)
+        self.assertIs(settings.flag('IMAGE_BUFFER_ENABLED'), False)
+
+    def test_concurrent_set_env_is_written_once(self):
+        with patch('config.os.replace', wraps=os.replace) as replace:
+            threads = [threading.Thread(target=Config.set_env, args=(f'BENCH_{i}', str(i))) for i in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(Config.snapshot().get('BENCH_7'), '7')
+            Config.flush()
+
+        replace.assert_called_once()
+        with open(self.env_path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[:2], ['PROMPT_1=harbour', 'TV_PORT=8001'])
+        self.assertEqual(sorted(lines[2:]), sorted(f'BENCH_{i}={i}' for i in range(20)))
+        self.assertEqual(os.listdir(self.tmp_dir), ['.env'])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
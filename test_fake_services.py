@@ -0,0 +1,61 @@
+import os
+import unittest
+from unittest.mock import patch
+from config import Config
+from fake_services import FakeFrameTV, FakeIdeogram, FakeOpenRouter
+from image_fetcher import fetch_image_data
+from image_generator import generate_image_api
+from prompt_generator import PromptGenerator
+from tv_connection import TVConnectionManager
+
+class TestFakeFrameTV(unittest.TestCase):
+    def setUp(self):
+        self.tv = FakeFrameTV(upload_bytes_per_second=10_000_000).start()
+        self.manager = TVConnectionManager(port=self.tv.port, timeout=5)
+
+    def tearDown(self):
+        self.manager.close()
+        self.tv.stop()
+
+    def test_real_client_uploads_selects_and_deletes(self):
+        self.assertEqual(self.manager.device_info('127.0.0.1')['resolution'], '3840x2160')
+        with self.manager.session('127.0.0.1') as art:
+            content_id = art.upload(b'\xff\xd8' + b'\x00' * 5000, file_type='JPEG', matte='flexible_polar')
+            self.assertEqual([item['content_id'] for item in art.available()], [content_id])
+            art.select_image(content_id)
+            self.assertTrue(art.delete_list([content_id]))
+            self.assertEqual(art.available(), [])
+
+        self.assertEqual(self.tv.uploads, [5002])
+        self.assertEqual(self.tv.selected, [content_id])
+
+class TestFakeAPIs(unittest.TestCase):
+    def setUp(self):
+        # The API clients read a configuration snapshot, so rebuild it around patched variables
+        self.addCleanup(Config.reload)
+    def test_generate_and_download_from_fake_ideogram(self):
+        ideogram = FakeIdeogram(resolution=(320, 180), image_bytes=50_000).start()
+        try:
+            with patch.dict(os.environ, {'IDEOGRAM_API_URL': ideogram.generate_url, 'IDEOGRAM_API_KEY': 'test'}):
+                Config.reload()
+                image_url = generate_image_api("A lighthouse")
+            data, _ = fetch_image_data(image_url)
+            self.assertEqual(bytes(data[:2]), b'\xff\xd8')
+            self.assertEqual(len(data), 50_000 + 16)
+            self.assertEqual(ideogram.requests, 1)
+        finally:
+            ideogram.stop()
+
+    def test_openrouter_returns_requested_number_of_prompts(self):
+        openrouter = FakeOpenRouter().start()
+        try:
+            with patch.dict(os.environ, {'OPENROUTER_ENDPOINT': openrouter.endpoint,
+                                         'OPENROUTER_API_KEY': 'test', 'OPENROUTER_MODEL': 'test/model'}):
+                Config.reload()
+                prompts = PromptGenerator().generate_prompts(3)
+            self.assertEqual(len(set(prompts)), 3)
+        finally:
+            openrouter.stop()
+
+if __name__ == '__main__':
+    unittest.main()
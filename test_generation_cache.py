@@ -0,0 +1,216 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from config import Config
+from PIL import Image
+from fake_services import FakeIdeogram
+from generation_cache import GenerationCache, cache_key, generate_image_cached
+from image_store import get_image_store
+
+PARAMS = {'prompt': 'A quiet harbour at dawn', 'style_type': 'AUTO', 'aspect_ratio': '16x9'}
+
+class TestGenerationCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.images_dir = os.path.join(self.tmp_dir, 'images')
+        os.makedirs(self.images_dir)
+        self.now = 1000.0
+        self.cache = GenerationCache(os.path.join(self.tmp_dir, 'generations.sqlite3'), self.images_dir,
+                                     ttl=3600, clock=lambda: self.now)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _image(self, name):
+        Image.new('RGB', (32, 18)).save(os.path.join(self.images_dir, name))
+        return name
+
+    def test_key_ignores_case_and_whitespace(self):
+        self.assertEqual(cache_key(PARAMS), cache_key({**PARAMS, 'prompt': '  a quiet   HARBOUR at dawn'}))
+        self.assertNotEqual(cache_key(PARAMS), cache_key({**PARAMS, 'aspect_ratio': '9x16'}))
+
+    def test_hit_after_store(self):
+        self.assertIsNone(self.cache.lookup(PARAMS))
+        self.cache.store(PARAMS, self._image('a.png'), latency=12.5)
+
+        self.assertEqual(self.cache.lookup({**PARAMS, 'prompt': 'a quiet harbour at dawn '}), 'a.png')
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hitRate']), (1, 1, 0.5))
+        self.assertEqual(stats['savedSeconds'], 12.5)
+
+    def test_expired_and_deleted_renders_miss(self):
+        self.cache.store(PARAMS, self._image('a.png'), latency=1.0)
+        self.now += 3601
+        self.assertIsNone(self.cache.lookup(PARAMS))
+
+        self.cache.store(PARAMS, self._image('b.png'), latency=1.0)
+        os.remove(os.path.join(self.images_dir, 'b.png'))
+        self.assertIsNone(self.cache.lookup(PARAMS))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_variants_are_rendered_then_cycled(self):
+        self.cache.variants = 2
+        self.cache.store(PARAMS, self._image('a.png'), latency=1.0)
+        # One render is not enough variety yet
+        self.assertIsNone(self.cache.lookup(PARAMS))
+
+        self.now += 1
+        self.cache.store(PARAMS, self._image('b.png'), latency=1.0)
+        served = []
+        for _ in range(4):
+            self.now += 1
+            served.append(self.cache.lookup(PARAMS))
+        self.assertEqual(served, ['a.png', 'b.png', 'a.png', 'b.png'])
+
+class TestGenerateImageCached(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.images_dir = os.path.join(self.tmp_dir, 'images')
+        os.makedirs(self.images_dir)
+        self.cache = GenerationCache(os.path.join(self.tmp_dir, 'generations.sqlite3'), self.images_dir)
+        self.renders = 0
+        self.renders_lock = threading.Lock()
+
+        def fetch(image_url, archive_folder):
+            # One file and colour per render URL, so concurrent renders never clash
+            name = image_url.rsplit('/', 1)[-1]
+            download = os.path.join(self.tmp_dir, name)
+            Image.new('RGB', (32, 18), (int(name.split('.')[0]), 0, 0)).save(download)
+            stored = get_image_store(archive_folder).put_file(download)
+            return b'', stored.path
+
+        def generate(prompt, coalesce=True):
+            with self.renders_lock:
+                self.renders += 1
+                return f"https://ideogram.example/{self.renders}.png"
+
+        self.patches = [
+            patch.dict(os.environ, {'IMAGES_FOLDER': self.images_dir, 'NEGATIVE_PROMPT': 'blurry'}),
+            patch('generation_cache.get_generation_cache', return_value=self.cache),
+            patch('image_generator.generate_image_api', side_effect=generate),
+            patch('image_fetcher.fetch_image_data', side_effect=fetch),
+        ]
+        for p in self.patches:
+            p.start()
+        Config.reload()
+        self.addCleanup(Config.reload)
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_repeat_request_is_served_locally(self):
+        first = generate_image_cached('a quiet harbour')
+        self.assertFalse(first['cached'])
+        self.assertTrue(first['imageUrl'].startswith('/images/'))
+
+        second = generate_image_cached('A quiet harbour')
+        self.assertEqual(second, {'imageUrl': first['imageUrl'], 'cached': True})
+        self.assertEqual(self.renders, 1)
+
+    def test_force_renders_again(self):
+        first = generate_image_cached('a quiet harbour')
+        forced = generate_image_cached('a quiet harbour', force=True)
+
+        self.assertEqual(self.renders, 2)
+        self.assertFalse(forced['cached'])
+        self.assertNotEqual(forced['imageUrl'], first['imageUrl'])
+        self.assertEqual(self.cache.stats()['forced'], 1)
+
+    def test_concurrent_identical_requests_share_one_render(self):
+        release = threading.Event()
+        results = []
+
+        def slow_generate(prompt, coalesce=True):
+            release.wait(5)
+            with self.renders_lock:
+                self.renders += 1
+                return f"https://ideogram.example/{self.renders}.png"
+
+        with patch('image_generator.generate_image_api', side_effect=slow_generate):
+            threads = [threading.Thread(target=lambda: results.append(generate_image_cached('a quiet harbour')))
+                       for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            threading.Event().wait(0.1)
+            release.set()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(len({result['imageUrl'] for result in results}), 1)
+        self.assertEqual(len(results), 3)
+
+    def test_forced_request_never_joins_a_render_in_flight(self):
+        release = threading.Event()
+        results = []
+
+        def slow_generate(prompt, coalesce=True):
+            release.wait(5)
+            with self.renders_lock:
+                self.renders += 1
+                return f"https://ideogram.example/{self.renders}.png"
+
+        with patch('image_generator.generate_image_api', side_effect=slow_generate):
+            plain = threading.Thread(target=lambda: results.append(generate_image_cached('a quiet harbour')))
+            plain.start()
+            threading.Event().wait(0.1)
+            forced = threading.Thread(
+                target=lambda: results.append(generate_image_cached('a quiet harbour', force=True)))
+            forced.start()
+            threading.Event().wait(0.1)
+            release.set()
+            plain.join(5)
+            forced.join(5)
+
+        self.assertEqual(self.renders, 2)
+        self.assertEqual(len({result['imageUrl'] for result in results}), 2)
+
+class TestForcedRenderUpstream(unittest.TestCase):
+    """Only the HTTP layer is faked, so request coalescing is exercised all the way down."""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.images_dir = os.path.join(self.tmp_dir, 'images')
+        os.makedirs(self.images_dir)
+        self.cache = GenerationCache(os.path.join(self.tmp_dir, 'generations.sqlite3'), self.images_dir)
+        self.ideogram = FakeIdeogram(latency=0.3, resolution=(64, 36), image_bytes=1000).start()
+        self.patches = [
+            patch.dict(os.environ, {'IMAGES_FOLDER': self.images_dir, 'IDEOGRAM_API_KEY': 'test',
+                                    'IDEOGRAM_API_URL': self.ideogram.generate_url}),
+            patch('generation_cache.get_generation_cache', return_value=self.cache),
+        ]
+        for p in self.patches:
+            p.start()
+        Config.reload()
+        self.addCleanup(Config.reload)
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.ideogram.stop()
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_forced_and_plain_requests_call_ideogram_separately(self):
+        results = []
+        plain = threading.Thread(target=lambda: results.append(generate_image_cached('a quiet harbour')))
+        forced = threading.Thread(
+            target=lambda: results.append(generate_image_cached('a quiet harbour', force=True)))
+        plain.start()
+        threading.Event().wait(0.1)
+        forced.start()
+        plain.join(10)
+        forced.join(10)
+
+        self.assertEqual(self.ideogram.requests, 2)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(len({result['imageUrl'] for result in results}), 2)
+
+if __name__ == '__main__':
+    unittest.main()
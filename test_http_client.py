@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+import requests
+from http_client import AsyncHTTPClient, HTTPClient
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=b'ok', headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Drain any body, or it is read as the next request on this kept-alive connection
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hits = server.hits[self.path]
+            server.ports.add(self.client_address[1])
+        if self.path == '/flaky' and hits <= 2:
+            self._reply(503, b'busy')
+        elif self.path == '/throttled' and hits == 1:
+            self._reply(429, b'slow down', {'Retry-After': '2'})
+        elif self.path == '/broken':
+            self._reply(500, b'error')
+        elif self.path == '/badgateway':
+            self._reply(502, b'bad gateway')
+        elif self.path == '/hangup':
+            # Takes the request, then drops the connection without answering
+            self.close_connection = True
+        elif self.path == '/slow':
+            time.sleep(0.5)
+            self._reply(200)
+        else:
+            self._reply(200)
+
+    do_POST = do_GET
+
+class TestHTTPClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), UpstreamHandler)
+        self.server.hits = {}
+        self.server.ports = set()
+        self.server.lock = threading.Lock()
+        # The timeout test hangs up mid-response; don't print the resulting traceback
+        self.server.handle_error = lambda request, client_address: None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.delays = []
+        self.client = HTTPClient(read_timeout=2, max_retries=3, sleep=self.delays.append)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            self.assertEqual(self.client.get(f"{self.base}/ok").status_code, 200)
+        self.assertEqual(len(self.server.ports), 1)
+        self.assertIs(self.client.session_for(f"{self.base}/a"), self.client.session_for(f"{self.base}/b"))
+
+    def test_5xx_is_retried_with_backoff(self):
+        response = self.client.get(f"{self.base}/flaky", endpoint='flaky')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.hits['/flaky'], 3)
+        self.assertEqual(len(self.delays), 2)
+        metrics = self.client.metrics()['flaky']
+        self.assertEqual((metrics['calls'], metrics['retries'], metrics['errors']), (1, 2, 0))
+
+    def test_retry_after_is_honoured(self):
+        self.assertEqual(self.client.get(f"{self.base}/throttled").status_code, 200)
+        self.assertEqual(self.delays, [2.0])
+
+    def test_gives_up_after_max_retries(self):
+        response = self.client.get(f"{self.base}/broken", endpoint='broken')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.server.hits['/broken'], 4)
+        self.assertEqual(self.client.metrics()['broken']['errors'], 1)
+
+    def test_read_timeout_is_not_retried_for_post(self):
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.client.post(f"{self.base}/slow", timeout=0.1)
+        self.assertEqual(self.server.hits['/slow'], 1)
+
+    def test_connection_errors_are_retried(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.get(f"{self.base}/ok", endpoint='down')
+        self.assertEqual(self.client.metrics()['down']['retries'], 3)
+        # Nothing was sent, so even a POST is safe to retry
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.post(f"{self.base}/ok", endpoint='down-post')
+        self.assertEqual(self.client.metrics()['down-post']['retries'], 3)
+
+    def test_post_is_not_resent_after_connection_drops(self):
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.post(f"{self.base}/hangup", json={'prompt': 'paid render'})
+        self.assertEqual(self.server.hits['/hangup'], 1)
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.get(f"{self.base}/hangup")
+        self.assertEqual(self.server.hits['/hangup'], 5)
+
+    def test_post_is_not_resent_after_5xx(self):
+        self.assertEqual(self.client.post(f"{self.base}/broken", json={'prompt': 'paid render'}).status_code, 500)
+        self.assertEqual(self.client.post(f"{self.base}/badgateway").status_code, 502)
+        self.assertEqual((self.server.hits['/broken'], self.server.hits['/badgateway']), (1, 1))
+        # A 429 means the server did nothing, so a POST may go again
+        self.assertEqual(self.client.post(f"{self.base}/throttled").status_code, 200)
+        self.assertEqual(self.server.hits['/throttled'], 2)
+
+    @unittest.skipIf(httpx is None, "httpx is not installed")
+    def test_async_post_is_not_resent_after_5xx(self):
+        async def post_all():
+            client = AsyncHTTPClient(read_timeout=2)
+            with patch('http_client.RETRY_BASE', 0.001):
+                try:
+                    return [(await client.post(f"{self.base}{path}")).status_code
+                            for path in ('/broken', '/badgateway', '/flaky')]
+                finally:
+                    await client.aclose()
+
+        self.assertEqual(asyncio.run(post_all()), [500, 502, 503])
+        self.assertEqual([self.server.hits[path] for path in ('/broken', '/badgateway', '/flaky')], [1, 1, 1])
+
+    @unittest.skipIf(httpx is None, "httpx is not installed")
+    def test_async_client_retries_and_shares_metrics(self):
+        async def fetch():
+            client = AsyncHTTPClient(read_timeout=2, stats=self.client.stats)
+            with patch('http_client.RETRY_BASE', 0.001):
+                try:
+                    return await client.get(f"{self.base}/flaky", endpoint='flaky')
+                finally:
+                    await client.aclose()
+
+        response = asyncio.run(fetch())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.hits['/flaky'], 3)
+        self.assertEqual(self.client.metrics()['flaky']['retries'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
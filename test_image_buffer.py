@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from PIL import Image
+from image_buffer import ImageBuffer, target_resolutions
+from tv_connection import TVConnectionManager
+
+class FakeProducer:
+    def __init__(self, fail=False):
+        self.count = 0
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def __call__(self, folder):
+        if self.fail:
+            raise RuntimeError('Ideogram is down')
+        with self.lock:
+            self.count += 1
+            n = self.count
+        path = os.path.join(folder, f'generated_{n:03d}.png')
+        Image.new('RGB', (32, 18), (n, 0, 0)).save(path)
+        return path, f'prompt {n}'
+
+class TestImageBuffer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.buffer_dir = os.path.join(self.tmp_dir, 'buffer')
+        self.archive_dir = os.path.join(self.tmp_dir, 'images')
+        self.catalog_patch = patch('image_catalog.get_catalog')
+        self.catalog_patch.start()
+
+    def tearDown(self):
+        self.catalog_patch.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_top_up_fills_to_target(self):
+        producer = FakeProducer()
+        buffer = ImageBuffer(self.buffer_dir, producer=producer, target=3)
+        buffer.top_up()
+
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(producer.count, 3)
+
+    def test_take_archives_oldest_image_with_prompt(self):
+        buffer = ImageBuffer(self.buffer_dir, producer=FakeProducer(), target=2)
+        buffer.top_up()
+
+        item = buffer.take(archive_folder=self.archive_dir)
+        self.assertEqual(item['prompt'], 'prompt 1')
+        # Archived into the content-addressed library
+        self.assertEqual(os.path.dirname(os.path.dirname(item['path'])), self.archive_dir)
+        self.assertTrue(os.path.exists(item['path']))
+        self.assertEqual(len(buffer), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.buffer_dir, 'generated_001.png.json')))
+
+    def test_take_from_empty_buffer_returns_none(self):
+        buffer = ImageBuffer(self.buffer_dir, producer=FakeProducer())
+        self.assertIsNone(buffer.take(archive_folder=self.archive_dir))
+
+    def test_buffer_survives_restart(self):
+        ImageBuffer(self.buffer_dir, producer=FakeProducer(), target=2).top_up()
+
+        reloaded = ImageBuffer(self.buffer_dir, producer=FakeProducer(), target=2)
+        self.assertEqual(len(reloaded), 2)
+        self.assertEqual(reloaded.take(archive_folder=self.archive_dir)['prompt'], 'prompt 1')
+
+    def test_disk_budget_limits_fill(self):
+        buffer = ImageBuffer(self.buffer_dir, producer=FakeProducer(), target=5, max_bytes=1)
+        buffer.top_up()
+        self.assertEqual(len(buffer), 1)
+
+    def test_background_filler_refills_after_take(self):
+        producer = FakeProducer()
+        buffer = ImageBuffer(self.buffer_dir, producer=producer, target=2, low_watermark=1)
+        buffer.start()
+        try:
+            first = buffer.take(archive_folder=self.archive_dir, timeout=5)
+            self.assertIsNotNone(first)
+            with buffer._cond:
+                buffer._cond.wait_for(lambda: len(buffer._items) >= 2, timeout=5)
+            self.assertEqual(len(buffer), 2)
+        finally:
+            buffer.stop()
+
+    def test_filler_survives_producer_errors(self):
+        buffer = ImageBuffer(self.buffer_dir, producer=FakeProducer(fail=True), target=1)
+        with patch('image_buffer.RETRY_BASE', 0.01):
+            buffer.start()
+            self.assertIsNone(buffer.take(archive_folder=self.archive_dir, timeout=0.1))
+            buffer.stop()
+        self.assertFalse(buffer._thread.is_alive())
+
+class TestTargetResolutions(unittest.TestCase):
+    def test_pretranscode_uses_each_scheduled_tv_panel(self):
+        panels = {'10.0.0.2': '1920x1080', '10.0.0.3': '3840x2160', '10.0.0.4': '3840x2160'}
+        manager = TVConnectionManager(device_info_fetcher=lambda host: {'resolution': panels[host]})
+        with patch('tv_connection.get_connection_manager', return_value=manager), \
+                patch('scheduler.load_schedules', return_value=dict.fromkeys(panels)):
+            self.assertEqual(target_resolutions(), [(1920, 1080), (3840, 2160)])
+            self.assertEqual(target_resolutions(['10.0.0.2']), [(1920, 1080)])
+
+if __name__ == '__main__':
+    unittest.main()
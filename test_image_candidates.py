@@ -0,0 +1,121 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from config import Config
+import numpy as np
+from PIL import Image, ImageFilter
+from image_catalog import get_catalog
+from image_candidates import candidate_count, request_candidates, score_image, score_pixels
+from generation_cache import GenerationCache, generate_image_cached
+
+WIDE = 16 / 9
+
+def scene(seed=0, size=(320, 180), blur=0, brightness=1.0):
+    pixels = np.random.RandomState(seed).randint(0, 256, (size[1] // 4, size[0] // 4, 3)).astype(np.uint8)
+    image = Image.fromarray(pixels).resize(size, Image.NEAREST)
+    if blur:
+        image = image.filter(ImageFilter.GaussianBlur(blur))
+    if brightness != 1.0:
+        image = image.point(lambda value: min(255, int(value * brightness)))
+    output = io.BytesIO()
+    image.save(output, 'PNG')
+    return output.getvalue()
+
+class TestScoring(unittest.TestCase):
+    def test_components_prefer_sharp_well_exposed_colourful_images(self):
+        sharp, blurred = score_image(scene(), WIDE), score_image(scene(blur=4), WIDE)
+        self.assertGreater(sharp['sharpness'], blurred['sharpness'])
+        self.assertGreater(sharp['score'], blurred['score'])
+
+        blown_out = score_image(scene(brightness=4.0), WIDE)
+        self.assertLess(blown_out['exposure'], sharp['exposure'] / 2)
+
+        gray = np.repeat(np.random.RandomState(1).rand(90, 160, 1).astype(np.float32), 3, axis=2)
+        self.assertEqual(score_pixels(gray, WIDE, WIDE)['colorfulness'], 0)
+
+    def test_aspect_fit_against_panel(self):
+        self.assertEqual(score_image(scene(), WIDE)['aspectFit'], 1)
+        self.assertAlmostEqual(score_image(scene(size=(180, 180)), WIDE)['aspectFit'], 0.5625)
+
+    def test_candidate_count_validation(self):
+        self.assertEqual(candidate_count('4'), 4)
+        for value in (0, 17, True, 'many'):
+            with self.assertRaises(ValueError):
+                candidate_count(value)
+
+class TestRequestCandidates(unittest.TestCase):
+    def test_large_requests_are_split_and_shortfalls_refilled(self):
+        calls = []
+
+        def generate(prompt, count, coalesce=True):
+            self.assertFalse(coalesce)
+            calls.append(count)
+            # Behaves like an API that ignores num_images beyond 3
+            return [f"https://ideogram.example/{len(calls)}-{i}.png" for i in range(min(count, 3))]
+
+        with patch('image_generator.generate_image_urls', side_effect=generate):
+            urls = request_candidates('a harbour', 10)
+
+        self.assertEqual(len(set(urls)), 10)
+        self.assertEqual(sorted(calls[:2]), [2, 8])
+        self.assertEqual(calls[2:], [1] * 5)
+
+class TestGenerateBestOf(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.images_dir = os.path.join(self.tmp_dir, 'images')
+        os.makedirs(self.images_dir)
+        self.cache = GenerationCache(os.path.join(self.tmp_dir, 'generations.sqlite3'), self.images_dir)
+        # The second render is the only sharp one
+        self.renders = {'https://ideogram.example/0.png': scene(0, blur=3),
+                        'https://ideogram.example/1.png': scene(1),
+                        'https://ideogram.example/2.png': scene(2, blur=3)}
+        self.patches = [
+            patch.dict(os.environ, {'IMAGES_FOLDER': self.images_dir}),
+            patch('generation_cache.get_generation_cache', return_value=self.cache),
+            patch('image_generator.generate_image_urls', return_value=list(self.renders)),
+            patch('image_fetcher.fetch_image_data', side_effect=lambda url: (self.renders[url], None)),
+        ]
+        for p in self.patches:
+            p.start()
+        Config.reload()
+        self.addCleanup(Config.reload)
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_only_the_winner_is_kept(self):
+        result = generate_image_cached('a quiet harbour', candidates=3)
+
+        ranked = result['candidates']
+        self.assertEqual(ranked[0]['url'], 'https://ideogram.example/1.png')
+        self.assertEqual([c['score'] for c in ranked], sorted((c['score'] for c in ranked), reverse=True))
+        self.assertEqual(result['imageUrl'], f"/images/{ranked[0]['name']}")
+        self.assertEqual([c['name'] for c in ranked[1:]], [None, None])
+        self.assertEqual(get_catalog(self.images_dir).count(), 1)
+
+        # The winner is what later identical best-of-3 requests get back
+        self.assertEqual(generate_image_cached('a quiet harbour', candidates=3),
+                         {'imageUrl': result['imageUrl'], 'cached': True})
+
+    def test_best_of_n_is_cached_per_candidate_count(self):
+        with patch('image_generator.generate_image_urls', return_value=list(self.renders)) as generate_urls:
+            generate_image_cached('a quiet harbour', candidates=3)
+            self.assertTrue(generate_image_cached('a quiet harbour', candidates=3)['cached'])
+            self.assertFalse(generate_image_cached('a quiet harbour', candidates=2)['cached'])
+            self.assertFalse(generate_image_cached('a quiet harbour', candidates=3, keep_all=True)['cached'])
+        self.assertEqual(generate_urls.call_count, 3)
+
+    def test_keep_all_stores_every_candidate(self):
+        result = generate_image_cached('a quiet harbour', candidates=3, keep_all=True)
+        self.assertTrue(all(c['name'] for c in result['candidates']))
+        self.assertEqual(get_catalog(self.images_dir).count(), 3)
+
+if __name__ == '__main__':
+    unittest.main()
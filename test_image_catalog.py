@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from image_catalog import ImageCatalog, hash_file
+
+class TestImageCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.images_dir = os.path.join(self.tmp_dir, 'images')
+        os.makedirs(self.images_dir)
+        self.catalog = ImageCatalog(self.images_dir, os.path.join(self.tmp_dir, 'catalog.sqlite3'))
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_image(self, name, size=(64, 36), mtime=None):
+        path = os.path.join(self.images_dir, name)
+        Image.new('RGB', size, (10, 20, 30)).save(path)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def test_refresh_indexes_images_only(self):
+        self._write_image('a.png')
+        self._write_image('b.webp', size=(160, 90))
+        with open(os.path.join(self.images_dir, 'notes.txt'), 'w') as f:
+            f.write('not an image')
+
+        self.catalog.refresh(force=True)
+        self.assertEqual(self.catalog.count(), 2)
+        row = self.catalog.get('b.webp')
+        self.assertEqual((row['width'], row['height'], row['format']), (160, 90, 'WEBP'))
+
+    def test_refresh_picks_up_additions_and_removals(self):
+        first = self._write_image('a.png')
+        self.catalog.refresh(force=True)
+
+        os.remove(first)
+        self._write_image('b.png')
+        self.catalog.refresh(force=True)
+
+        self.assertIsNone(self.catalog.get('a.png'))
+        self.assertIsNotNone(self.catalog.get('b.png'))
+
+    def test_refresh_skips_scan_when_directory_unchanged(self):
+        self._write_image('a.png')
+        self.catalog.refresh()
+
+        # Removing the row behind the catalog's back is not noticed until the folder changes
+        with self.catalog._conn:
+            self.catalog._conn.execute("DELETE FROM images")
+        self.catalog.refresh()
+        self.assertEqual(self.catalog.count(), 0)
+
+        self.catalog.refresh(force=True)
+        self.assertEqual(self.catalog.count(), 1)
+
+    def test_add_records_prompt(self):
+        path = self._write_image('a.png')
+        self.catalog.add(path, prompt='a foggy mountain pass')
+        self.assertEqual(self.catalog.get('a.png')['prompt'], 'a foggy mountain pass')
+
+        # A later scan keeps the prompt
+        self.catalog.refresh(force=True)
+        self.assertEqual(self.catalog.get('a.png')['prompt'], 'a foggy mountain pass')
+
+    def test_page_walks_all_images_in_order(self):
+        for i in range(7):
+            self._write_image(f'img_{i}.png', mtime=1_700_000_000 + i)
+        self.catalog.refresh(force=True)
+
+        names = []
+        cursor = None
+        while True:
+            rows, cursor = self.catalog.page(limit=3, cursor=cursor, sort='created', order='desc')
+            names.extend(row['name'] for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(names, [f'img_{i}.png' for i in reversed(range(7))])
+
+    def test_page_sort_by_name_ascending(self):
+        for name in ('c.png', 'a.png', 'b.png'):
+            self._write_image(name)
+        self.catalog.refresh(force=True)
+
+        rows, cursor = self.catalog.page(limit=2, sort='name', order='asc')
+        self.assertEqual([row['name'] for row in rows], ['a.png', 'b.png'])
+        rows, cursor = self.catalog.page(limit=2, cursor=cursor, sort='name', order='asc')
+        self.assertEqual([row['name'] for row in rows], ['c.png'])
+        self.assertIsNone(cursor)
+
+    def test_page_rejects_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            self.catalog.page(sort='prompt')
+        with self.assertRaises(ValueError):
+            self.catalog.page(cursor='not-a-cursor')
+
+    def test_content_hash_is_cached_until_file_changes(self):
+        path = self._write_image('a.png', mtime=1_700_000_000)
+        self.catalog.refresh(force=True)
+        self.assertIsNone(self.catalog.get('a.png')['sha256'])
+
+        first = self.catalog.content_hash('a.png')
+        self.assertEqual(first, hash_file(path))
+        self.assertEqual(self.catalog.get('a.png')['sha256'], first)
+
+        self.catalog.set_phashes({'a.png': 'ff00ff00ff00ff00'})
+        self._write_image('a.png', size=(32, 32), mtime=1_700_000_100)
+        self.assertNotEqual(self.catalog.content_hash('a.png'), first)
+        self.assertIsNone(self.catalog.content_hash('missing.png'))
+
+        # A rewrite found by hashing is reindexed in full, not just rehashed
+        row = self.catalog.get('a.png')
+        self.assertEqual((row['width'], row['height']), (32, 32))
+        self.assertIsNone(row['phash'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+import requests
+from image_fetcher import fetch_image_data
+
+class FakeResponse:
+    def __init__(self, body, headers=None, chunk_size=7, fail_after=None):
+        self.body = body
+        self.headers = headers or {}
+        self.chunk_size = chunk_size
+        self.fail_after = fail_after
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=None):
+        for start in range(0, len(self.body), self.chunk_size):
+            if self.fail_after is not None and start >= self.fail_after:
+                raise requests.exceptions.ConnectionError('connection reset')
+            yield self.body[start:start + self.chunk_size]
+
+def fake_client(response):
+    client = MagicMock()
+    client.get.return_value = response
+    return client
+
+class TestFetchImageData(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.body = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 4
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_streams_into_presized_buffer(self):
+        response = FakeResponse(self.body, {'Content-Length': str(len(self.body))})
+        with patch('image_fetcher.get_http_client', return_value=fake_client(response)):
+            data, path = fetch_image_data('https://example.com/art.png')
+
+        self.assertIsInstance(data, memoryview)
+        self.assertEqual(bytes(data), self.body)
+        self.assertIsNone(path)
+
+    def test_missing_or_wrong_content_length(self):
+        for headers in ({}, {'Content-Length': '10'}, {'Content-Length': '5000'}):
+            with patch('image_fetcher.get_http_client', return_value=fake_client(FakeResponse(self.body, headers))):
+                data, _ = fetch_image_data('https://example.com/art.png')
+            self.assertEqual(bytes(data), self.body)
+
+    def test_tee_to_archive_folder(self):
+        with patch('image_fetcher.get_http_client', return_value=fake_client(FakeResponse(self.body))):
+            data, path = fetch_image_data('https://example.com/art.png', self.tmp_dir)
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), bytes(data))
+        self.assertTrue(path.endswith('.png'))
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, '.tmp')), [])
+
+    def test_failed_download_leaves_no_partial_file(self):
+        response = FakeResponse(self.body, fail_after=100)
+        with patch('image_fetcher.get_http_client', return_value=fake_client(response)):
+            with self.assertRaises(Exception) as context:
+                fetch_image_data('https://example.com/art.png', self.tmp_dir)
+        self.assertIn('Failed to download image', str(context.exception))
+        self.assertEqual(os.listdir(self.tmp_dir), ['.tmp'])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, '.tmp')), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+from image_catalog import ImageCatalog
+from image_similarity import BKTree, SimilarityIndex, hamming, phash_files
+
+def pattern(seed, size=(256, 256)):
+    blocks = np.random.RandomState(seed).randint(0, 256, (8, 8, 3)).astype(np.uint8)
+    return Image.fromarray(blocks).resize(size, Image.BICUBIC)
+
+class TestPerceptualHash(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _save(self, image, name, **kwargs):
+        path = os.path.join(self.tmp_dir, name)
+        image.save(path, **kwargs)
+        return path
+
+    def test_survives_resize_and_recompression(self):
+        original = self._save(pattern(1), 'original.png')
+        copy = self._save(pattern(1, (200, 200)), 'copy.jpg', quality=60)
+        other = self._save(pattern(2), 'other.png')
+        hashes = {path: int(value, 16) for path, value in phash_files([original, copy, other]).items()}
+
+        self.assertLessEqual(hamming(hashes[original], hashes[copy]), 4)
+        self.assertGreater(hamming(hashes[original], hashes[other]), 16)
+
+    def test_unreadable_file_gets_empty_hash(self):
+        path = os.path.join(self.tmp_dir, 'broken.png')
+        with open(path, 'wb') as f:
+            f.write(b'not an image')
+        self.assertEqual(phash_files([path]), {path: ''})
+
+class TestBKTree(unittest.TestCase):
+    def test_search_matches_brute_force(self):
+        rng = random.Random(7)
+        values = [rng.getrandbits(64) for _ in range(500)]
+        # Plant near neighbours of the first value
+        values += [values[0] ^ (1 << bit) ^ (1 << (bit + 9)) for bit in range(5)]
+        tree = BKTree()
+        for i, value in enumerate(values):
+            tree.add(value, i)
+
+        for query in values[:20]:
+            expected = sorted(i for i, value in enumerate(values) if hamming(query, value) <= 10)
+            self.assertEqual(sorted(i for _, i in tree.search(query, 10)), expected)
+        self.assertEqual(len(tree.search(values[0], 2)), 6)
+
+class TestSimilarityIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.images_dir = os.path.join(self.tmp_dir, 'images')
+        os.makedirs(self.images_dir)
+        self.catalog = ImageCatalog(self.images_dir, os.path.join(self.tmp_dir, 'catalog.sqlite3'))
+        self.index = SimilarityIndex(self.catalog, max_distance=8)
+
+        pattern(1).save(os.path.join(self.images_dir, 'a.png'))
+        pattern(1, (128, 128)).save(os.path.join(self.images_dir, 'a_small.jpg'), quality=70)
+        pattern(2).save(os.path.join(self.images_dir, 'b.png'))
+        pattern(3).save(os.path.join(self.images_dir, 'c.png'))
+        self.index.refresh()
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_hashes_are_stored_in_catalog(self):
+        self.assertEqual(self.catalog.missing_phashes(), [])
+        self.assertEqual(int(self.catalog.get('a.png')['phash'], 16), self.index.phash('a.png'))
+
+    def test_groups_keep_largest_copy(self):
+        self.assertEqual(self.index.duplicate_groups(), [{'keep': 'a.png', 'duplicates': ['a_small.jpg']}])
+        self.assertEqual([name for _, name in self.index.similar('a.png')], ['a_small.jpg'])
+
+    def test_remove_duplicates(self):
+        self.assertEqual(self.index.remove_duplicates(dry_run=True), ['a_small.jpg'])
+        self.assertTrue(os.path.exists(os.path.join(self.images_dir, 'a_small.jpg')))
+
+        self.assertEqual(self.index.remove_duplicates(dry_run=False), ['a_small.jpg'])
+        self.assertFalse(os.path.exists(os.path.join(self.images_dir, 'a_small.jpg')))
+        self.assertIsNone(self.catalog.get('a_small.jpg'))
+        self.assertEqual(self.index.duplicate_groups(), [])
+
+    def test_chained_lookalikes_are_not_merged(self):
+        # x-y and y-z are within max_distance, x-z is not: z is no duplicate of the keeper x
+        for name, size in (('x.png', 300), ('y.png', 200), ('z.png', 100)):
+            pattern(4, (size, size)).save(os.path.join(self.images_dir, name))
+        self.index.refresh()
+        self.catalog.set_phashes({'x.png': '0' * 16, 'y.png': '0' * 12 + 'f0f0', 'z.png': '0' * 12 + 'ffff'})
+        self.index.refresh()
+
+        self.assertIn({'keep': 'x.png', 'duplicates': ['y.png']}, self.index.duplicate_groups())
+        self.assertNotIn('z.png', self.index.remove_duplicates(dry_run=True))
+
+    def test_new_images_are_indexed_incrementally(self):
+        pattern(2, (300, 300)).save(os.path.join(self.images_dir, 'b_copy.png'))
+        self.index.refresh()
+        self.assertEqual([name for _, name in self.index.similar('b.png')], ['b_copy.png'])
+
+    def test_choose_distinct_avoids_recent_lookalikes(self):
+        # Showing 'a.png' rules out its near-duplicate as well
+        chosen = {self.index.choose_distinct(['a.png', 'b.png'], rng=random.Random(seed)) for seed in range(20)}
+        self.assertEqual(chosen, {'c.png'})
+        self.assertIsNone(self.index.choose_distinct(['a.png', 'b.png', 'c.png']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from PIL import Image
+from image_catalog import ImageCatalog
+from image_store import ImageStore, hash_from_name, sniff_format
+
+def encode(fmt, color=(120, 80, 40)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 18), color).save(buffer, fmt)
+    return buffer.getvalue()
+
+class TestImageStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = ImageStore(self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sniffs_real_format(self):
+        self.assertEqual(sniff_format(encode('PNG')), 'png')
+        self.assertEqual(sniff_format(encode('JPEG')), 'jpg')
+        self.assertEqual(sniff_format(encode('WEBP')), 'webp')
+        self.assertEqual(sniff_format(encode('GIF')), 'gif')
+        with self.assertRaises(ValueError):
+            sniff_format(b'<html>Not found</html>')
+
+    def test_put_bytes_names_by_content(self):
+        data = encode('WEBP')
+        stored = self.store.put_bytes(data)
+
+        sha256 = hashlib.sha256(data).hexdigest()
+        self.assertEqual(stored.name, f"{sha256[:2]}/{sha256}.webp")
+        self.assertEqual(hash_from_name(stored.name), sha256)
+        with open(stored.path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertTrue(stored.created)
+
+    def test_identical_content_is_stored_once(self):
+        data = encode('PNG')
+        first = self.store.put_bytes(data)
+        second = self.store.put_bytes(memoryview(bytearray(data)))
+
+        self.assertEqual(first.path, second.path)
+        self.assertFalse(second.created)
+        self.assertEqual(os.listdir(os.path.dirname(first.path)), [os.path.basename(first.path)])
+
+    def test_concurrent_writers_do_not_collide(self):
+        images = [encode('PNG', (i, 0, 0)) for i in range(8)] * 2
+        results = []
+        threads = [threading.Thread(target=lambda d=d: results.append(self.store.put_bytes(d))) for d in images]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len({stored.path for stored in results}), 8)
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, '.tmp')), [])
+
+    def test_put_file_moves_into_place(self):
+        source = os.path.join(self.tmp_dir, 'generated_image.jpg')
+        with open(source, 'wb') as f:
+            f.write(encode('PNG'))
+
+        stored = self.store.put_file(source)
+        self.assertFalse(os.path.exists(source))
+        self.assertTrue(stored.path.endswith('.png'))
+
+    def test_rejected_data_leaves_nothing_behind(self):
+        with self.assertRaises(ValueError):
+            self.store.put_bytes(b'not an image at all')
+        self.assertEqual(os.listdir(self.tmp_dir), ['.tmp'])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, '.tmp')), [])
+
+    def test_catalog_indexes_sharded_images(self):
+        catalog = ImageCatalog(self.tmp_dir, os.path.join(self.tmp_dir, 'catalog.sqlite3'))
+        try:
+            stored = self.store.put_bytes(encode('PNG'))
+            catalog.refresh(force=True)
+            row = catalog.get(stored.name)
+            self.assertEqual(row['sha256'], stored.sha256)
+            self.assertEqual(catalog.content_hash(stored.name), stored.sha256)
+
+            # A new image in an existing shard is noticed without waiting for the full rescan
+            other = self.store.put_bytes(encode('PNG', (1, 2, 3)))
+            catalog.refresh()
+            self.assertIsNotNone(catalog.get(other.name))
+        finally:
+            catalog.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from config import Config
+from job_queue import JobQueue, LocalBackend, QueueFullError, create_backend
+from telemetry import TRACES, span
+
+def wait_until_done(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.images_dir = tempfile.mkdtemp()
+        self.env = patch.dict(os.environ, {'IMAGES_FOLDER': self.images_dir})
+        self.env.start()
+        Config.reload()
+        self.addCleanup(Config.reload)
+        self.backend = LocalBackend()
+        self.queue = JobQueue(self.backend, max_workers=2)
+
+    def tearDown(self):
+        self.queue.shutdown()
+        self.env.stop()
+        shutil.rmtree(self.images_dir)
+
+    def test_generate_job_returns_image_url(self):
+        job = wait_until_done(self.queue.submit('generate', {'prompt': 'a quiet harbour'}))
+
+        self.assertEqual(job.status, 'succeeded')
+        self.assertTrue(job.result['imageUrl'].startswith('local://'))
+        self.assertFalse(job.result['cached'])
+        self.assertEqual([stage['name'] for stage in job.stages], ['generate'])
+        self.assertIsNotNone(job.stages[0]['durationMs'])
+
+    def test_generate_job_keeps_the_whole_generate_result(self):
+        generated = {'imageUrl': '/images/a.png', 'cached': False, 'candidates': ['/images/a.png', '/images/b.png']}
+        queue = JobQueue(create_backend('live'), max_workers=1)
+        self.addCleanup(queue.shutdown)
+        with patch('generation_cache.generate_image_cached', return_value=generated) as generate:
+            job = wait_until_done(queue.submit('generate', {'prompt': 'dunes', 'candidates': 2, 'keepAll': True}))
+
+        self.assertEqual(job.result, generated)
+        generate.assert_called_once_with('dunes', False, 2, True)
+
+    def test_job_runs_in_submitting_trace(self):
+        with span('request') as root:
+            job = self.queue.submit('generate', {'prompt': 'a quiet harbour'})
+        wait_until_done(job)
+        # The job span closes just after the job is marked done
+        deadline = time.monotonic() + 1
+        while 'job' not in [s['name'] for s in TRACES.get(root.trace_id)] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(job.to_dict()['traceId'], root.trace_id)
+        self.assertIn('job', [s['name'] for s in TRACES.get(root.trace_id)])
+
+    def test_generate_push_runs_all_stages_without_temp_file(self):
+        job = wait_until_done(self.queue.submit('generate-push', {'prompt': 'dunes', 'tvIp': '10.0.0.2'}))
+
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual([stage['name'] for stage in job.stages], ['generate', 'download', 'push'])
+        self.assertEqual(len(self.backend.pushed), 1)
+        self.assertEqual(os.listdir(self.images_dir), [])
+
+    def test_pushed_download_can_be_archived(self):
+        with patch.dict(os.environ, {'ARCHIVE_PUSHED_IMAGES': 'true'}):
+            Config.reload()
+            job = wait_until_done(self.queue.submit('push', {'imageUrl': 'local://abc.png', 'tvIp': '10.0.0.2'}))
+
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(os.listdir(self.images_dir), ['abc.png'])
+
+    def test_push_of_local_image_skips_download(self):
+        open(os.path.join(self.images_dir, 'gallery.png'), 'wb').close()
+        job = wait_until_done(self.queue.submit('push', {'imageUrl': '/images/gallery.png', 'tvIp': '10.0.0.2'}))
+
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual([stage['name'] for stage in job.stages], ['push'])
+        self.assertTrue(os.path.exists(os.path.join(self.images_dir, 'gallery.png')))
+
+    def test_push_of_versioned_gallery_url(self):
+        open(os.path.join(self.images_dir, 'gallery.png'), 'wb').close()
+        job = wait_until_done(self.queue.submit('push', {'imageUrl': '/images/gallery.png?v=0123abcd', 'tvIp': '10.0.0.2'}))
+
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(self.backend.pushed[0][0], os.path.join(self.images_dir, 'gallery.png'))
+
+    def test_failed_stage_is_reported(self):
+        job = wait_until_done(self.queue.submit('push', {'imageUrl': '/images/missing.png', 'tvIp': '10.0.0.2'}))
+
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.stage, 'push')
+        self.assertEqual(job.stages[-1]['status'], 'failed')
+        self.assertIn('not found', job.error)
+
+    def test_submit_validates_parameters(self):
+        with self.assertRaises(ValueError):
+            self.queue.submit('generate', {})
+        with self.assertRaises(ValueError):
+            self.queue.submit('push', {'imageUrl': '/images/a.png'})
+        with self.assertRaises(ValueError):
+            self.queue.submit('teleport', {})
+
+    def test_submit_returns_before_work_finishes(self):
+        self.backend.generate_delay = 0.2
+        start = time.monotonic()
+        job = self.queue.submit('generate', {'prompt': 'slow'})
+
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertFalse(job.done)
+        self.assertEqual(wait_until_done(job).status, 'succeeded')
+
+    def test_pending_jobs_are_bounded(self):
+        self.backend.generate_delay = 0.2
+        queue = JobQueue(self.backend, max_workers=1, max_pending=2)
+        try:
+            queue.submit('generate', {'prompt': 'one'})
+            queue.submit('generate', {'prompt': 'two'})
+            with self.assertRaises(QueueFullError):
+                queue.submit('generate', {'prompt': 'three'})
+        finally:
+            queue.shutdown()
+
+    def test_create_backend(self):
+        self.assertIsInstance(create_backend('local'), LocalBackend)
+        with self.assertRaises(ValueError):
+            create_backend('carrier-pigeon')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import io
+import json
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from config import Config
+import logger as logger_module
+from logger import JsonFormatter, NonBlockingQueueHandler, attach_queue_logging, create_handlers
+from telemetry import span
+
+class TestQueueLogging(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.logger = logging.getLogger(f"DynamicTV.test.{self.id()}")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.stream = io.StringIO()
+        self.listener = None
+
+    def tearDown(self):
+        self._stop()
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        shutil.rmtree(self.tmp_dir)
+
+    def _stop(self):
+        if self.listener:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+
+    def _attach(self, **kwargs):
+        handlers = create_handlers(stream=self.stream, **kwargs)
+        self.listener = attach_queue_logging(self.logger, handlers)
+        return handlers
+
+    def test_json_lines_carry_trace_and_exception(self):
+        self._attach(log_file=None, log_format='json')
+        with span('request') as root:
+            self.logger.info("Pushed %s to %s", 'art.png', '10.0.0.2')
+        try:
+            raise ValueError("bad image")
+        except ValueError:
+            self.logger.exception("Push failed")
+        self._stop()
+
+        first, second = [json.loads(line) for line in self.stream.getvalue().splitlines()]
+        self.assertEqual(first['message'], 'Pushed art.png to 10.0.0.2')
+        self.assertEqual(first['traceId'], root.trace_id)
+        self.assertEqual(second['level'], 'ERROR')
+        self.assertIn('ValueError: bad image', second['exception'])
+
+    def test_file_is_rotated_at_size_cap(self):
+        log_file = os.path.join(self.tmp_dir, 'dynamic_tv.log')
+        self._attach(log_file=log_file, max_bytes=2000, backup_count=2)
+        for i in range(200):
+            self.logger.info(f"line {i} " + 'x' * 40)
+        self._stop()
+
+        files = sorted(os.listdir(self.tmp_dir))
+        self.assertEqual(files, ['dynamic_tv.log', 'dynamic_tv.log.1', 'dynamic_tv.log.2'])
+        for name in files:
+            self.assertLessEqual(os.path.getsize(os.path.join(self.tmp_dir, name)), 2000)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=2))
+        self.logger.addHandler(handler)
+        for i in range(5):
+            self.logger.info(f"line {i}")
+        self.assertEqual(handler.dropped, 3)
+
+    def test_json_formatter_without_queue(self):
+        record = logging.LogRecord('DynamicTV', logging.WARNING, __file__, 1, "Disk %d%% full", (91,), None)
+        self.assertEqual(json.loads(JsonFormatter().format(record))['message'], 'Disk 91% full')
+
+class TestSetupLogger(unittest.TestCase):
+    def test_repeated_setup_adds_one_handler(self):
+        logger_module.shutdown_logger()
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with patch.dict(os.environ, {'LOG_FILE': os.path.join(tmp_dir, 'app.log')}):
+                Config.reload()
+                for _ in range(3):
+                    logger = logger_module.setup_logger()
+                queue_handlers = [h for h in logger.handlers if isinstance(h, NonBlockingQueueHandler)]
+                self.assertEqual(len(queue_handlers), 1)
+
+                logger.info("written once")
+                logger_module.shutdown_logger()
+                with open(os.path.join(tmp_dir, 'app.log')) as f:
+                    self.assertEqual(f.read().count("written once"), 1)
+        finally:
+            Config.reload()
+            logger_module.shutdown_logger()
+            shutil.rmtree(tmp_dir)
+            logger_module.setup_logger()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import threading
+import time
+import unittest
+from prompt_generator import parse_prompt_list
+from prompt_pool import PromptPool
+from rate_limiter import RateLimitExceeded
+
+class FakeGenerator:
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.calls = 0
+        self.started = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def generate_prompts(self, count):
+        self.started += 1
+        self.release.wait(5)
+        self.calls += 1
+        return self.batches.pop(0) if self.batches else []
+
+class TestPromptPool(unittest.TestCase):
+    def test_empty_pool_fills_and_serves_in_order(self):
+        generator = FakeGenerator([['a misty harbour', 'a desert at dusk', 'a neon alley']])
+        pool = PromptPool(generator, batch_size=3, low_watermark=0)
+
+        self.assertEqual(pool.get(timeout=5), 'a misty harbour')
+        self.assertEqual(pool.get(timeout=5), 'a desert at dusk')
+        self.assertEqual(generator.calls, 1)
+
+    def test_refill_drops_duplicates_and_recently_served(self):
+        generator = FakeGenerator([
+            ['A misty harbour', 'a desert at dusk'],
+            ['a  misty   harbour', 'a desert at dusk', 'a glacier lagoon'],
+        ])
+        pool = PromptPool(generator, batch_size=3, low_watermark=0)
+
+        served = [pool.get(timeout=5), pool.get(timeout=5), pool.get(timeout=5)]
+        self.assertEqual(served, ['A misty harbour', 'a desert at dusk', 'a glacier lagoon'])
+
+    def test_low_watermark_triggers_background_refill(self):
+        generator = FakeGenerator([['one', 'two', 'three'], ['four', 'five']])
+        pool = PromptPool(generator, batch_size=3, low_watermark=2)
+
+        self.assertEqual(pool.get(timeout=5), 'one')
+        # The refill started by that get() runs without blocking the caller
+        with pool._cond:
+            pool._cond.wait_for(lambda: not pool._refilling, timeout=5)
+        self.assertEqual(len(pool), 4)
+        self.assertEqual(generator.calls, 2)
+
+    def test_only_one_refill_runs_at_a_time(self):
+        generator = FakeGenerator([['one']])
+        generator.release.clear()
+        pool = PromptPool(generator, batch_size=3, low_watermark=1)
+
+        pool.warm()
+        pool.warm()
+        time.sleep(0.05)
+        pool.warm()
+        self.assertEqual(generator.started, 1)
+
+        generator.release.set()
+        self.assertEqual(pool.get(timeout=5), 'one')
+
+    def test_get_returns_none_when_model_fails(self):
+        pool = PromptPool(FakeGenerator([]), batch_size=3)
+        self.assertIsNone(pool.get(timeout=5))
+
+    def test_rate_limited_refill_is_reported(self):
+        class RateLimitedGenerator:
+            def generate_prompts(self, count):
+                raise RateLimitExceeded('openrouter rate limit reached', 'openrouter', 30)
+
+        pool = PromptPool(RateLimitedGenerator(), batch_size=3)
+
+        with self.assertRaises(RateLimitExceeded):
+            pool.get(timeout=5)
+
+class TestParsePromptList(unittest.TestCase):
+    def test_json_array(self):
+        self.assertEqual(parse_prompt_list('["a", "b", "a"]'), ['a', 'b'])
+
+    def test_fenced_json_array(self):
+        self.assertEqual(parse_prompt_list('```json\n["a misty harbour", "a dune"]\n```'),
+                         ['a misty harbour', 'a dune'])
+
+    def test_numbered_lines_fallback(self):
+        content = '1. A misty harbour\n2) A desert at dusk\n\n- "A neon alley"'
+        self.assertEqual(parse_prompt_list(content), ['A misty harbour', 'A desert at dusk', 'A neon alley'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import os
+import threading
+import unittest
+from unittest.mock import patch
+from config import Config
+import requests
+from image_generator import image_urls_from_response
+from rate_limiter import (ProviderLimiter, RateLimitExceeded, SingleFlight, TokenBucket, UpstreamRateLimited,
+                          flight_key)
+import server
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_queue_at_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+
+        self.assertEqual([bucket.reserve() for _ in range(5)], [0, 0, 0, 0.5, 1.0])
+        clock.now += 1.0
+        self.assertEqual(bucket.reserve(), 0.5)
+
+    def test_wait_beyond_max_takes_nothing(self):
+        bucket = TokenBucket(rate=1, capacity=1, clock=FakeClock())
+        bucket.reserve()
+
+        self.assertEqual(bucket.reserve(max_wait=0.5), 1.0)
+        self.assertEqual(bucket.reserve(), 1.0)
+
+    def test_pause_holds_back_tokens(self):
+        bucket = TokenBucket(rate=1, capacity=5, clock=FakeClock())
+        bucket.pause(10)
+        self.assertEqual(bucket.reserve(), 10)
+
+    def test_zero_rate_is_unlimited(self):
+        bucket = TokenBucket(rate=0, capacity=1, clock=FakeClock())
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0, 0, 0])
+
+class TestSingleFlight(unittest.TestCase):
+    def _concurrent(self, flight, func, callers=4):
+        started, release = threading.Event(), threading.Event()
+        outcomes = []
+
+        def leader_func():
+            started.set()
+            release.wait(5)
+            return func()
+
+        def call(first):
+            try:
+                outcomes.append(flight.do('key', leader_func if first else func))
+            except Exception as e:
+                outcomes.append(e)
+
+        threads = [threading.Thread(target=call, args=(i == 0,)) for i in range(callers)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # Give the followers time to join the flight before it lands
+        threading.Event().wait(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_concurrent_callers_share_one_call(self):
+        calls = []
+        outcomes = self._concurrent(SingleFlight(), lambda: calls.append(1) or 'image')
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(outcomes), [('image', False)] + [('image', True)] * 3)
+
+    def test_errors_are_shared(self):
+        def fail():
+            raise ValueError('boom')
+
+        outcomes = self._concurrent(SingleFlight(), fail, callers=3)
+        self.assertTrue(all(isinstance(outcome, ValueError) for outcome in outcomes))
+
+    def test_later_calls_run_again(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('key', lambda: 1), (1, False))
+        self.assertEqual(flight.do('key', lambda: 2), (2, False))
+
+class TestProviderLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.slept = []
+        self.limiter = ProviderLimiter('ideogram', rate_per_minute=60, burst=2, max_wait=5,
+                                       clock=self.clock, sleep=self.slept.append)
+
+    def test_calls_queue_and_are_accounted(self):
+        for _ in range(3):
+            self.limiter.call(None, lambda: None)
+        self.limiter.record_usage(units=3, cost=0.24)
+
+        self.assertEqual(self.slept, [1.0])
+        usage = self.limiter.usage()
+        self.assertEqual((usage['calls'], usage['waitSeconds'], usage['units'], usage['cost']), (3, 1.0, 3, 0.24))
+        self.assertEqual(usage['limit'], {'perMinute': 60, 'burst': 2, 'maxWait': 5})
+
+    def test_full_queue_is_refused_with_retry_after(self):
+        for _ in range(7):
+            self.limiter.call(None, lambda: None)
+        with self.assertRaises(RateLimitExceeded) as caught:
+            self.limiter.call(None, lambda: None)
+
+        self.assertEqual(caught.exception.retry_after, 6.0)
+        self.assertEqual(self.limiter.usage()['rejected'], 1)
+
+    def test_throttled_backs_off_every_caller(self):
+        self.limiter.throttled(4)
+        self.limiter.call(None, lambda: None)
+
+        self.assertEqual(self.slept, [4])
+        self.assertEqual(self.limiter.usage()['throttled'], 1)
+
+    def test_identical_calls_in_flight_are_coalesced(self):
+        release = threading.Event()
+        sent = []
+
+        def send():
+            sent.append(1)
+            release.wait(5)
+            return ['https://ideogram.example/1.png']
+
+        key = flight_key('https://api.ideogram.ai', {'prompt': 'a harbour'})
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.limiter.call(key, send))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        threading.Event().wait(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(self.limiter.usage()['coalesced'], 2)
+
+class TestRateLimitedResponses(unittest.TestCase):
+    def test_final_429_raises_with_retry_after(self):
+        response = requests.Response()
+        response.status_code = 429
+        response.headers['Retry-After'] = '7'
+        limiter = ProviderLimiter('ideogram', 60, 2, clock=FakeClock())
+
+        with patch('image_generator.get_rate_limiter', return_value=limiter):
+            with self.assertRaises(UpstreamRateLimited) as caught:
+                image_urls_from_response(response)
+
+        self.assertEqual(caught.exception.retry_after, 7.0)
+        self.assertEqual(limiter.usage()['throttled'], 1)
+
+    def test_generate_image_returns_429(self):
+        env = {'IDEOGRAM_API_KEY': 'key', 'IDEOGRAM_STYLE_TYPE': 'AUTO', 'IDEOGRAM_ASPECT_RATIO': '16x9',
+               'NEGATIVE_PROMPT': 'blurry', 'IMAGES_FOLDER': '.'}
+        error = UpstreamRateLimited('Ideogram rate limit reached, try again later', 'ideogram', 2.5)
+        self.addCleanup(Config.reload)
+        with patch.dict(os.environ, env), patch('server.generate_image_cached', side_effect=error):
+            Config.reload()
+            response = server.app.test_client().post('/api/generate-image', json={'prompt': 'a harbour'})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '3')
+        self.assertEqual(response.get_json()['retryAfter'], 2.5)
+
+    def test_usage_endpoint(self):
+        body = server.app.test_client().get('/api/usage').get_json()
+        self.assertTrue(body['success'])
+        self.assertIsInstance(body['providers'], dict)
+
+if __name__ == '__main__':
+    unittest.main()
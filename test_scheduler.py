@@ -0,0 +1,149 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from config import Config
+from scheduler import CronSchedule, RotationScheduler, load_schedules
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class TestCronSchedule(unittest.TestCase):
+    def test_step_minutes(self):
+        schedule = CronSchedule('*/15 * * * *')
+        self.assertEqual(schedule.next_after(datetime(2024, 5, 1, 10, 7, 30)), datetime(2024, 5, 1, 10, 15))
+        self.assertEqual(schedule.next_after(datetime(2024, 5, 1, 10, 45)), datetime(2024, 5, 1, 11, 0))
+
+    def test_hour_range_rolls_over_to_next_day(self):
+        schedule = CronSchedule('0 8-22 * * *')
+        self.assertEqual(schedule.next_after(datetime(2024, 5, 1, 22, 0)), datetime(2024, 5, 2, 8, 0))
+
+    def test_weekday_and_alias(self):
+        # 2024-05-01 is a Wednesday; 0 = Sunday
+        self.assertEqual(CronSchedule('30 9 * * 1,5').next_after(datetime(2024, 5, 1)), datetime(2024, 5, 3, 9, 30))
+        self.assertEqual(CronSchedule('@daily').next_after(datetime(2024, 12, 31, 23, 59)), datetime(2025, 1, 1))
+
+    def test_invalid_expressions(self):
+        for expression in ['* * * *', '61 * * * *', '*/0 * * * *', 'a * * * *']:
+            with self.assertRaises(ValueError):
+                CronSchedule(expression)
+
+class TestRotationScheduler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.tmp_dir, 'scheduler', 'state.json')
+        self.clock = FakeClock(datetime(2024, 5, 1, 10, 0, 30))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def make_scheduler(self, rotate, schedules=None):
+        schedules = schedules or {'10.0.0.1': CronSchedule('*/5 * * * *'), '10.0.0.2': CronSchedule('0 * * * *')}
+        scheduler = RotationScheduler(schedules, self.state_path, rotate=rotate, max_workers=2, clock=self.clock)
+        self.addCleanup(scheduler.stop)
+        return scheduler
+
+    def wait_idle(self, scheduler):
+        deadline = time.monotonic() + 5
+        while scheduler._in_flight and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_only_due_tvs_rotate(self):
+        rotated = []
+        scheduler = self.make_scheduler(lambda tv_ip: rotated.append(tv_ip))
+
+        self.assertEqual(scheduler.run_pending(), [])
+        self.clock.now = datetime(2024, 5, 1, 10, 5)
+        self.assertEqual(scheduler.run_pending(), ['10.0.0.1'])
+        self.wait_idle(scheduler)
+
+        self.assertEqual(rotated, ['10.0.0.1'])
+        status = scheduler.status()
+        self.assertEqual(status['10.0.0.1']['lastStatus'], 'succeeded')
+        self.assertEqual(status['10.0.0.1']['nextRun'], '2024-05-01T10:10:00')
+        self.assertNotIn('lastRun', status['10.0.0.2'])
+
+    def test_slow_tv_does_not_block_others(self):
+        release = threading.Event()
+        done = []
+
+        def rotate(tv_ip):
+            if tv_ip == '10.0.0.1':
+                release.wait(5)
+            done.append(tv_ip)
+
+        scheduler = self.make_scheduler(rotate)
+        self.clock.now = datetime(2024, 5, 1, 11, 0)
+        scheduler.run_pending()
+
+        deadline = time.monotonic() + 5
+        while '10.0.0.2' not in done and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(done, ['10.0.0.2'])
+
+        # The stuck TV is not queued a second time while it is still running
+        self.clock.now = datetime(2024, 5, 1, 11, 5)
+        self.assertEqual(scheduler.run_pending(), [])
+        release.set()
+        self.wait_idle(scheduler)
+        self.assertEqual(sorted(done), ['10.0.0.1', '10.0.0.2'])
+
+    def test_failed_rotation_is_recorded(self):
+        def rotate(tv_ip):
+            raise ConnectionError('TV is off')
+
+        scheduler = self.make_scheduler(rotate)
+        scheduler.run_all_now()
+
+        status = scheduler.status()
+        self.assertEqual(status['10.0.0.1']['lastStatus'], 'failed')
+        self.assertEqual(status['10.0.0.1']['lastError'], 'TV is off')
+        self.assertFalse(status['10.0.0.1']['running'])
+
+    def test_state_survives_restart_and_catches_up(self):
+        scheduler = self.make_scheduler(lambda tv_ip: 'art.png')
+        scheduler.run_all_now()
+        scheduler.stop()
+        with open(self.state_path) as f:
+            self.assertEqual(json.load(f)['10.0.0.1']['lastImage'], 'art.png')
+
+        # Restarted after the 10:05 slot was missed: the rotation runs once, right away
+        self.clock.now = datetime(2024, 5, 1, 10, 17)
+        rotated = []
+        restarted = self.make_scheduler(lambda tv_ip: rotated.append(tv_ip))
+        self.assertEqual(restarted.status()['10.0.0.1']['lastImage'], 'art.png')
+        self.assertEqual(restarted.run_pending(), ['10.0.0.1'])
+        self.wait_idle(restarted)
+        self.assertEqual(restarted.status()['10.0.0.1']['nextRun'], '2024-05-01T10:20:00')
+
+    def test_changed_cron_recomputes_next_run(self):
+        self.make_scheduler(lambda tv_ip: None).stop()
+        restarted = self.make_scheduler(lambda tv_ip: None, {'10.0.0.1': CronSchedule('30 10 * * *')})
+        self.assertEqual(restarted.status()['10.0.0.1']['nextRun'], '2024-05-01T10:30:00')
+
+class TestLoadSchedules(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(Config.reload)
+    @patch.dict('os.environ', {'TV_SCHEDULES': '[{"tvIp": "10.0.0.1", "cron": "*/10 * * * *"}, {"tvIp": "10.0.0.2"}]'})
+    def test_multi_tv_schedules(self):
+        Config.reload()
+        schedules = load_schedules()
+        self.assertEqual(schedules['10.0.0.1'].expression, '*/10 * * * *')
+        self.assertEqual(schedules['10.0.0.2'].expression, '0 * * * *')
+
+    @patch.dict('os.environ', {'TV_SCHEDULES': '', 'TV_IP': '10.0.0.9', 'ROTATION_CRON': '@hourly'})
+    def test_single_tv_fallback(self):
+        Config.reload()
+        self.assertEqual(list(load_schedules()), ['10.0.0.9'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from config import Config
+from PIL import Image
+from image_catalog import ImageCatalog, hash_file
+from image_similarity import SimilarityIndex
+from thumbnails import ThumbnailCache
+import server
+
+class TestImageCaching(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.images_dir = os.path.join(self.tmp_dir, 'images')
+        os.makedirs(self.images_dir)
+        self.image_path = os.path.join(self.images_dir, 'art.png')
+        Image.new('RGB', (320, 180), (90, 60, 30)).save(self.image_path)
+        self.sha256 = hash_file(self.image_path)
+
+        self.catalog = ImageCatalog(self.images_dir, os.path.join(self.tmp_dir, 'catalog.sqlite3'))
+        self.catalog.refresh(force=True)
+        self.patches = [
+            patch.dict(os.environ, {'IMAGES_FOLDER': self.images_dir}),
+            patch('server.get_catalog', return_value=self.catalog),
+            patch('server.get_thumbnail_cache', return_value=ThumbnailCache(os.path.join(self.tmp_dir, 'thumbs'))),
+        ]
+        for p in self.patches:
+            p.start()
+        Config.reload()
+        self.addCleanup(Config.reload)
+        self.client = server.app.test_client()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.catalog.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_image_has_strong_content_etag(self):
+        response = self.client.get('/images/art.png')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['ETag'], f'"{self.sha256}"')
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+
+    def test_conditional_get_returns_304(self):
+        response = self.client.get('/images/art.png', headers={'If-None-Match': f'"{self.sha256}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    def test_versioned_url_is_immutable(self):
+        response = self.client.get(f'/images/art.png?v={self.sha256[:16]}')
+        cache_control = response.headers['Cache-Control']
+        self.assertIn('immutable', cache_control)
+        self.assertIn('max-age=31536000', cache_control)
+
+        # A stale version still gets the current bytes, but they must be revalidated
+        stale = self.client.get('/images/art.png?v=0000000000000000')
+        self.assertNotIn('immutable', stale.headers['Cache-Control'])
+
+    def test_range_request(self):
+        response = self.client.get('/images/art.png', headers={'Range': 'bytes=0-9'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(len(response.data), 10)
+        self.assertTrue(response.headers['Content-Range'].startswith('bytes 0-9/'))
+
+    def test_missing_image_is_404(self):
+        self.assertEqual(self.client.get('/images/missing.png').status_code, 404)
+        self.assertEqual(self.client.get('/images/../catalog.sqlite3').status_code, 404)
+
+    def test_thumbnail_etag_and_listing_urls(self):
+        thumbnail = self.client.get('/thumbnails/thumb/art.png')
+        self.assertEqual(thumbnail.headers['ETag'], f'"{self.sha256}-thumb-q80"')
+        self.assertEqual(self.client.get('/thumbnails/thumb/art.png',
+                                         headers={'If-None-Match': thumbnail.headers['ETag']}).status_code, 304)
+
+        # Once the hash is known the gallery links to versioned, immutable URLs
+        item = self.client.get('/api/list-local-images').get_json()['items'][0]
+        self.assertEqual(item['url'], f'/images/art.png?v={self.sha256[:16]}')
+        self.assertEqual(item['thumbnailUrl'], f'/thumbnails/thumb/art.png?v={self.sha256[:16]}')
+
+    def test_duplicate_cleanup_defaults_to_dry_run(self):
+        Image.new('RGB', (160, 90), (90, 60, 30)).save(os.path.join(self.images_dir, 'art_copy.jpg'))
+        with patch('server.get_similarity_index', return_value=SimilarityIndex(self.catalog)):
+            groups = self.client.get('/api/duplicates').get_json()['groups']
+            self.assertEqual(groups, [{'keep': 'art.png', 'duplicates': ['art_copy.jpg']}])
+
+            dry_run = self.client.post('/api/duplicates/cleanup', json={}).get_json()
+            self.assertEqual((dry_run['dryRun'], dry_run['removed']), (True, ['art_copy.jpg']))
+            self.assertTrue(os.path.exists(os.path.join(self.images_dir, 'art_copy.jpg')))
+
+            self.client.post('/api/duplicates/cleanup', json={'dryRun': False})
+            self.assertFalse(os.path.exists(os.path.join(self.images_dir, 'art_copy.jpg')))
+
+    def test_metrics_and_request_trace(self):
+        response = self.client.get('/images/art.png', headers={'X-Trace-Id': 'abc123'})
+        self.assertEqual(response.headers['X-Trace-Id'], 'abc123')
+        trace = self.client.get('/api/traces/abc123').get_json()
+        self.assertEqual(trace['spans'][0]['attributes']['route'], '/images/<path:filename>')
+
+        metrics = self.client.get('/metrics')
+        self.assertTrue(metrics.content_type.startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'# TYPE dynamictv_stage_duration_seconds histogram', metrics.data)
+
+class TestJobRoutes(unittest.TestCase):
+    def test_generate_job_takes_the_same_options_as_generate_image(self):
+        client = server.app.test_client()
+        with patch('server.enqueue_job', return_value=('{"success": true}', 202)) as enqueue:
+            client.post('/api/jobs', json={'type': 'generate-push', 'prompt': 'a harbour', 'tvIp': '10.0.0.2',
+                                           'force': True, 'candidates': 4, 'keepAll': True})
+            invalid = client.post('/api/jobs', json={'type': 'generate', 'prompt': 'a harbour', 'candidates': 99})
+            not_bool = client.post('/api/jobs', json={'type': 'generate', 'prompt': 'a harbour', 'keepAll': 'no'})
+            client.post('/api/jobs', json={'type': 'push', 'imageUrl': '/images/a.png', 'tvIp': '10.0.0.2'})
+
+        self.assertEqual((invalid.status_code, not_bool.status_code), (400, 400))
+        self.assertEqual(enqueue.call_args_list[0].args, ('generate-push', {
+            'prompt': 'a harbour', 'tvIp': '10.0.0.2', 'force': True, 'candidates': 4, 'keepAll': True}))
+        self.assertEqual(enqueue.call_args_list[1].args, ('push', {'imageUrl': '/images/a.png', 'tvIp': '10.0.0.2'}))
+
+if __name__ == '__main__':
+    unittest.main()
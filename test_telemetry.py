@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+import requests
+from telemetry import (Histogram, Registry, STAGE_FAILURES, STAGE_SECONDS, TRACES, current_trace_id,
+                       failure_cause, span, traced)
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        registry = Registry()
+        histogram = registry.histogram('test_seconds', 'Test durations.', ('stage',), buckets=(0.1, 1.0))
+        histogram.observe(0.05, stage='download')
+        histogram.observe(0.5, stage='download')
+        histogram.observe(5.0, stage='download')
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE test_seconds histogram', lines)
+        self.assertIn('test_seconds_bucket{stage="download",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="download",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="download",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_sum{stage="download"} 5.55', lines)
+        self.assertIn('test_seconds_count{stage="download"} 3', lines)
+
+    def test_label_values_are_escaped(self):
+        registry = Registry()
+        registry.counter('test_total', 'Test.', ('cause',)).inc(cause='say "hi"\n')
+        self.assertIn('test_total{cause="say \\"hi\\"\\n"} 1', registry.render())
+
+    def test_failure_cause_looks_through_wrapping(self):
+        try:
+            try:
+                raise requests.exceptions.ReadTimeout("read timed out")
+            except requests.exceptions.RequestException as e:
+                raise Exception(f"Failed to download image from URL: {str(e)}")
+        except Exception as wrapped:
+            self.assertEqual(failure_cause(wrapped), 'timeout')
+
+        response = requests.Response()
+        response.status_code = 429
+        self.assertEqual(failure_cause(requests.exceptions.HTTPError(response=response)), 'http_429')
+        self.assertEqual(failure_cause(ValueError("Image file is empty")), 'invalid')
+
+class TestTracing(unittest.TestCase):
+    def test_stage_spans_share_the_trace_and_feed_metrics(self):
+        uploads = STAGE_SECONDS.count(stage='upload')
+        failures = STAGE_FAILURES.value(stage='select', cause='connection')
+
+        with span('request') as root:
+            with span('upload'):
+                self.assertEqual(current_trace_id(), root.trace_id)
+            with self.assertRaises(ConnectionError):
+                with span('select'):
+                    raise ConnectionError("TV went away")
+        self.assertIsNone(current_trace_id())
+
+        spans = {s['name']: s for s in TRACES.get(root.trace_id)}
+        self.assertEqual(spans['upload']['parentId'], root.span_id)
+        self.assertEqual(spans['select']['status'], 'error')
+        self.assertEqual(STAGE_SECONDS.count(stage='upload'), uploads + 1)
+        self.assertEqual(STAGE_FAILURES.value(stage='select', cause='connection'), failures + 1)
+
+    def test_traced_async_function(self):
+        @traced('generate')
+        async def generate():
+            await asyncio.sleep(0)
+            return current_trace_id()
+
+        async def request():
+            with span('request') as root:
+                return root.trace_id, await generate()
+
+        trace_id, inner = asyncio.run(request())
+        self.assertEqual(inner, trace_id)
+        self.assertEqual([s['name'] for s in TRACES.get(trace_id)], ['request', 'generate'])
+
+if __name__ == '__main__':
+    unittest.main()
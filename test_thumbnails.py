@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from thumbnails import ThumbnailCache, THUMBNAIL_SIZES
+
+class TestThumbnailCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.source = os.path.join(self.tmp_dir, 'source.jpg')
+        Image.new('RGB', (1920, 1080), (200, 100, 50)).save(self.source, 'JPEG')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_renders_within_bounding_box(self):
+        cache = ThumbnailCache(self.cache_dir)
+        path = cache.get(self.source, 'thumb')
+
+        with Image.open(path) as im:
+            self.assertEqual(im.format, 'WEBP')
+            self.assertLessEqual(im.width, THUMBNAIL_SIZES['thumb'][0])
+            self.assertLessEqual(im.height, THUMBNAIL_SIZES['thumb'][1])
+        self.assertLess(os.path.getsize(path), os.path.getsize(self.source))
+
+    def test_get_reuses_cached_derivative(self):
+        cache = ThumbnailCache(self.cache_dir)
+        first = cache.get(self.source, 'thumb')
+
+        second = cache.get(self.source, 'thumb')
+        self.assertEqual(first, second)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_modified_source_gets_new_key(self):
+        cache = ThumbnailCache(self.cache_dir)
+        first = cache.get(self.source, 'thumb')
+
+        Image.new('RGB', (800, 600), (0, 0, 255)).save(self.source, 'JPEG')
+        os.utime(self.source, ns=(0, os.stat(self.source).st_mtime_ns + 10**9))
+        second = cache.get(self.source, 'thumb')
+        self.assertNotEqual(first, second)
+
+    def test_eviction_respects_byte_budget(self):
+        cache = ThumbnailCache(self.cache_dir, max_bytes=1)
+        thumb = cache.get(self.source, 'thumb')
+        preview = cache.get(self.source, 'preview')
+
+        # Only the most recently rendered entry survives a 1 byte budget
+        self.assertFalse(os.path.exists(thumb))
+        self.assertTrue(os.path.exists(preview))
+        self.assertEqual(cache.total_bytes, os.path.getsize(preview))
+
+    def test_cache_state_survives_restart(self):
+        cache = ThumbnailCache(self.cache_dir)
+        path = cache.get(self.source, 'preview')
+
+        reloaded = ThumbnailCache(self.cache_dir)
+        self.assertEqual(reloaded.total_bytes, os.path.getsize(path))
+
+    def test_unknown_size_rejected(self):
+        cache = ThumbnailCache(self.cache_dir)
+        with self.assertRaises(ValueError):
+            cache.get(self.source, 'huge')
+
+if __name__ == '__main__':
+    unittest.main()
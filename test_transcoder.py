@@ -0,0 +1,74 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from config import Config
+from PIL import Image
+from transcoder import TranscodeCache, panel_resolution, parse_resolution
+
+def encode(size, fmt, color=(120, 80, 40)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, fmt)
+    return buffer.getvalue()
+
+class TestTranscodeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = TranscodeCache(self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_webp_is_converted_to_jpeg_at_panel_resolution(self):
+        payload = self.cache.transcode(encode((1536, 864), 'WEBP'), (3840, 2160))
+        with Image.open(io.BytesIO(payload)) as im:
+            self.assertEqual(im.format, 'JPEG')
+            self.assertEqual(im.size, (3840, 2160))
+
+    def test_other_aspect_ratios_are_cropped_to_fill(self):
+        payload = self.cache.transcode(encode((1024, 1024), 'PNG'), (1920, 1080))
+        with Image.open(io.BytesIO(payload)) as im:
+            self.assertEqual(im.size, (1920, 1080))
+
+    def test_repeat_transcode_is_served_from_cache(self):
+        source = encode((800, 450), 'PNG')
+        first = self.cache.transcode(source, (1920, 1080))
+
+        with patch.object(TranscodeCache, '_encode') as encode_mock:
+            second = self.cache.transcode(source, (1920, 1080))
+        encode_mock.assert_not_called()
+        self.assertEqual(first, second)
+
+    def test_exact_jpeg_is_passed_through(self):
+        source = encode((1920, 1080), 'JPEG')
+        self.assertEqual(self.cache.transcode(source, (1920, 1080)), source)
+
+    def test_memoryview_input_matches_bytes(self):
+        source = encode((800, 450), 'PNG')
+        from_view = self.cache.transcode(memoryview(bytearray(source)), (1920, 1080))
+        self.assertEqual(from_view, self.cache.transcode(source, (1920, 1080)))
+        with Image.open(io.BytesIO(from_view)) as im:
+            self.assertEqual(im.size, (1920, 1080))
+
+    def test_invalid_data_rejected(self):
+        with self.assertRaises(ValueError):
+            self.cache.transcode(b'not an image', (1920, 1080))
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+class TestPanelResolution(unittest.TestCase):
+    def test_parse_resolution(self):
+        self.assertEqual(parse_resolution('3840x2160'), (3840, 2160))
+        self.assertIsNone(parse_resolution('4k'))
+        self.assertIsNone(parse_resolution(None))
+
+    def test_device_info_takes_precedence(self):
+        self.addCleanup(Config.reload)
+        with patch.dict(os.environ, {'TV_RESOLUTION': '3840x2160'}):
+            Config.reload()
+            self.assertEqual(panel_resolution({'resolution': '1920x1080'}), (1920, 1080))
+            self.assertEqual(panel_resolution({}), (3840, 2160))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+from unittest.mock import patch
+from tv_connection import TVConnectionManager
+
+class FakeArt:
+    def __init__(self, host, fail_open=False):
+        self.host = host
+        self.fail_open = fail_open
+        self.opened = False
+        self.closed = False
+        self.version_calls = 0
+
+    def open(self):
+        if self.fail_open:
+            raise OSError('No route to host')
+        self.opened = True
+
+    def get_api_version(self):
+        self.version_calls += 1
+        if self.closed:
+            raise ConnectionError('socket closed')
+        return '4.3.4.0'
+
+    def close(self):
+        self.closed = True
+
+class TestTVConnectionManager(unittest.TestCase):
+    def setUp(self):
+        self.created = []
+        self.fail_open = False
+
+        def factory(host):
+            art = FakeArt(host, fail_open=self.fail_open)
+            self.created.append(art)
+            return art
+
+        self.manager = TVConnectionManager(art_factory=factory, health_interval=30)
+
+    def test_session_is_reused(self):
+        with self.manager.session('10.0.0.2') as first:
+            pass
+        with self.manager.session('10.0.0.2') as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.created), 1)
+        # Only the connect handshake asked for the version; the reuse was trusted
+        self.assertEqual(first.version_calls, 1)
+
+    def test_each_tv_gets_its_own_session(self):
+        with self.manager.session('10.0.0.2') as first:
+            pass
+        with self.manager.session('10.0.0.3') as second:
+            pass
+        self.assertIsNot(first, second)
+
+    def test_idle_session_is_health_checked(self):
+        with patch('tv_connection.time.monotonic', return_value=1000.0):
+            with self.manager.session('10.0.0.2') as art:
+                pass
+        with patch('tv_connection.time.monotonic', return_value=1100.0):
+            with self.manager.session('10.0.0.2') as again:
+                pass
+
+        self.assertIs(art, again)
+        self.assertEqual(art.version_calls, 2)
+
+    def test_failed_health_check_reconnects(self):
+        with patch('tv_connection.time.monotonic', return_value=1000.0):
+            with self.manager.session('10.0.0.2') as art:
+                pass
+        art.closed = True
+        with patch('tv_connection.time.monotonic', return_value=1100.0):
+            with self.manager.session('10.0.0.2') as again:
+                pass
+
+        self.assertIsNot(art, again)
+        self.assertEqual(len(self.created), 2)
+
+    def test_error_inside_session_drops_connection(self):
+        with self.assertRaises(RuntimeError):
+            with self.manager.session('10.0.0.2'):
+                raise RuntimeError('upload failed')
+        self.assertTrue(self.created[0].closed)
+
+        with self.manager.session('10.0.0.2') as art:
+            self.assertIs(art, self.created[1])
+
+    def test_unreachable_tv_backs_off(self):
+        self.fail_open = True
+        with self.assertRaises(ConnectionError):
+            with self.manager.session('10.0.0.9'):
+                pass
+
+        # Within the backoff window the manager fails fast without dialling again
+        with self.assertRaises(ConnectionError) as context:
+            with self.manager.session('10.0.0.9'):
+                pass
+        self.assertIn('retrying in', str(context.exception))
+        self.assertEqual(len(self.created), 1)
+
+    def test_check_bypasses_backoff(self):
+        self.fail_open = True
+        with self.assertRaises(ConnectionError):
+            self.manager.check('10.0.0.9')
+
+        self.fail_open = False
+        self.assertEqual(self.manager.check('10.0.0.9'), '4.3.4.0')
+
+    def test_failed_device_info_is_not_retried_at_once(self):
+        calls = []
+
+        def fetch(host):
+            calls.append(host)
+            raise ConnectionError("TV is off")
+
+        manager = TVConnectionManager(device_info_fetcher=fetch)
+        self.assertEqual([manager.device_info('10.0.0.9') for _ in range(3)], [{}, {}, {}])
+        self.assertEqual(len(calls), 1)
+
+        with patch('tv_connection.DEVICE_INFO_RETRY', 0):
+            manager.device_info('10.0.0.9')
+        self.assertEqual(len(calls), 2)
+
+if __name__ == '__main__':
+    unittest.main()
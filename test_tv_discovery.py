@@ -0,0 +1,95 @@
+import asyncio
+import socket
+import time
+import unittest
+from unittest.mock import patch
+from fake_services import FakeFrameTV, FakeSSDPResponder
+from tv_connection import TVConnectionManager
+from tv_discovery import TVDiscovery, scan_hosts, subnet_hosts
+import server
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class TestSubnet(unittest.TestCase):
+    def test_hosts_exclude_network_and_broadcast(self):
+        self.assertEqual(subnet_hosts('192.168.1.0/30'), ['192.168.1.1', '192.168.1.2'])
+        self.assertEqual(subnet_hosts('192.168.1.7/32'), ['192.168.1.7'])
+
+    def test_large_subnet_is_refused(self):
+        with self.assertRaises(ValueError):
+            subnet_hosts('10.0.0.0/16')
+
+class TestDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.tv = FakeFrameTV(model='QE65LS03B').start()
+        self.ssdp = FakeSSDPResponder().start()
+        self.manager = TVConnectionManager(port=self.tv.port, timeout=2)
+        self.now = 1000.0
+
+    def tearDown(self):
+        self.manager.close()
+        self.ssdp.stop()
+        self.tv.stop()
+
+    def discovery(self, subnet):
+        return TVDiscovery(self.manager, subnet=subnet, ttl=60, ssdp_address=self.ssdp.address, ssdp_wait=0.2,
+                           probe_timeout=0.3, clock=lambda: self.now)
+
+    def test_subnet_probe_finds_tv_with_details(self):
+        result = self.discovery('127.0.0.0/24').discover()
+
+        self.assertFalse(result['cached'])
+        self.assertEqual(result['tvs'], [{
+            'ip': '127.0.0.1', 'name': None, 'model': 'QE65LS03B', 'resolution': '3840x2160',
+            'frameTV': True, 'artApiVersion': '4.3.4.0', 'source': 'ssdp',
+        }])
+        self.assertEqual(self.ssdp.searches, 2)
+
+    def test_ssdp_answer_is_confirmed_by_probe(self):
+        # Nothing listens on 127.0.0.2, so only the SSDP reply leads to the TV
+        result = self.discovery('127.0.0.2/32').discover()
+        self.assertEqual([(tv['ip'], tv['source']) for tv in result['tvs']], [('127.0.0.1', 'ssdp')])
+
+    def test_results_are_cached_until_ttl(self):
+        discovery = self.discovery('127.0.0.1/32')
+        first = discovery.discover()
+        self.assertTrue(discovery.discover()['cached'])
+
+        self.now += 61
+        self.assertFalse(discovery.discover()['cached'])
+        self.assertFalse(discovery.discover(refresh=True)['cached'])
+        self.assertEqual(discovery.discover()['tvs'], first['tvs'])
+
+    def test_probe_is_concurrent(self):
+        started = time.monotonic()
+        found = asyncio.run(scan_hosts(subnet_hosts('127.0.0.0/24'), self.tv.port, timeout=0.5))
+        self.assertEqual(found, ['127.0.0.1'])
+        self.assertLess(time.monotonic() - started, 2)
+
+class TestDiscoveryRoutes(unittest.TestCase):
+    def test_check_tv_ip_fails_fast_without_a_listener(self):
+        manager = TVConnectionManager(port=closed_port(), timeout=10)
+        started = time.monotonic()
+        with patch('server.get_connection_manager', return_value=manager):
+            response = server.app.test_client().post('/api/check-tv-ip', json={'tvIp': '127.0.0.1'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_discover_tvs_route(self):
+        class FakeDiscovery:
+            def discover(self, refresh=False):
+                return {'tvs': [{'ip': '192.168.1.55'}], 'scannedAt': 1.0, 'seconds': 0.4, 'cached': not refresh}
+
+        with patch('server.get_tv_discovery', return_value=FakeDiscovery()):
+            body = server.app.test_client().get('/api/discover-tvs?refresh=true').get_json()
+
+        self.assertTrue(body['success'])
+        self.assertFalse(body['cached'])
+        self.assertEqual(body['tvs'], [{'ip': '192.168.1.55'}])
+
+if __name__ == '__main__':
+    unittest.main()
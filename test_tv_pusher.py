@@ -0,0 +1,156 @@
+import io
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from unittest.mock import patch
+from PIL import Image
+from config import Config
+from transcoder import TranscodeCache
+from tv_connection import TVConnectionManager
+from tv_content_index import TVContentIndex
+from upload_monitor import ProcessingTimes
+import tv_pusher
+
+class FakeArt:
+    """In-memory stand-in for the samsungtvws art-mode client."""
+
+    def __init__(self):
+        self.content = {}
+        self.uploads = []
+        self.selected = []
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get_api_version(self):
+        return '4.3.4.0'
+
+    def upload(self, data, file_type='png', matte='none', **kwargs):
+        content_id = f"MY_F{len(self.uploads) + 1:04d}"
+        self.uploads.append({'data': bytes(data), 'file_type': file_type})
+        self.content[content_id] = {'content_id': content_id, 'category_id': 'MY-C0002'}
+        return content_id
+
+    def available(self, category=None):
+        return list(self.content.values())
+
+    def select_image(self, content_id, category=None, show=True):
+        self.selected.append(content_id)
+        return {'content_id': content_id}
+
+class TestPushImageToTV(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.image_path = os.path.join(self.tmp_dir, 'art.jpg')
+        Image.new('RGB', (320, 180), (90, 60, 30)).save(self.image_path, 'JPEG')
+
+        self.art = FakeArt()
+        self.manager = TVConnectionManager(
+            art_factory=lambda host: self.art,
+            device_info_fetcher=lambda host: {'modelName': 'QE55LS03B', 'resolution': '3840x2160'}
+        )
+        self.processing_times = ProcessingTimes(os.path.join(self.tmp_dir, 'times.json'))
+        self.content_index = TVContentIndex(os.path.join(self.tmp_dir, 'content_index.json'))
+        self.transcode_cache = TranscodeCache(os.path.join(self.tmp_dir, 'transcoded'))
+        self.patches = [
+            patch('tv_pusher.get_connection_manager', return_value=self.manager),
+            patch('tv_pusher.get_processing_times', return_value=self.processing_times),
+            patch('tv_pusher.get_content_index', return_value=self.content_index),
+            patch('tv_pusher.get_transcode_cache', return_value=self.transcode_cache),
+            patch('tv_pusher.get_tv_storage'),
+        ]
+        for p in self.patches:
+            p.start()
+        self.storage = self.patches[-1].target.get_tv_storage.return_value
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_push_uploads_and_selects(self):
+        self.assertTrue(tv_pusher.push_image_to_tv(self.image_path, '10.0.0.2'))
+
+        self.assertEqual(len(self.art.uploads), 1)
+        self.assertEqual(self.art.selected, ['MY_F0001'])
+        self.assertIsNotNone(self.processing_times.estimate('QE55LS03B'))
+
+        # The payload is re-encoded for the panel reported by the device info
+        with Image.open(io.BytesIO(self.art.uploads[0]['data'])) as im:
+            self.assertEqual((im.format, im.size), ('JPEG', (3840, 2160)))
+
+    def test_repeat_push_selects_without_uploading(self):
+        first = tv_pusher.push_image_to_tv(self.image_path, '10.0.0.2')
+        second = tv_pusher.push_image_to_tv(self.image_path, '10.0.0.2')
+
+        self.assertTrue(first['uploaded'])
+        self.assertFalse(second['uploaded'])
+        self.assertEqual(second['contentId'], first['contentId'])
+        self.assertEqual(len(self.art.uploads), 1)
+        self.assertEqual(self.art.selected, ['MY_F0001', 'MY_F0001'])
+
+    def test_upload_schedules_storage_cleanup(self):
+        tv_pusher.push_image_to_tv(self.image_path, '10.0.0.2')
+        tv_pusher.push_image_to_tv(self.image_path, '10.0.0.2')
+
+        # Only the push that added an image to the TV can take it over budget
+        self.storage.schedule.assert_called_once_with('10.0.0.2')
+        self.assertEqual(self.content_index.usage('10.0.0.2')['bytes'], len(self.art.uploads[0]['data']))
+
+    def test_image_deleted_on_tv_is_uploaded_again(self):
+        tv_pusher.push_image_to_tv(self.image_path, '10.0.0.2')
+        self.art.content.clear()
+
+        result = tv_pusher.push_image_to_tv(self.image_path, '10.0.0.2')
+        self.assertTrue(result['uploaded'])
+        self.assertEqual(len(self.art.uploads), 2)
+
+    def test_push_from_memory_reports_peak_memory(self):
+        with open(self.image_path, 'rb') as f:
+            data = memoryview(bytearray(f.read()))
+
+        self.addCleanup(Config.reload)
+        with patch.dict(os.environ, {'TRACE_PUSH_MEMORY': 'true'}):
+            Config.reload()
+            result = tv_pusher.push_image_data_to_tv(data, '10.0.0.2', 'https://example.com/art.jpg')
+        self.assertTrue(result['uploaded'])
+        self.assertGreater(result['peakMemoryBytes'], 0)
+        self.assertEqual(self.art.selected, ['MY_F0001'])
+
+        # Same content as the file on disk, so a path push is recognised as a repeat
+        self.assertFalse(tv_pusher.push_image_to_tv(self.image_path, '10.0.0.2')['uploaded'])
+
+    def test_memory_is_not_traced_by_default(self):
+        self.assertIsNone(tv_pusher.push_image_to_tv(self.image_path, '10.0.0.2')['peakMemoryBytes'])
+
+    def test_overlapping_pushes_do_not_share_a_measurement(self):
+        self.addCleanup(Config.reload)
+        with patch.dict(os.environ, {'TRACE_PUSH_MEMORY': 'true'}):
+            Config.reload()
+            with tv_pusher.track_peak_memory() as outer:
+                with tv_pusher.track_peak_memory() as inner:
+                    pass
+                # The inner push must not have stopped the outer measurement
+                self.assertTrue(tracemalloc.is_tracing())
+        self.assertIsNone(inner['peakBytes'])
+        self.assertIsNotNone(outer['peakBytes'])
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_push_requires_tv_ip(self):
+        with self.assertRaises(Exception) as context:
+            tv_pusher.push_image_to_tv(self.image_path, None)
+        self.assertIn('TV IP address is required', str(context.exception))
+
+    def test_push_missing_file(self):
+        with self.assertRaises(Exception) as context:
+            tv_pusher.push_image_to_tv(os.path.join(self.tmp_dir, 'missing.jpg'), '10.0.0.2')
+        self.assertIn('Image file not found', str(context.exception))
+        self.assertEqual(self.art.uploads, [])
+
+if __name__ == '__main__':
+    unittest.main()
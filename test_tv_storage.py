@@ -0,0 +1,120 @@
+import itertools
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from tv_connection import TVConnectionManager
+from tv_content_index import TVContentIndex
+from tv_storage import TVStorageManager
+import server
+
+TV = '10.0.0.2'
+
+class FakeArt:
+    def __init__(self, content_ids, keep=()):
+        self.content = {content_id: {'content_id': content_id} for content_id in content_ids}
+        # Ids the TV refuses to delete, e.g. because they are in use
+        self.keep = set(keep)
+        self.batches = []
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get_api_version(self):
+        return '4.3.4.0'
+
+    def available(self, category=None):
+        return list(self.content.values())
+
+    def delete_list(self, content_ids):
+        self.batches.append(list(content_ids))
+        for content_id in content_ids:
+            if content_id not in self.keep:
+                self.content.pop(content_id, None)
+        return not self.keep.intersection(content_ids)
+
+class TestStorageBudget(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index = TVContentIndex(os.path.join(self.tmp_dir, 'content_index.json'))
+        # Every index write is one second later than the previous one
+        self.clock = patch('tv_content_index.time')
+        self.clock.start().time.side_effect = itertools.count(1000)
+        for n in range(1, 8):
+            self.index.record(TV, f'hash{n}', f'MY_F{n:04d}', size=100)
+
+    def tearDown(self):
+        self.clock.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_least_recently_shown_are_evicted_first(self):
+        self.index.mark_shown(TV, 'hash1')
+        self.assertEqual(self.index.evictable(TV, max_items=4, max_bytes=0),
+                         ['MY_F0002', 'MY_F0003', 'MY_F0004'])
+        self.assertEqual(self.index.evictable(TV, max_items=0, max_bytes=550), ['MY_F0002', 'MY_F0003'])
+        self.assertEqual(self.index.evictable(TV, max_items=10, max_bytes=0), [])
+
+    def test_image_on_screen_is_never_evicted(self):
+        self.assertEqual(self.index.evictable(TV, max_items=1, max_bytes=1)[-1], 'MY_F0006')
+
+    def test_collect_deletes_in_batches(self):
+        art = FakeArt(f'MY_F{n:04d}' for n in range(1, 8))
+        manager = TVConnectionManager(art_factory=lambda host: art)
+        storage = TVStorageManager(self.index, manager, max_items=3, max_bytes=0, batch_size=3)
+
+        self.assertEqual(storage.collect(TV), 4)
+        self.assertEqual(art.batches, [['MY_F0001', 'MY_F0002', 'MY_F0003'], ['MY_F0004']])
+        self.assertEqual(sorted(art.content), ['MY_F0005', 'MY_F0006', 'MY_F0007'])
+        self.assertEqual(storage.status(TV)['items'], 3)
+        self.assertEqual(storage.status(TV)['deleted'], 4)
+
+    def test_refused_deletes_stay_indexed(self):
+        art = FakeArt((f'MY_F{n:04d}' for n in range(1, 8)), keep={'MY_F0002'})
+        manager = TVConnectionManager(art_factory=lambda host: art)
+        storage = TVStorageManager(self.index, manager, max_items=5, max_bytes=0)
+
+        self.assertEqual(storage.collect(TV), 1)
+        self.assertEqual(self.index.usage(TV)['items'], 6)
+        self.assertIsNotNone(self.index.lookup(TV, 'hash2'))
+
+    def test_within_budget_does_not_connect(self):
+        def refuse(host):
+            raise AssertionError('connected to the TV')
+
+        storage = TVStorageManager(self.index, TVConnectionManager(art_factory=refuse), max_items=10)
+        self.assertEqual(storage.collect(TV), 0)
+
+    def test_scheduled_cleanup_runs_in_background(self):
+        art = FakeArt(f'MY_F{n:04d}' for n in range(1, 8))
+        storage = TVStorageManager(self.index, TVConnectionManager(art_factory=lambda host: art),
+                                   max_items=2, max_bytes=0, delay=0)
+        try:
+            storage.schedule(TV)
+            deadline = time.monotonic() + 5
+            while self.index.usage(TV)['items'] > 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            storage.stop()
+        self.assertEqual(sorted(art.content), ['MY_F0006', 'MY_F0007'])
+
+class TestStorageRoutes(unittest.TestCase):
+    def test_cleanup_route_schedules_immediately(self):
+        with patch('server.get_tv_storage') as get_storage:
+            storage = get_storage.return_value
+            storage.status.return_value = {'items': 60, 'bytes': 6000, 'cleanupPending': True}
+            client = server.app.test_client()
+            response = client.post('/api/tv-storage/cleanup', json={'tvIp': TV})
+            missing = client.get('/api/tv-storage')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response.get_json()['cleanupPending'])
+        storage.schedule.assert_called_once_with(TV, delay=0)
+        self.assertEqual(missing.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from upload_monitor import ProcessingTimes, wait_for_upload
+
+class FakeArt:
+    def __init__(self, ready_after_polls):
+        self.ready_after_polls = ready_after_polls
+        self.polls = 0
+
+    def available(self):
+        self.polls += 1
+        items = [{'content_id': 'MY_F0001'}]
+        if self.polls > self.ready_after_polls:
+            items.append({'content_id': 'MY_F0002'})
+        return items
+
+class TestWaitForUpload(unittest.TestCase):
+    def test_returns_as_soon_as_content_is_listed(self):
+        art = FakeArt(ready_after_polls=0)
+        with patch('upload_monitor.time.sleep') as sleep:
+            wait_for_upload(art, 'MY_F0002')
+        self.assertEqual(art.polls, 1)
+        sleep.assert_not_called()
+
+    def test_poll_interval_grows_up_to_the_cap(self):
+        art = FakeArt(ready_after_polls=6)
+        with patch('upload_monitor.time.sleep') as sleep:
+            wait_for_upload(art, 'MY_F0002', min_interval=0.1, max_interval=0.3)
+
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 6)
+        self.assertAlmostEqual(delays[0], 0.1)
+        self.assertTrue(all(a <= b for a, b in zip(delays, delays[1:])))
+        self.assertAlmostEqual(delays[-1], 0.3)
+
+    def test_expected_time_is_mostly_slept_up_front(self):
+        art = FakeArt(ready_after_polls=0)
+        with patch('upload_monitor.time.sleep') as sleep:
+            wait_for_upload(art, 'MY_F0002', expected=2.0)
+        sleep.assert_called_once_with(1.6)
+
+    def test_times_out(self):
+        art = FakeArt(ready_after_polls=10**6)
+        with self.assertRaises(TimeoutError):
+            wait_for_upload(art, 'MY_F0002', timeout=0.05, min_interval=0.01, max_interval=0.01)
+
+class TestProcessingTimes(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'tv', 'processing_times.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_record_smooths_and_persists(self):
+        times = ProcessingTimes(self.path, smoothing=0.5)
+        self.assertIsNone(times.estimate('QE55LS03B'))
+
+        times.record('QE55LS03B', 2.0)
+        times.record('QE55LS03B', 4.0)
+        self.assertAlmostEqual(times.estimate('QE55LS03B'), 3.0)
+
+        reloaded = ProcessingTimes(self.path)
+        self.assertAlmostEqual(reloaded.estimate('QE55LS03B'), 3.0)
+        self.assertIsNone(reloaded.estimate('QE32LS03B'))
+
+if __name__ == '__main__':
+    unittest.main()
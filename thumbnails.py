@@ -0,0 +1,75 @@
+import hashlib
+import os
+import threading
+from PIL import Image
+from config import Config
+from disk_cache import DiskCache
+
+# Bounding boxes for each derivative. Aspect ratio is preserved inside the box.
+THUMBNAIL_SIZES = {
+    'thumb': (480, 270),
+    'preview': (1280, 720),
+}
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_QUALITY = 80
+
+
+class ThumbnailCache:
+    """On-disk cache of resized gallery derivatives with LRU eviction.
+
+    Derivatives are keyed by the source's absolute path, mtime and size, so an
+    edited or replaced original simply produces a new key and the stale entry
+    ages out of the cache.
+    """
+
+    def __init__(self, cache_folder, max_bytes=DEFAULT_MAX_BYTES, quality=DEFAULT_QUALITY):
+        self.cache_folder = cache_folder
+        self.quality = quality
+        self._cache = DiskCache(cache_folder, max_bytes, '.webp')
+
+    @property
+    def total_bytes(self):
+        return self._cache.total_bytes
+
+    def cache_key(self, source_path, variant):
+        st = os.stat(source_path)
+        width, height = THUMBNAIL_SIZES[variant]
+        raw = f"{os.path.abspath(source_path)}|{st.st_mtime_ns}|{st.st_size}|{width}x{height}|{self.quality}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, source_path, variant):
+        """Returns the path of the cached derivative, rendering it on a miss."""
+        if variant not in THUMBNAIL_SIZES:
+            raise ValueError(f"Unknown thumbnail size: {variant}")
+
+        key = self.cache_key(source_path, variant)
+        cached_path = self._cache.lookup(key)
+        if cached_path:
+            return cached_path
+        return self._cache.store(key, lambda tmp_path: self._render(source_path, tmp_path, THUMBNAIL_SIZES[variant]))
+
+    def _render(self, source_path, tmp_path, box):
+        with Image.open(source_path) as im:
+            # JPEG can decode at a reduced scale, which skips most of the work
+            im.draft('RGB', box)
+            im.thumbnail(box, Image.LANCZOS)
+            if im.mode not in ('RGB', 'RGBA'):
+                im = im.convert('RGBA' if 'A' in im.getbands() else 'RGB')
+            im.save(tmp_path, 'WEBP', quality=self.quality, method=4)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_thumbnail_cache():
+    """Returns the process-wide thumbnail cache configured from the environment."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ThumbnailCache(
+                Config.get_env('THUMBNAIL_CACHE_FOLDER') or Config.get_cache_folder('thumbnails'),
+                max_bytes=int(Config.get_env('THUMBNAIL_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+                quality=int(Config.get_env('THUMBNAIL_QUALITY', DEFAULT_QUALITY)),
+            )
+        return _cache
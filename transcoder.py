@@ -0,0 +1,130 @@
+import hashlib
+import io
+import threading
+from PIL import Image, ImageOps
+from config import Config
+from disk_cache import DiskCache
+from telemetry import traced
+
+# Frame panels are 4K except the 32" model, which is 1920x1080
+DEFAULT_RESOLUTION = (3840, 2160)
+DEFAULT_QUALITY = 90
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def parse_resolution(value):
+    """Parses '3840x2160' into (3840, 2160). Returns None for anything else."""
+    try:
+        width, height = (int(part) for part in str(value).lower().split('x'))
+        return (width, height) if width > 0 and height > 0 else None
+    except ValueError:
+        return None
+
+
+def panel_resolution(device_info):
+    """Picks the native resolution from the TV's device info, falling back to TV_RESOLUTION."""
+    return (parse_resolution((device_info or {}).get('resolution'))
+            or parse_resolution(Config.get_env('TV_RESOLUTION'))
+            or DEFAULT_RESOLUTION)
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable read-only file over a bytes-like object, without copying it like io.BytesIO does."""
+
+    def __init__(self, data):
+        self._view = memoryview(data).cast('B')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def readinto(self, b):
+        chunk = self._view[self._pos:self._pos + len(b)]
+        b[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+
+def open_image_data(data):
+    """Opens an in-memory image; bytes are shared by BytesIO, other buffers are read in place."""
+    return Image.open(io.BytesIO(data) if isinstance(data, bytes) else _BufferReader(data))
+
+
+class TranscodeCache:
+    """Converts images to a JPEG at the panel's exact resolution, cached by content hash.
+
+    Pushing the same image again returns the cached payload byte-for-byte, so
+    repeats never pay for a decode or encode.
+    """
+
+    def __init__(self, cache_folder, max_bytes=DEFAULT_MAX_BYTES, quality=DEFAULT_QUALITY):
+        self.quality = quality
+        self._cache = DiskCache(cache_folder, max_bytes, '.jpg')
+
+    def cache_key(self, data, resolution):
+        width, height = resolution
+        return f"{hashlib.sha256(data).hexdigest()}_{width}x{height}_q{self.quality}"
+
+    @traced('transcode')
+    def transcode(self, data, resolution=DEFAULT_RESOLUTION):
+        """Returns JPEG bytes for data, cropped and scaled to fill resolution exactly.
+
+        data may be bytes or any buffer such as a memoryview; it is never copied.
+        """
+        key = self.cache_key(data, resolution)
+        cached_path = self._cache.lookup(key)
+        if not cached_path:
+            cached_path = self._cache.store(key, lambda tmp_path: self._encode(data, resolution, tmp_path))
+        with open(cached_path, 'rb') as f:
+            return f.read()
+
+    def _encode(self, data, resolution, tmp_path):
+        try:
+            im = open_image_data(data)
+        except Exception as e:
+            raise ValueError(f"Unsupported image data: {str(e)}")
+
+        with im:
+            # An already-correct JPEG is passed through untouched to avoid generation loss
+            if im.format == 'JPEG' and im.size == tuple(resolution) and not im.getexif().get(0x0112):
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                return
+
+            im = ImageOps.exif_transpose(im)
+            if im.mode != 'RGB':
+                im = im.convert('RGB')
+            if im.size != tuple(resolution):
+                im = ImageOps.fit(im, resolution, Image.LANCZOS)
+            im.save(tmp_path, 'JPEG', quality=self.quality, optimize=True)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_transcode_cache():
+    """Returns the process-wide transcode cache configured from the environment."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TranscodeCache(
+                Config.get_cache_folder('transcoded'),
+                max_bytes=int(Config.get_env('TRANSCODE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+                quality=int(Config.get_env('TV_JPEG_QUALITY', DEFAULT_QUALITY)),
+            )
+        return _cache
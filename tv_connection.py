@@ -0,0 +1,190 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from samsungtvws import SamsungTVWS
+from config import Config
+
+logger = logging.getLogger('DynamicTV')
+
+DEFAULT_PORT = 8002
+DEFAULT_TIMEOUT = 10
+# A session used successfully this recently is trusted without a round trip
+DEFAULT_HEALTH_INTERVAL = 30
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_MAX = 30.0
+# After a failed device info lookup, callers get {} for this long before the TV is asked again
+DEVICE_INFO_RETRY = 60
+
+
+class TVConnection:
+    """State for one TV: its art-mode session plus health and backoff bookkeeping."""
+
+    def __init__(self, host):
+        self.host = host
+        self.art = None
+        self.api_version = None
+        self.device_info = None
+        self.device_info_failed_at = None
+        self.last_ok = 0.0
+        self.failures = 0
+        self.next_attempt = 0.0
+        # One websocket per TV, so requests to the same TV are serialized
+        self.lock = threading.RLock()
+
+
+class TVConnectionManager:
+    """Keeps one art-mode websocket per TV alive and shares it across requests.
+
+    Sessions are health-checked with a cheap api_version request only when they
+    have been idle for longer than health_interval. Failed connections are
+    retried with jittered exponential backoff so an offline TV fails fast
+    instead of hanging every request for the full socket timeout.
+    """
+
+    def __init__(self, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT, health_interval=DEFAULT_HEALTH_INTERVAL,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX, art_factory=None,
+                 device_info_fetcher=None):
+        self.port = port
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._art_factory = art_factory or self._create_art
+        self._device_info_fetcher = device_info_fetcher or self._fetch_device_info
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def _create_art(self, host):
+        return SamsungTVWS(host=host, port=self.port, timeout=self.timeout).art()
+
+    def _fetch_device_info(self, host):
+        return SamsungTVWS(host=host, port=self.port, timeout=self.timeout).rest_device_info().get('device', {})
+
+    def _get(self, host):
+        with self._lock:
+            conn = self._connections.get(host)
+            if conn is None:
+                conn = TVConnection(host)
+                self._connections[host] = conn
+            return conn
+
+    @contextmanager
+    def session(self, host, force=False):
+        """Yields a connected art-mode client for the TV at host.
+
+        Args:
+            host (str): The IP address of the TV.
+            force (bool): Attempt a connection even while the TV is in backoff.
+
+        Raises:
+            ConnectionError: If the TV cannot be reached.
+        """
+        if not host or not isinstance(host, str):
+            raise ValueError("TV IP address is required")
+
+        conn = self._get(host)
+        with conn.lock:
+            self._ensure_connected(conn, force)
+            try:
+                yield conn.art
+            except Exception:
+                # The websocket may be half-way through a request; never reuse it
+                self._drop(conn)
+                raise
+            conn.last_ok = time.monotonic()
+
+    def check(self, host):
+        """Verifies the TV answers on its art channel. Returns the art API version."""
+        with self.session(host, force=True):
+            return self._get(host).api_version
+
+    def device_info(self, host):
+        """Returns the TV's REST device info (modelName, resolution, ...), cached per TV.
+
+        A failed lookup is remembered for DEVICE_INFO_RETRY seconds, so an offline
+        TV is not asked again, and waited on for the full timeout, on every call.
+        """
+        conn = self._get(host)
+        if conn.device_info is None:
+            failed_at = conn.device_info_failed_at
+            if failed_at is not None and time.monotonic() - failed_at < DEVICE_INFO_RETRY:
+                return {}
+            try:
+                conn.device_info = self._device_info_fetcher(host)
+            except Exception as e:
+                conn.device_info_failed_at = time.monotonic()
+                logger.warning(f"Could not read device info from TV at {host}: {str(e)}")
+                return {}
+        return conn.device_info
+
+    def _ensure_connected(self, conn, force):
+        now = time.monotonic()
+        if conn.art is not None:
+            if now - conn.last_ok < self.health_interval:
+                return
+            try:
+                conn.api_version = conn.art.get_api_version()
+                conn.last_ok = time.monotonic()
+                return
+            except Exception as e:
+                logger.warning(f"TV session to {conn.host} failed health check, reconnecting: {str(e)}")
+                self._drop(conn)
+
+        if not force and now < conn.next_attempt:
+            raise ConnectionError(
+                f"TV at {conn.host} is unreachable, retrying in {conn.next_attempt - now:.1f}s"
+            )
+
+        try:
+            logger.info(f"Opening art-mode session to TV at {conn.host}...")
+            art = self._art_factory(conn.host)
+            art.open()
+            conn.api_version = art.get_api_version()
+        except Exception as e:
+            conn.failures += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (conn.failures - 1))
+            conn.next_attempt = time.monotonic() + delay * random.uniform(0.5, 1.0)
+            raise ConnectionError(f"Failed to connect to TV at {conn.host}: {str(e)}")
+
+        conn.art = art
+        conn.failures = 0
+        conn.next_attempt = 0.0
+        conn.last_ok = time.monotonic()
+        logger.info(f"Connected to TV at {conn.host}. API Version: {conn.api_version}")
+
+    def _drop(self, conn):
+        if conn.art is not None:
+            try:
+                conn.art.close()
+            except Exception:
+                pass
+        conn.art = None
+        conn.last_ok = 0.0
+
+    def close(self, host=None):
+        with self._lock:
+            if host:
+                connections = [self._connections[host]] if host in self._connections else []
+            else:
+                connections = list(self._connections.values())
+        for conn in connections:
+            with conn.lock:
+                self._drop(conn)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_connection_manager():
+    """Returns the process-wide TV connection manager."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = TVConnectionManager(
+                port=int(Config.get_env('TV_PORT', DEFAULT_PORT)),
+                timeout=float(Config.get_env('TV_TIMEOUT', DEFAULT_TIMEOUT)),
+            )
+        return _manager
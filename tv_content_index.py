@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger('DynamicTV')
+
+
+class TVContentIndex:
+    """Remembers which payloads each TV already holds, keyed by content hash.
+
+    Maps tv_ip -> SHA-256 of the uploaded payload -> the content id the TV
+    returned from art.upload(), with the payload size and when it was last
+    shown. Entries are reconciled against the TV's own art list, so images
+    deleted on the TV are uploaded again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._tvs = {}
+        try:
+            with open(path, 'r') as f:
+                self._tvs = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def lookup(self, tv_ip, content_hash):
+        with self._lock:
+            entry = self._tvs.get(tv_ip, {}).get(content_hash)
+            return entry['content_id'] if entry else None
+
+    def record(self, tv_ip, content_hash, content_id, size=0):
+        now = time.time()
+        with self._lock:
+            self._tvs.setdefault(tv_ip, {})[content_hash] = {
+                'content_id': content_id,
+                'uploaded': now,
+                'shown': now,
+                'size': size,
+            }
+            self._save()
+
+    def mark_shown(self, tv_ip, content_hash):
+        with self._lock:
+            entry = self._tvs.get(tv_ip, {}).get(content_hash)
+            if entry:
+                entry['shown'] = time.time()
+                self._save()
+
+    def usage(self, tv_ip):
+        """{'items', 'bytes'} uploaded to the TV by this app and still on it."""
+        with self._lock:
+            entries = list(self._tvs.get(tv_ip, {}).values())
+        return {'items': len(entries), 'bytes': sum(entry.get('size', 0) for entry in entries)}
+
+    def evictable(self, tv_ip, max_items, max_bytes):
+        """Content ids to delete, least recently shown first, so the rest fit max_items and max_bytes.
+
+        A limit of 0 is no limit. The most recently shown image is never returned.
+        """
+        with self._lock:
+            entries = sorted(self._tvs.get(tv_ip, {}).values(),
+                             key=lambda entry: entry.get('shown', entry['uploaded']))
+        items, total = len(entries), sum(entry.get('size', 0) for entry in entries)
+        victims = []
+        for entry in entries[:-1]:
+            if (not max_items or items <= max_items) and (not max_bytes or total <= max_bytes):
+                break
+            victims.append(entry['content_id'])
+            items -= 1
+            total -= entry.get('size', 0)
+        return victims
+
+    def forget(self, tv_ip, content_ids):
+        """Drops the entries for content_ids, e.g. after they were deleted from the TV."""
+        content_ids = set(content_ids)
+        with self._lock:
+            entries = self._tvs.get(tv_ip, {})
+            removed = [h for h, entry in entries.items() if entry['content_id'] in content_ids]
+            for content_hash in removed:
+                del entries[content_hash]
+            if removed:
+                self._save()
+        return len(removed)
+
+    def reconcile(self, tv_ip, available_ids):
+        """Drops entries for content the TV no longer lists. Returns the number dropped."""
+        available_ids = set(available_ids)
+        with self._lock:
+            entries = self._tvs.get(tv_ip, {})
+            stale = [h for h, entry in entries.items() if entry['content_id'] not in available_ids]
+            for content_hash in stale:
+                del entries[content_hash]
+            if stale:
+                self._save()
+        if stale:
+            logger.info(f"Dropped {len(stale)} images no longer present on TV {tv_ip}")
+        return len(stale)
+
+    def _save(self):
+        # Caller holds the lock
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._tvs, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist TV content index: {str(e)}")
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_content_index():
+    """Returns the shared TV content index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = TVContentIndex(os.path.join(Config.get_cache_folder('tv'), 'content_index.json'))
+        return _index
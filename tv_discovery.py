@@ -0,0 +1,232 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+import threading
+import time
+from config import Config
+from rate_limiter import SingleFlight
+from tv_connection import get_connection_manager
+
+logger = logging.getLogger('DynamicTV')
+
+SSDP_ADDRESS = ('239.255.255.250', 1900)
+# Samsung TVs answer the first; the DIAL target also finds models that only advertise casting
+SSDP_SEARCH_TARGETS = ('urn:samsung.com:device:RemoteControlReceiver:1', 'urn:dial-multiscreen-org:service:dial:1')
+DEFAULT_SSDP_WAIT = 1.0
+DEFAULT_PROBE_TIMEOUT = 0.5
+DEFAULT_CONCURRENCY = 256
+DEFAULT_CACHE_TTL = 300
+# Larger subnets would take more than a couple of seconds to probe
+MAX_SUBNET_HOSTS = 1024
+
+
+def local_subnet():
+    """The /24 around this machine's LAN address, or None when there is no network."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            # Connecting a UDP socket sends nothing; it only picks the outgoing interface
+            sock.connect(('10.255.255.255', 1))
+            address = sock.getsockname()[0]
+    except OSError:
+        return None
+    if address.startswith('127.'):
+        return None
+    return ipaddress.ip_network(f"{address}/24", strict=False)
+
+
+def subnet_hosts(subnet):
+    """The host addresses of subnet (a CIDR string or network). Raises ValueError if it is too large."""
+    network = ipaddress.ip_network(subnet, strict=False)
+    if network.num_addresses > MAX_SUBNET_HOSTS + 2:
+        raise ValueError(f"Subnet {network} has more than {MAX_SUBNET_HOSTS} hosts")
+    hosts = list(network.hosts()) or [network.network_address]
+    return [str(host) for host in hosts]
+
+
+def port_open(host, port, timeout=DEFAULT_PROBE_TIMEOUT):
+    """True if something accepts TCP connections on host:port within timeout."""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def ssdp_request(search_target, address=SSDP_ADDRESS, wait=DEFAULT_SSDP_WAIT):
+    return (
+        'M-SEARCH * HTTP/1.1\r\n'
+        f'HOST: {address[0]}:{address[1]}\r\n'
+        'MAN: "ssdp:discover"\r\n'
+        f'MX: {max(1, int(wait))}\r\n'
+        f'ST: {search_target}\r\n'
+        '\r\n'
+    ).encode('latin-1')
+
+
+class _SSDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.hosts = set()
+
+    def datagram_received(self, data, addr):
+        if data.startswith(b'HTTP/1.1 200'):
+            self.hosts.add(addr[0])
+
+
+async def ssdp_search(address=SSDP_ADDRESS, wait=DEFAULT_SSDP_WAIT):
+    """Multicasts an SSDP M-SEARCH and returns the addresses that answered within wait seconds."""
+    loop = asyncio.get_running_loop()
+    try:
+        transport, protocol = await loop.create_datagram_endpoint(
+            _SSDPProtocol, local_addr=('0.0.0.0', 0), family=socket.AF_INET)
+    except OSError as e:
+        logger.warning(f"SSDP search unavailable: {str(e)}")
+        return set()
+    try:
+        transport.get_extra_info('socket').setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        for target in SSDP_SEARCH_TARGETS:
+            transport.sendto(ssdp_request(target, address, wait), address)
+        await asyncio.sleep(wait)
+    except OSError as e:
+        logger.warning(f"SSDP search failed: {str(e)}")
+    finally:
+        transport.close()
+    return protocol.hosts
+
+
+async def probe_port(host, port, timeout=DEFAULT_PROBE_TIMEOUT):
+    """Async port_open()."""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+async def scan_hosts(hosts, port, timeout=DEFAULT_PROBE_TIMEOUT, concurrency=DEFAULT_CONCURRENCY):
+    """Probes port on every host at once, at most concurrency at a time. Returns the hosts that answered."""
+    limit = asyncio.Semaphore(concurrency)
+
+    async def probe(host):
+        async with limit:
+            return await probe_port(host, port, timeout)
+
+    results = await asyncio.gather(*(probe(host) for host in hosts))
+    return [host for host, is_open in zip(hosts, results) if is_open]
+
+
+class TVDiscovery:
+    """Finds Samsung TVs on the local network.
+
+    An SSDP search and a concurrent probe of the TV port across the subnet
+    run side by side, so a scan takes about as long as the slower of the
+    SSDP wait and one probe timeout. Every host found is asked for its
+    device info (model, resolution) and Frame TVs for their art-mode API
+    version. Results are kept for ttl seconds; concurrent scans share one.
+    """
+
+    def __init__(self, manager=None, subnet=None, ttl=DEFAULT_CACHE_TTL, ssdp_address=SSDP_ADDRESS,
+                 ssdp_wait=DEFAULT_SSDP_WAIT, probe_timeout=DEFAULT_PROBE_TIMEOUT,
+                 concurrency=DEFAULT_CONCURRENCY, clock=time.time):
+        self.manager = manager or get_connection_manager()
+        self.subnet = subnet
+        self.ttl = ttl
+        self.ssdp_address = ssdp_address
+        self.ssdp_wait = ssdp_wait
+        self.probe_timeout = probe_timeout
+        self.concurrency = concurrency
+        self.clock = clock
+        self._result = None
+        self._flights = SingleFlight()
+
+    @property
+    def port(self):
+        return self.manager.port
+
+    def _cached(self):
+        if self._result is not None and self.clock() - self._result['scannedAt'] < self.ttl:
+            return {**self._result, 'cached': True}
+        return None
+
+    def discover(self, refresh=False):
+        """Returns {'tvs', 'scannedAt', 'seconds', 'cached'}, scanning unless a fresh result is cached."""
+        cached = None if refresh else self._cached()
+        if cached:
+            return cached
+        result, _ = self._flights.do('scan', lambda: asyncio.run(self._scan()))
+        return result
+
+    async def discover_async(self, refresh=False):
+        """discover() for callers already on an event loop."""
+        cached = None if refresh else self._cached()
+        if cached:
+            return cached
+        result, _ = await self._flights.do_async('scan', self._scan)
+        return result
+
+    async def _scan(self):
+        started = time.monotonic()
+        subnet = self.subnet or local_subnet()
+        hosts = subnet_hosts(subnet) if subnet else []
+        logger.info(f"Discovering TVs: SSDP plus port {self.port} on {len(hosts)} hosts"
+                    + (f" in {subnet}" if subnet else ""))
+
+        ssdp_hosts, open_hosts = await asyncio.gather(
+            ssdp_search(self.ssdp_address, self.ssdp_wait),
+            scan_hosts(hosts, self.port, self.probe_timeout, self.concurrency),
+        )
+        # SSDP also answers for other media devices; only hosts with the TV port open are kept
+        confirmed = await scan_hosts(sorted(ssdp_hosts - set(open_hosts)), self.port, self.probe_timeout,
+                                     self.concurrency)
+        sources = {**{host: 'scan' for host in open_hosts}, **{host: 'ssdp' for host in ssdp_hosts}}
+
+        loop = asyncio.get_running_loop()
+        described = await asyncio.gather(*(loop.run_in_executor(None, self._describe, host, sources[host])
+                                           for host in open_hosts + confirmed))
+        tvs = sorted((tv for tv in described if tv), key=lambda tv: ipaddress.ip_address(tv['ip']))
+
+        seconds = round(time.monotonic() - started, 3)
+        logger.info(f"Found {len(tvs)} TVs in {seconds:.2f}s")
+        self._result = {'tvs': tvs, 'scannedAt': self.clock(), 'seconds': seconds, 'cached': False}
+        return self._result
+
+    def _describe(self, host, source):
+        """Device details of the TV at host, or None if it is not a Samsung TV."""
+        info = self.manager.device_info(host)
+        if not info.get('modelName'):
+            return None
+        frame_tv = str(info.get('FrameTVSupport', '')).lower() == 'true'
+        api_version = None
+        if frame_tv:
+            try:
+                api_version = self.manager.check(host)
+            except Exception as e:
+                logger.warning(f"TV at {host} did not answer on its art channel: {str(e)}")
+        return {
+            'ip': host,
+            'name': info.get('name'),
+            'model': info.get('modelName'),
+            'resolution': info.get('resolution'),
+            'frameTV': frame_tv,
+            'artApiVersion': api_version,
+            'source': source,
+        }
+
+
+_discovery = None
+_discovery_lock = threading.Lock()
+
+
+def get_tv_discovery():
+    """Returns the process-wide TV discovery service configured from the environment."""
+    global _discovery
+    with _discovery_lock:
+        if _discovery is None:
+            _discovery = TVDiscovery(
+                subnet=Config.get_env('DISCOVERY_SUBNET') or None,
+                ttl=float(Config.get_env('DISCOVERY_CACHE_TTL', DEFAULT_CACHE_TTL)),
+                ssdp_wait=float(Config.get_env('DISCOVERY_SSDP_WAIT', DEFAULT_SSDP_WAIT)),
+                probe_timeout=float(Config.get_env('DISCOVERY_PROBE_TIMEOUT', DEFAULT_PROBE_TIMEOUT)),
+            )
+        return _discovery
@@ -1,6 +1,49 @@
-import os
-import time
-from samsungtvws import SamsungTVWS
+import hashlib
+import logging
+import threading
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from config import Config
+from telemetry import span
+from transcoder import get_transcode_cache, panel_resolution
+from tv_connection import get_connection_manager
+from tv_content_index import get_content_index
+from tv_storage import get_tv_storage, storage_cleanup_enabled
+from upload_monitor import DEFAULT_UPLOAD_TIMEOUT, get_processing_times, wait_for_upload
+
+logger = logging.getLogger('DynamicTV')
+
+_memory_lock = threading.Lock()
+
+
+@contextmanager
+def track_peak_memory():
+    """Measures the peak Python heap while the block runs, when TRACE_PUSH_MEMORY is on.
+
+    Yields a dict whose 'peakBytes' is filled in on exit, or left None.
+    tracemalloc slows every allocation in the process, so this is off by
+    default and meant for benchmark runs (benchmark.py --trace-push-memory).
+    It is also process-wide, so only one push is measured at a time; pushes
+    that start while another is being measured are not measured.
+    """
+    report = {'peakBytes': None}
+    if not Config.snapshot().flag('TRACE_PUSH_MEMORY') or not _memory_lock.acquire(blocking=False):
+        yield report
+        return
+    try:
+        # Someone else, e.g. a profiler, owns tracemalloc; leave it alone
+        if tracemalloc.is_tracing():
+            yield report
+            return
+        tracemalloc.start()
+        try:
+            yield report
+        finally:
+            report['peakBytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    finally:
+        _memory_lock.release()
+
 
 def push_image_to_tv(image_path, tv_ip):
     try:
@@ -10,61 +53,129 @@ def push_image_to_tv(image_path, tv_ip):
         if not image_path:
             raise ValueError("Image path is required")
 
-        # Test TV connection first
-        from tv_test import test_tv_connection
-        if not test_tv_connection(tv_ip):
-            raise ConnectionError("Failed to establish connection with TV. Please check the TV IP address and network connectivity.")
-
-        print(f"Initializing TV connection to {tv_ip}...")
-        tv = SamsungTVWS(host=tv_ip, port=8002)  # Added explicit port
-        
-        print("Getting art mode interface...")
-        art = tv.art()
-        
-        print("Reading image file...")
+        logger.info(f"Reading image file {image_path}")
         try:
             with open(image_path, "rb") as image_file:
                 image_data = image_file.read()
-                print(f"Image size: {len(image_data)} bytes")
-                
-                if len(image_data) == 0:
-                    raise ValueError("Image file is empty")
-                
-                print(f"Uploading image '{image_path}' to Samsung Frame TV...")
-                print("This may take a few moments...")
-                response = art.upload(
-                    image_data,
-                    file_type="JPEG",
-                    matte="flexible_polar"
-                )
-                print(f"Upload response received: {response}")
-            
-            if not response:
-                raise ValueError("No response received from TV after upload")
-            
-            print("Waiting for upload to complete...")
-            time.sleep(5)  # Allow TV processing time
-            
-            print("Attempting to select uploaded image...")
-            try:
-                selection_response = art.select_image(response)
-                print(f"Selection response: {selection_response}")
-                
-                if not selection_response:
-                    print("Warning: Image selection not confirmed by TV, but upload was successful")
-            except Exception as select_error:
-                print(f"Warning: Could not select image: {str(select_error)}")
-                print("Image was uploaded but selection failed - TV may need manual selection")
-            
-            print("Upload completed successfully!")
-            return True
-            
         except FileNotFoundError:
             raise ValueError(f"Image file not found: {image_path}")
         except IOError as e:
             raise ValueError(f"Error reading image file: {str(e)}")
-            
+
     except Exception as e:
         error_message = f"TV upload failed: {str(e)}"
-        print(error_message)  # Log the error for debugging
-        raise Exception(error_message)
\ No newline at end of file
+        logger.error(error_message)
+        raise Exception(error_message)
+
+    return push_image_data_to_tv(image_data, tv_ip, image_path)
+
+
+def push_image_data_to_tv(image_data, tv_ip, label='image'):
+    """Pushes in-memory image data to the TV and shows it.
+
+    Args:
+        image_data: bytes, or any buffer such as the memoryview returned by
+            image_fetcher.fetch_image_data; it is handed on without copying.
+        tv_ip (str): Address of the Frame TV.
+        label (str): Name used in log messages, e.g. the source path or URL.
+
+    Returns:
+        dict: {'contentId', 'uploaded', 'peakMemoryBytes'}
+    """
+    try:
+        with span('push', tvIp=tv_ip), track_peak_memory() as memory:
+            result = _push(image_data, tv_ip, label)
+        result['peakMemoryBytes'] = memory['peakBytes']
+        if memory['peakBytes'] is not None:
+            logger.info(f"Peak memory during push: {memory['peakBytes'] / (1024 * 1024):.1f} MB")
+        return result
+
+    except Exception as e:
+        error_message = f"TV upload failed: {str(e)}"
+        logger.error(error_message)
+        raise Exception(error_message)
+
+
+def _push(image_data, tv_ip, label):
+    if not tv_ip:
+        raise ValueError("TV IP address is required")
+
+    logger.info(f"Image size: {len(image_data)} bytes")
+
+    if len(image_data) == 0:
+        raise ValueError("Image file is empty")
+
+    manager = get_connection_manager()
+    device_info = manager.device_info(tv_ip)
+    model = device_info.get('modelName', 'unknown')
+    processing_times = get_processing_times()
+
+    # Send a JPEG at the panel's native resolution; repeats come straight from the cache
+    resolution = panel_resolution(device_info)
+    image_data = get_transcode_cache().transcode(image_data, resolution)
+    logger.info(f"Transcoded payload for {resolution[0]}x{resolution[1]} panel: {len(image_data)} bytes")
+
+    # The shared session is health-checked on checkout, so no separate connection test is needed
+    logger.info(f"Getting art mode session for {tv_ip}")
+    content_hash = hashlib.sha256(image_data).hexdigest()
+    content_index = get_content_index()
+    with ExitStack() as stack:
+        with span('connect', tvIp=tv_ip):
+            art = stack.enter_context(manager.session(tv_ip))
+        # Skip the upload when this exact payload is still on the TV from an earlier push
+        content_id = content_index.lookup(tv_ip, content_hash)
+        if content_id:
+            available_ids = {item.get('content_id') for item in art.available()}
+            content_index.reconcile(tv_ip, available_ids)
+            if content_id not in available_ids:
+                content_id = None
+
+        uploaded = content_id is None
+        if uploaded:
+            with span('upload', tvIp=tv_ip, model=model):
+                logger.info(f"Uploading image '{label}' to Samsung Frame TV")
+                content_id = art.upload(
+                    image_data,
+                    file_type="JPEG",
+                    matte="flexible_polar"
+                )
+                logger.info(f"Upload response received: {content_id}")
+
+                if not content_id:
+                    raise ValueError("No response received from TV after upload")
+                content_index.record(tv_ip, content_hash, content_id, len(image_data))
+
+                logger.info("Waiting for upload to complete")
+                try:
+                    processing_time = wait_for_upload(
+                        art,
+                        content_id,
+                        timeout=Config.snapshot().number('TV_UPLOAD_TIMEOUT', DEFAULT_UPLOAD_TIMEOUT),
+                        expected=processing_times.estimate(model)
+                    )
+                    processing_times.record(model, processing_time)
+                    logger.info(f"TV ({model}) finished processing upload in {processing_time:.2f}s")
+                except TimeoutError as wait_error:
+                    logger.warning(f"{str(wait_error)}, attempting selection anyway")
+        else:
+            logger.info(f"Image already on TV as {content_id}, skipping upload")
+
+        logger.info("Attempting to select uploaded image")
+        try:
+            with span('select', tvIp=tv_ip):
+                selection_response = art.select_image(content_id)
+            logger.info(f"Selection response: {selection_response}")
+
+            if not selection_response:
+                logger.warning("Image selection not confirmed by TV, but upload was successful")
+            content_index.mark_shown(tv_ip, content_hash)
+        except Exception as select_error:
+            logger.warning(f"Could not select image: {str(select_error)}")
+            logger.warning("Image was uploaded but selection failed - TV may need manual selection")
+
+    # Old uploads are deleted in the background once this push has released the TV
+    if uploaded and storage_cleanup_enabled():
+        get_tv_storage().schedule(tv_ip)
+
+    logger.info("Upload completed successfully!" if uploaded else "Selection completed successfully!")
+    return {'contentId': content_id, 'uploaded': uploaded}
\ No newline at end of file
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from config import Config
+from tv_connection import get_connection_manager
+from tv_content_index import get_content_index
+
+logger = logging.getLogger('DynamicTV')
+
+# Uploads kept per TV; 0 is no limit
+DEFAULT_MAX_ITEMS = 50
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+# Content ids per delete_image_list request; the TV's lock is released between batches
+DELETE_BATCH_SIZE = 20
+# Seconds after a push before its TV is cleaned up, so pushes in quick succession share one pass
+DEFAULT_DELAY = 10.0
+RETRY_DELAY = 300.0
+
+
+class TVStorageManager:
+    """Keeps the art this app uploaded to each TV within a count and byte budget.
+
+    After a push, schedule() queues its TV for cleanup on a background
+    thread, so pushes never wait for it. Cleanup deletes the least recently
+    shown uploads beyond max_items or max_bytes, in batches with the art
+    API's multi-delete. The image on screen and anything not uploaded by
+    this app are never deleted.
+    """
+
+    def __init__(self, index=None, manager=None, max_items=DEFAULT_MAX_ITEMS, max_bytes=DEFAULT_MAX_BYTES,
+                 batch_size=DELETE_BATCH_SIZE, delay=DEFAULT_DELAY, clock=time.monotonic):
+        self.index = index or get_content_index()
+        self.manager = manager or get_connection_manager()
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.delay = delay
+        self.clock = clock
+        self.deleted = {}
+        self._due = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def schedule(self, tv_ip, delay=None):
+        """Queues a cleanup of tv_ip delay seconds from now (default: the manager's delay)."""
+        due = self.clock() + (self.delay if delay is None else delay)
+        with self._cond:
+            self._due[tv_ip] = min(due, self._due.get(tv_ip, due))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='tv-storage', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def collect(self, tv_ip):
+        """Deletes uploads from tv_ip until it is within budget. Returns the number deleted."""
+        deleted = 0
+        # Within budget needs no connection to the TV
+        while self.index.evictable(tv_ip, self.max_items, self.max_bytes):
+            # Holding the TV's session keeps pushes from changing what is on screen mid-batch
+            with self.manager.session(tv_ip) as art:
+                batch = self.index.evictable(tv_ip, self.max_items, self.max_bytes)[:self.batch_size]
+                if not batch:
+                    break
+                if art.delete_list(batch):
+                    confirmed = batch
+                else:
+                    # Some ids were already gone or refused; the TV's own list says which are deleted
+                    available = {item.get('content_id') for item in art.available()}
+                    confirmed = [content_id for content_id in batch if content_id not in available]
+            self.index.forget(tv_ip, confirmed)
+            deleted += len(confirmed)
+            if len(confirmed) < len(batch):
+                logger.warning(f"TV {tv_ip} kept {len(batch) - len(confirmed)} images it was asked to delete")
+                break
+
+        if deleted:
+            with self._cond:
+                self.deleted[tv_ip] = self.deleted.get(tv_ip, 0) + deleted
+            usage = self.index.usage(tv_ip)
+            logger.info(f"Deleted {deleted} old images from TV {tv_ip}; "
+                        f"{usage['items']} images ({usage['bytes'] / (1024 * 1024):.1f} MB) remain")
+        return deleted
+
+    def status(self, tv_ip):
+        usage = self.index.usage(tv_ip)
+        with self._cond:
+            deleted = self.deleted.get(tv_ip, 0)
+            pending = tv_ip in self._due
+        return {**usage, 'maxItems': self.max_items, 'maxBytes': self.max_bytes,
+                'deleted': deleted, 'cleanupPending': pending}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = self.clock()
+                    ready = [tv_ip for tv_ip, due in self._due.items() if due <= now]
+                    if ready:
+                        break
+                    timeout = min(self._due.values()) - now if self._due else None
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                tv_ip = ready[0]
+                del self._due[tv_ip]
+
+            try:
+                self.collect(tv_ip)
+            except Exception as e:
+                logger.warning(f"Cleaning up TV {tv_ip} failed, retrying in {RETRY_DELAY:.0f}s: {str(e)}")
+                with self._cond:
+                    self._due.setdefault(tv_ip, self.clock() + RETRY_DELAY)
+
+
+def storage_cleanup_enabled():
+    return Config.snapshot().flag('TV_STORAGE_CLEANUP_ENABLED', True)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_tv_storage():
+    """Returns the process-wide TV storage manager configured from the environment."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = TVStorageManager(
+                max_items=int(Config.get_env('TV_STORAGE_MAX_ITEMS', DEFAULT_MAX_ITEMS)),
+                max_bytes=int(Config.get_env('TV_STORAGE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+                delay=float(Config.get_env('TV_STORAGE_CLEANUP_DELAY', DEFAULT_DELAY)),
+            )
+        return _storage
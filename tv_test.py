@@ -1,5 +1,5 @@
 import logging
-from samsungtvws import SamsungTVWS
+from tv_connection import get_connection_manager
 
 def test_tv_connection(tv_ip):
     """Test the connection to a Samsung TV.
@@ -18,12 +18,9 @@ def test_tv_connection(tv_ip):
 
         logging.info(f"Attempting to connect to TV at {tv_ip}...")
         
-        # Initialize TV connection with explicit port
-        tv = SamsungTVWS(host=tv_ip, port=8002)
-        
-        # Try to get API version to test connection
+        # Reuses the shared art-mode session when one is already open
         logging.info("Testing TV connection by requesting API version...")
-        api_version = tv.art().get_api_version()
+        api_version = get_connection_manager().check(tv_ip)
         logging.info(f"Successfully connected to TV. API Version: {api_version}")
         return True
         
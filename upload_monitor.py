@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger('DynamicTV')
+
+DEFAULT_UPLOAD_TIMEOUT = 30.0
+MIN_POLL_INTERVAL = 0.1
+MAX_POLL_INTERVAL = 1.0
+# Weight given to the newest sample in the per-model moving average
+SMOOTHING = 0.3
+
+
+class ProcessingTimes:
+    """Exponentially weighted record of how long each TV model takes to process an upload."""
+
+    def __init__(self, path, smoothing=SMOOTHING):
+        self.path = path
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._times = {}
+        try:
+            with open(path, 'r') as f:
+                self._times = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def estimate(self, model):
+        with self._lock:
+            entry = self._times.get(model)
+            return entry['seconds'] if entry else None
+
+    def record(self, model, seconds):
+        with self._lock:
+            entry = self._times.get(model)
+            if entry:
+                entry['seconds'] = round(self.smoothing * seconds + (1 - self.smoothing) * entry['seconds'], 3)
+                entry['samples'] += 1
+            else:
+                self._times[model] = {'seconds': round(seconds, 3), 'samples': 1}
+            snapshot = json.dumps(self._times, indent=2)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(snapshot)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist upload processing times: {str(e)}")
+
+
+def wait_for_upload(art, content_id, timeout=DEFAULT_UPLOAD_TIMEOUT, expected=None,
+                    min_interval=MIN_POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL):
+    """Waits until the TV lists content_id as available art.
+
+    Polls the art-mode content list with a growing interval. When the model's
+    typical processing time is known (expected), most of it is slept up front
+    so slow panels are not hammered with list requests.
+
+    Args:
+        art: A connected samsungtvws art-mode client.
+        content_id (str): The id returned by art.upload().
+        timeout (float): Overall limit in seconds.
+        expected (float): Previously observed processing time for this model.
+
+    Returns:
+        float: Seconds elapsed until the content became available.
+
+    Raises:
+        TimeoutError: If the content does not show up within timeout.
+    """
+    start = time.monotonic()
+    if expected:
+        time.sleep(min(expected * 0.8, timeout))
+
+    interval = min_interval
+    while True:
+        available = art.available()
+        if any(item.get('content_id') == content_id for item in available):
+            return time.monotonic() - start
+
+        elapsed = time.monotonic() - start
+        if elapsed + interval > timeout:
+            raise TimeoutError(f"Upload {content_id} not available on TV after {elapsed:.1f}s")
+        time.sleep(interval)
+        interval = min(max_interval, interval * 1.5)
+
+
+_processing_times = None
+_processing_times_lock = threading.Lock()
+
+
+def get_processing_times():
+    """Returns the shared per-model processing time store."""
+    global _processing_times
+    with _processing_times_lock:
+        if _processing_times is None:
+            _processing_times = ProcessingTimes(
+                os.path.join(Config.get_cache_folder('tv'), 'processing_times.json')
+            )
+        return _processing_times